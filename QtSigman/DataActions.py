@@ -1,5 +1,4 @@
 from os import getcwd
-import pickle
 
 from PyQt5 import QtWidgets as QW
 from sigman import file_manager as fm
@@ -174,6 +173,9 @@ class _PickledCompositeDataWrapper:
     """Object containing all important information from 
     CompositeDataWrapper, but without any Qt signals and graphical 
     information which would make it otherwise unpickle-able.
+
+    Projects are no longer saved this way, but the class is needed to
+    load projects pickled by older versions.
     """
     def __init__(self, compositeDataWrapper):
         self.waves = {}
@@ -187,44 +189,38 @@ class _PickledCompositeDataWrapper:
                 selfDict[key] = item.copy()
 
 def loadCompositeData():
-    fileFilter = "pickle (*.pickle)"
+    fileFilter = "sigman project (*.sigman);;pickle (*.pickle)"
     fileDialog = QW.QFileDialog()
     fileDialog.setFileMode(QW.QFileDialog.ExistingFiles)
     path = fileDialog.getOpenFileName(filter = fileFilter)
     assert path[0] != ""
     if path[0] == "":
         raise ActionCancelledError
-    with open(path[0], 'rb') as pickleFile:
-        compositeData = pickle.load(pickleFile)
-        if (isinstance(compositeData, sm.Composite_data) or
-                isinstance(compositeData, QtSigman.CompositeDataWrapper) or
-                isinstance(compositeData, _PickledCompositeDataWrapper)):
-            return compositeData
-        else:
-            QW.QMessageBox.warning(None, 'Error', 'Invalid file')
+    compositeData = fm.load_composite_data(path[0])
+    if (isinstance(compositeData, sm.Composite_data) or
+            isinstance(compositeData, QtSigman.CompositeDataWrapper) or
+            isinstance(compositeData, _PickledCompositeDataWrapper)):
+        return compositeData
+    else:
+        QW.QMessageBox.warning(None, 'Error', 'Invalid file')
 
 def saveCompositeData(compositeData):
     fileDialog = QW.QFileDialog()
     fileDialog.setFileMode(QW.QFileDialog.AnyFile)
-    fileDialog.setDefaultSuffix('.pickle')
-    path = fileDialog.getSaveFileName()
+    fileDialog.setDefaultSuffix('.sigman')
+    path = fileDialog.getSaveFileName(filter="sigman project (*.sigman)")
     if path[0] == "":
         raise ActionCancelledError
-    with open(path[0], 'wb') as pickleFile:
-        pickledData = _PickledCompositeDataWrapper(compositeData)
-        pickle.dump(pickledData, pickleFile)
+    fm.save_composite_data(path[0], compositeData)
 
 def modifyWave(compositeDataWrapper):
     pr = DataActionWidgets.ProcedureDialog.getProcedure(
         'modify', compositeDataWrapper)
     waveKey, pointsDict, beginTime, endTime, procedure, arguments, status = pr
     if status is DataActionStatus.Ok:
-        originalWave = compositeDataWrapper.waves[waveKey]
-        modifiedWave = analyzer.modify_wave(originalWave, pointsDict,
-                                            beginTime, endTime, 
-                                            procedure, arguments)
-        compositeDataWrapper.waves[waveKey].replace_slice(
-            beginTime, endTime, modifiedWave)
+        analyzer.modify_wave_in_place(
+            compositeDataWrapper.waves[waveKey], pointsDict,
+            beginTime, endTime, procedure, arguments)
     else:
         raise ActionCancelledError
 
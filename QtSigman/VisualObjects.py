@@ -151,10 +151,11 @@ class VPoints(VObject):
 
         Overrides VObject.plot.
         """
+        # Indexing single points does not concatenate chunks of points
         if beginTime is None:
-            beginTime = self.data.data_x[0]
+            beginTime = self.data[0][0]
         if endTime is None:
-            endTime = self.data.data_x[-1]
+            endTime = self.data[-1][0]
         
         slice_ = self.data.data_slice(beginTime, endTime)
         if slice_ is None:
@@ -3,6 +3,7 @@ QtSigman
 ========
 PyQt5 application providing a GUI to the `sigman` library.
 """
+from contextlib import contextmanager
 from functools import partial
 import os
 import traceback
@@ -39,13 +40,20 @@ class QWave(sm.Wave, QDataObject):
         super().__init__(data.data,
                          data.sample_rate,
                          data.type,
-                         offset=data.offset)
+                         offset=data.offset,
+                         copy=False)
+        # Data is shared with the given Wave, and so is its source file
+        self._mmap_source = data._mmap_source
         QDataObject.__init__(self)
 
     def replace_slice(self, begin_time, end_time, wave):
         super().replace_slice(begin_time, end_time, wave)
         self.changed.emit()
 
+    def apply_slice(self, begin_time, end_time, function):
+        super().apply_slice(begin_time, end_time, function)
+        self.changed.emit()
+
 class QPoints(sm.Points, QDataObject):
     """Extends sm.Points to emit a self.changed Qt signal whenever any
     operation changes it.
@@ -57,37 +65,51 @@ class QPoints(sm.Points, QDataObject):
                          data.type)
         QDataObject.__init__(self)
 
+    def _emitChanged(self):
+        """Emits self.changed unless within a batch, which emits it
+        only once when it ends."""
+        if self._batch_depth == 0:
+            self.changed.emit()
+
+    @contextmanager
+    def batch(self):
+        try:
+            with super().batch():
+                yield self
+        finally:
+            self._emitChanged()
+
     def delete_slice(self, begin_time, end_time):
         super().delete_slice(begin_time, end_time)
-        self.changed.emit()
+        self._emitChanged()
 
     def replace_slice(self, begin_time, end_time, points):
         super().replace_slice(begin_time, end_time, points)
-        self.changed.emit()
+        self._emitChanged()
 
     def add_point(self, x, y):
         super().add_point(x, y)
-        self.changed.emit()
+        self._emitChanged()
 
     def add_points(self, points, begin_time=0):
         super().add_points(points, begin_time=begin_time)
-        self.changed.emit()
+        self._emitChanged()
 
     def delete_point(self, x, y=None):
         super().delete_point(x, y=y)
-        self.changed.emit()
+        self._emitChanged()
 
     def move_point(self, x1, y1, x2, y2):
         super().move_point(x1, y1, x2, y2)
-        self.changed.emit()
+        self._emitChanged()
 
     def align_to_line(self, line):
         super().align_to_line(line)
-        self.changed.emit()
+        self._emitChanged()
 
     def move_in_time(self, time):
         super().move_in_time(time)
-        self.changed.emit()
+        self._emitChanged()
 
 class QParameter(sm.Parameter, QDataObject):
     """Extends sm.Parameter to emit a self.changed Qt signal whenever
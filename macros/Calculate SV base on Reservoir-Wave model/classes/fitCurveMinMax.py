@@ -1,14 +1,22 @@
 import numpy as np
 import copy
+
+import sigman as sm
 from .calculateArea import calculateArea
 
+def _insideWave(wave, points):
+    # Beats starting at the first sample or ending at the last one are
+    # skipped, unlike with `BeatIndex.valid`
+    points_x = np.asarray(points.data_x)
+    return ((points_x[:-1] > wave.offset)
+            & (points_x[1:] < wave.offset+wave.complete_length))
+
 class fitCurveMinMax:
     def fit (AP, minAP, Volume, minVolume):
 
         Pex = AP.copy ()
         Pex.type = "MinMax Pex"
-        for i in range (0,len(Pex.data)):
-             Pex.data[i] = 0
+        Pex.data[:] = 0
         fitedCurve = Volume.copy()
         fitedCurve.type = "MinMax Pwk"
 
@@ -19,14 +27,16 @@ class fitCurveMinMax:
         else:
             length = len (minAP.data_x)-1
 
+        pressureBeats = sm.BeatIndex(AP, minAP)
+        volumeBeats = sm.BeatIndex(Volume, minVolume)
+        pressureInside = _insideWave(AP, minAP)
+        volumeInside = _insideWave(Volume, minVolume)
         for i in range (0,length):
-            #indexVolume =  int(round(minVolume.data_x[i]/ Volume.sample_length))
-             if (minAP.data_x[i+1]<(AP.complete_length+AP.offset))and (minAP.data_x[i]>AP.offset):
-                  if (minVolume.data_x[i+1]<(Volume.complete_length+Volume.offset))and (minVolume.data_x[i]>Volume.offset):
+             if pressureInside[i] and volumeInside[i]:
                     indexPressure =  int(round(minAP.data_x[i]/ AP.sample_length))
 
-                    pressure = copy.copy(AP.data_slice (minAP.data_x[i], minAP.data_x[i+1]))
-                    impedance = copy.copy(Volume.data_slice(minVolume.data_x[i],minVolume.data_x[i+1]))
+                    pressure = np.array(pressureBeats[i])
+                    impedance = np.array(volumeBeats[i])
                     if ((min (pressure)+5)<np.mean(pressure)):
                         
                         
@@ -49,10 +59,13 @@ class fitCurveMinMax:
                         fitParameter[0].append(a)
                         fitParameter[1].append(b)
 
-                        for j in range (0, len(impedanceInCycle)):
-                            fitedCurve.data[indexPressure+j] = impedanceInCycle[j] * a + b
-                        for j in range (0, len(pressure)):
-                            Pex.data[indexPressure+j] = pressure[j]- fitedCurve.data [indexPressure+j]
+                        fitedRange = slice(indexPressure,
+                                           indexPressure+len(impedanceInCycle))
+                        fitedCurve.data[fitedRange] = impedanceInCycle*a + b
+                        pressureRange = slice(indexPressure,
+                                              indexPressure+len(pressure))
+                        Pex.data[pressureRange] = (
+                            pressure - fitedCurve.data[pressureRange])
 
                         SV = calculateArea.calculate (Pex.data[(indexPressure+3):(indexPressure+len(pressure))],AP.sample_length)
                         estimateSV.append (SV)
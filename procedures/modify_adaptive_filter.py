@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from scipy.signal import butter, filtfilt
 import numpy as np
 import statistics
@@ -28,33 +30,30 @@ default_arguments = {'u':'0.05'}
 required_points = ['R']
 
 def referenceSignal (signalLength, sampleNumber):
-    H = int(np.floor(signalLength/2)-1)
-    p = np.sqrt (H)
-    x = np.matrix(np.zeros(H*2))
-    for i in range (1,H*2+1):
-        if (np.mod(i,2)== 0):
-            x[0,i-1] = (1/p)*np.cos(2*3.14*((i-1)*sampleNumber/signalLength))
-        else:
-            x[0,i-1] = (1/p)*np.sin(2*3.14*((i)*sampleNumber/signalLength))
-    return x
-
-def weighterWector (X,a):
-    P = a*X.T
-    R = X*X.T
-    W = P/R
-    return W.T
-
-def maxMatrixLength (Rx):
-    maxDifrence = 0
-    pom = 0;
-    for i in range (1,len(Rx)):
-        dt = Rx[i]-Rx[i-1]
-        if (dt>maxDifrence):
-            maxDifrence = dt
-            pom = i
-    return maxDifrence
+    """Returns the harmonic reference vector of a sample of a cardiac
+    cycle, i.e. a row of `referenceTable`."""
+    return referenceTable(signalLength)[sampleNumber-1]
 
+@lru_cache(maxsize=256)
+def referenceTable (signalLength):
+    """Returns a table of harmonic reference vectors of all samples of
+    a cardiac cycle with a given length, one row per sample.
 
+    Tables are cached, as cardiac cycles often have the same length.
+    """
+    H = int(np.floor(signalLength/2)-1)
+    p = np.sqrt (H)
+    sampleNumber = np.arange(1, signalLength+1)[:,np.newaxis]
+    # Odd elements are sines and even elements cosines of the same
+    # odd harmonics
+    harmonic = np.repeat(np.arange(1, 2*H, 2), 2)
+    table = np.empty((signalLength, 2*H))
+    table[:,0::2] = (1/p)*np.sin(2*3.14*(harmonic[0::2]*sampleNumber
+                                         /signalLength))
+    table[:,1::2] = (1/p)*np.cos(2*3.14*(harmonic[1::2]*sampleNumber
+                                         /signalLength))
+    table.flags.writeable = False
+    return table
 
 def procedure(wave, points, begin_time, end_time, arguments):
     u = arguments['u']
@@ -62,52 +61,44 @@ def procedure(wave, points, begin_time, end_time, arguments):
     data = wave.data_slice(begin_time, end_time)
     SR = np.floor(wave.sample_rate)
     N = int((R.data_x[1]-begin_time)*SR)
-    
-    #maxLength = int(np.floor(maxMatrixLength (R.data_x)*wave.sample_rate))+1
-    #maxH = int(np.floor(maxLength/2)-1)
-    X = []
-    W = []
-   
-    #for i in range (1,maxLength):
-     #   x = referenceSignal (maxLength, i)
-      #  X.append(x)
+
     result = np.array(np.zeros(len(data)))
     result[0:N] = data[0:N]
-  
-    for j in range (0,(len(R.data_x)-1)):
-        a = data[int(( R.data_x[j]*SR)):int(np.floor(R.data_x[j+1]*SR))]
-
-        H = int(np.floor(len(a)/2)-1)   
-        
-        for i in range(0,len(a)):
-            
-            if (i >= len (W)):
-                x = referenceSignal (len(a), i+1)
-                X.append(x)
-                #nw = np.matrix(np.zeros(maxH*2))
-                #nw = weighterWector (xp,a[i]) 
-                
-                #nw [0,0:(2*H)]=w
-                w = weighterWector (x,a[i])
-                W.append(w)
-            else:
-                xp = X[i]
-                x = xp[0,0:(2*H)]
-                wp = W[i]
-                w = wp[0,0:(2*H)]
-
-            
-            if (N  >= len(data)):
-                 break
-            result[N] = x*w.T
-           
-            errorEstimate = a[i] - result[N]
-            
-            newW = W[i]
-            newW[0,0:(2*H)]= w + ((2*u*errorEstimate)*x)
-            W[i] = newW 
-            N = N + 1
-        
+
+    cycles = [data[int(( R.data_x[j]*SR)):int(np.floor(R.data_x[j+1]*SR))]
+              for j in range (0,(len(R.data_x)-1))]
+    maxLength = max([len(a) for a in cycles] + [0])
+    maxWidth = max([2*int(np.floor(len(a)/2)-1) for a in cycles] + [0])
+    # Reference vectors X and weight vectors W of every sample of the
+    # cardiac cycle, zero-padded to the same length. Reference vectors
+    # are those of the first cycle long enough to reach the sample.
+    X = np.zeros((maxLength, maxWidth))
+    W = np.zeros((maxLength, maxWidth))
+    sampleCount = 0
+
+    for a in cycles:
+        if (N  >= len(data)):
+            break
+        width = 2*int(np.floor(len(a)/2)-1)
+        if len(a) > sampleCount:
+            x = referenceTable(len(a))[sampleCount:len(a)]
+            X[sampleCount:len(a),:width] = x
+            W[sampleCount:len(a),:width] = (
+                a[sampleCount:,np.newaxis]*x
+                / np.sum(x*x, axis=1)[:,np.newaxis])
+            sampleCount = len(a)
+        # The last cycle may not fit in the output
+        a = a[:len(data)-N]
+        # All samples of the cycle are filtered at once, as each of
+        # them has its own weight vector
+        x = X[:len(a),:width]
+        w = W[:len(a),:width]
+        y = np.sum(x*w, axis=1)
+        result[np.arange(N, N+len(a))] = y
+        errorEstimate = a - y
+        w += (2*u*errorEstimate)[:,np.newaxis]*x
+        N = N + len(a)
+
     result [N:len(data)] = data [N:len(data)]    
     return result
 
@@ -117,7 +108,7 @@ def interpret_arguments(wave, points, arguments):
     try:
         u = float(arguments['u'])
     except:
-        InvalidArgumentError("Invalid filter order "
+        raise InvalidArgumentError("Invalid time constant "
                                    "{}".format(arguments['u']))
  
 
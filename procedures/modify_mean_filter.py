@@ -1,9 +1,11 @@
-from scipy.signal import butter, filtfilt
 import numpy as np
+from sigman import analyzer
 from sigman.analyzer import InvalidArgumentError
 
 procedure_type = 'modify'
-description = """The procedure performs signal averaging
+description = """The procedure performs signal averaging in a window
+centered on each sample. Near the edges of the signal the window only
+contains the available samples.
 """
 author = 'mzylinski'
 arguments = {
@@ -16,9 +18,11 @@ def interpret_arguments(wave, points, arguments):
     #a
     try:
         a = int(arguments['Sample count'])
+        if a < 1:
+            raise ValueError
     except:
-        raise InvalidArgumentError("Invalid filter order "
-                                   "{}".format(arguments['Ilość próbek']))
+        raise InvalidArgumentError("Invalid sample count "
+                                   "{}".format(arguments['Sample count']))
 
     return {'Sample count':a}
 
@@ -27,19 +31,7 @@ def procedure(wave, begin_time, end_time, arguments):
     a = (arguments['Sample count'])
   
     data = wave.data_slice(begin_time, end_time)
-    mean = 0
-    for i in range(0,a):
-        mean = mean + data[i]
-        data[i] = mean / (i+1)
-    for i in range((a),len(data)-(a)-1):
-        data[i] = mean / a
-        mean = mean + data[i+1]
-        mean = mean - data[i+1-a]
-
-    for i in range(len(data)-(a)-1, len(data)):
-        data[i] = mean / (a)
-
-    return data
+    return analyzer.moving_mean(data, a, edges='shrink')
 
 def execute(wave, points,  begin_time, end_time, arguments):
     arguments = interpret_arguments(wave, points,  arguments)
@@ -1,6 +1,5 @@
-from scipy.signal import butter, filtfilt
 import numpy as np
-import statistics
+from sigman import analyzer
 from sigman.analyzer import InvalidArgumentError
 
 procedure_type = 'modify'
@@ -8,9 +7,12 @@ description = """The procedure performs median signal filtration
 """
 author = 'mzylinski'
 arguments = {
-    'Sample count':"Number of sample use to median operation (1 + Sample count *2)"
+    'Sample count':("Number of sample use to median operation "
+                    "(1 + Sample count *2)"),
+    'Mode':("standard - medians of the original signal, recursive - "
+            "windows include already filtered samples on their left")
 }
-default_arguments = {'Sample count':'1'}
+default_arguments = {'Sample count':'1', 'Mode':'standard'}
 
 
 def interpret_arguments(wave, points, arguments):
@@ -18,21 +20,25 @@ def interpret_arguments(wave, points, arguments):
     #a
     try:
         a = int(arguments['Sample count'])
+        if a < 0:
+            raise ValueError
     except:
-        raise InvalidArgumentError("Invalid filter order "
-                                   "{}".format(arguments['Ilość próbek']))
+        raise InvalidArgumentError("Invalid sample count "
+                                   "{}".format(arguments['Sample count']))
+    # Mode
+    mode = arguments.get('Mode', 'standard')
+    if mode not in ['standard', 'recursive']:
+        raise InvalidArgumentError("Invalid mode {}".format(mode))
 
-    return {'Sample count':a}
+    return {'Sample count':a, 'Mode':mode}
 
 def procedure(wave, begin_time, end_time, arguments):
     a = (arguments['Sample count'])
   
     data = wave.data_slice(begin_time, end_time)
-    for i in range((a),len(data)-(a)):
-        items = data[range (i-a,i+a+1)]
-        data[i] = statistics.median(items)
-    return data
+    return analyzer.moving_median(
+        data, a, recursive=arguments['Mode'] == 'recursive')
 
 def execute(wave, points,  begin_time, end_time, arguments):
     arguments = interpret_arguments(wave, points,  arguments)
-    return procedure(wave, begin_time, end_time, arguments)
\ No newline at end of file
+    return procedure(wave, begin_time, end_time, arguments)
@@ -21,25 +21,25 @@ def interpret_arguments(wave, points, arguments):
     try:
         a = float(arguments['a'])
     except:
-        InvalidArgumentError("Invalid filter order "
+        raise InvalidArgumentError("Invalid calibration factor "
                                    "{}".format(arguments['a']))
     #b
     try:
         b = float(arguments['b'])
     except:
-        raise InvalidArgumentError("Invalid filter order "
+        raise InvalidArgumentError("Invalid offset "
                                    "{}".format(arguments['b']))
 
     return {'a':a,
             'b':b}
 
+def elementwise(data, arguments):
+    np.multiply(data, arguments['a'], out=data)
+    np.add(data, arguments['b'], out=data)
+
 def procedure(wave, begin_time, end_time, arguments):
-    a = arguments['a']
-    b = arguments['b']
-    
-    data = wave.data_slice(begin_time, end_time)
-    for i in range(0,len(data)):
-        data[i] = a*data[i]+b
+    data = np.array(wave.data_slice(begin_time, end_time), dtype=float)
+    elementwise(data, arguments)
     return data
 
 def execute(wave, points,  begin_time, end_time, arguments):
@@ -20,6 +20,19 @@ def procedure(waves, points, begin_time, end_time, arguments):
     heart_rate = 1/average_period
     return heart_rate * 60
 
+def procedure_vectorized(waves, points, begin_times, end_times, arguments):
+    # The average period between points in a time range is the time
+    # between its first and last point divided by the number of periods
+    r_x = points['r'].data_x
+    begin_i = np.searchsorted(r_x, begin_times)
+    end_i = np.searchsorted(r_x, end_times)
+    period_counts = end_i - begin_i - 1
+    heart_rates = np.full(len(begin_times), np.nan)
+    valid = period_counts > 0
+    durations = r_x[end_i[valid]-1] - r_x[begin_i[valid]]
+    heart_rates[valid] = 60 * period_counts[valid] / durations
+    return heart_rates
+
 def execute(waves, points, begin_time, end_time, arguments):
     return procedure(waves, points, begin_time, end_time, arguments)
 
@@ -1,5 +1,7 @@
 import numpy as np
 
+import sigman as sm
+
 from sigman.analyzer import InvalidArgumentError
 
 procedure_type = 'points'
@@ -29,27 +31,17 @@ def procedure(waves, points, begin_time, end_time, settings):
     wave = waves['Signal']
     R = points['R']
     mean = points['dzmean']
- 
-
-    r_x = []
-    r_y = []
-
-    for i in range(0,len(R)-1):
-        data = wave.data_slice(R.data_x[i], R.data_x[i+1])
-        data_max = max(data);
-        
-        itemindex = np.where(data==data_max)[0]
-        prog = (data_max-mean.data_y[i])*0.15
-        while data[itemindex[0]]>prog:
-            itemindex[0] = itemindex[0]-1
-            if itemindex[0]==0:
-                break
-        r_y.append(data[itemindex[0]])
-        r_x.append(R.data_x[i] + itemindex[0]*wave.sample_length)
-
 
+    beats = sm.BeatIndex(wave, R)
+    valid = beats.valid & (beats.lengths > 0)
+    maxima = beats.max()
+    thresholds = (maxima-mean.data_y[:len(beats)])*0.15
+    # Going back from the maximum to where the signal crosses 15% of it
+    itemindex = beats.last_crossing(thresholds, beats.argmax(), begin=1,
+                                    empty=0)
+    r_y = wave.data[beats.starts+itemindex][valid]
+    r_x = (R.data_x[:-1] + itemindex*wave.sample_length)[valid]
     return r_x, r_y
-
 def interpret_arguments(waves, points, arguments):
     output_arguments = {}
     for key, item in arguments.items():
@@ -1,5 +1,7 @@
 import numpy as np
 
+import sigman as sm
+
 from sigman.analyzer import InvalidArgumentError
 
 procedure_type = 'points'
@@ -25,23 +27,14 @@ def procedure(waves, points, begin_time, end_time, settings):
     R = points['R']
     dzdtmax = points['dzdtmax']
 
-    r_x = []
-    r_y = []
-
-    for i in range(0,len(R)-1):
-        data = wave.data_slice(R.data_x[i], R.data_x[i+1])
-
-        
-        RZ = (dzdtmax.data_x[i] - R.data_x[i])/wave.sample_length
-        RB = 1.233*RZ -0.0032*(RZ*RZ)-31.59
-        
-        t = int(round(RB))
-        if (t<0):
-            t = 0
-        r_y.append(data[t])
-        r_x.append(R.data_x[i] + t*wave.sample_length)
-
-
+    beats = sm.BeatIndex(wave, R)
+    RZ = (dzdtmax.data_x[:len(beats)] - R.data_x[:-1])/wave.sample_length
+    RB = 1.233*RZ -0.0032*(RZ*RZ)-31.59
+    # B points can't be beyond the end of their beat
+    t = np.clip(np.round(RB).astype(int), 0,
+                np.maximum(beats.lengths-1, 0))
+    r_y = wave.data[beats.starts+t][beats.valid]
+    r_x = (R.data_x[:-1] + t*wave.sample_length)[beats.valid]
     return r_x, r_y
 
 def interpret_arguments(waves, points, arguments):
@@ -1,5 +1,7 @@
 import numpy as np
 
+import sigman as sm
+
 from sigman.analyzer import InvalidArgumentError
 
 procedure_type = 'points'
@@ -19,24 +21,17 @@ required_points = [ 'R']
 def procedure(waves, points, begin_time, end_time, settings):
     wave = waves['Signal']
     R = points['R']
-   
-
-    r_x = []
-    r_y = []
-
-    for i in range(0,len(R)-1):
-        data = wave.data_slice(R.data_x[i], R.data_x[i+1])
-        data_max = max(data);
-        
-        itemindex = np.where(data==data_max)[0]
-        while (data[itemindex[0]]*2)>=(data[itemindex[0]-1]+data[itemindex[0]-2]):
-            itemindex[0] = itemindex[0]-1
-            if itemindex[0]==2:
-                break
-        r_y.append(data[itemindex[0]])
-        r_x.append(R.data_x[i] + itemindex[0]*wave.sample_length)
-
 
+    beats = sm.BeatIndex(wave, R)
+    valid = beats.valid & (beats.lengths > 0)
+    maxima = beats.argmax()
+    # Going back from the maximum to the first sample at which the
+    # signal is concave
+    concave = beats.values()*2 < beats.values(-1) + beats.values(-2)
+    itemindex = beats.last_index(concave, begin=3, end=maxima,
+                                 empty=np.minimum(maxima, 2))
+    r_y = wave.data[beats.starts+itemindex][valid]
+    r_x = (R.data_x[:-1] + itemindex*wave.sample_length)[valid]
     return r_x, r_y
 
 def interpret_arguments(waves, points, arguments):
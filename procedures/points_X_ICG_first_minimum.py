@@ -1,5 +1,7 @@
 import numpy as np
 
+import sigman as sm
+
 from sigman.analyzer import InvalidArgumentError
 
 procedure_type = 'points'
@@ -21,40 +23,29 @@ required_points = ['points']
 
 
 def procedure(waves, points, begin_time, end_time, settings):
- 
-
     wave = waves['Signal']
     R = points['points']
     t = settings['Time limit [%]']/100
     IP = int(settings['Sample count'])
-    r_x = []
-    r_y = []
-
-    for i in range(0,len(R)-1):
-        data = wave.data_slice(R.data_x[i], R.data_x[i]+(R.data_x[i+1]-R.data_x[i])*t)
-
-        
-        itemindex = len(data)-IP-1
-        if (itemindex>0):
-            #Upewniam się że jestem na zboczu opadajacym
-            while (data[itemindex]<data[itemindex-1]):
-                itemindex = itemindex - 1
-                if itemindex==IP:
-                    break
-            #a nastepnie szukam minimum
-            while not ((data[itemindex+IP]>data[itemindex]) and (data[(itemindex-IP)]>data[itemindex])):
-                itemindex = itemindex-1
-                if itemindex==IP:
-                    break
-        else:
-            itemindex = 0;
-        r_y.append(data[itemindex])
-        r_x.append(R.data_x[i] + itemindex*wave.sample_length)
-
 
+    beats = sm.BeatIndex(wave, R, end_fraction=t)
+    values = beats.values()
+    itemindex = beats.lengths-IP-1
+    searched = itemindex >= IP
+    #Upewniam się że jestem na zboczu opadajacym
+    rising = values >= beats.values(-1)
+    itemindex = beats.last_index(rising, begin=IP+1, end=itemindex,
+                                 empty=IP)
+    #a nastepnie szukam minimum
+    minimum = (beats.values(IP) > values) & (beats.values(-IP) > values)
+    itemindex = beats.last_index(minimum, begin=IP, end=itemindex,
+                                 empty=IP)
+    itemindex = np.where(searched, itemindex, 0)
+    valid = beats.valid & (beats.lengths > 0)
+    r_y = wave.data[beats.starts+itemindex][valid]
+    r_x = (R.data_x[:-1] + itemindex*wave.sample_length)[valid]
     return r_x, r_y
 
-
 def interpret_arguments(waves, points, arguments):
     output_arguments = {}
     for key, item in arguments.items():
@@ -1,5 +1,7 @@
 import numpy as np
 
+import sigman as sm
+
 from sigman.analyzer import InvalidArgumentError
 
 procedure_type = 'points'
@@ -21,22 +23,12 @@ required_points = ['dzmax']
 def procedure(waves, points, begin_time, end_time, settings):
     wave = waves['Signal']
     dzmax = points['dzmax']
- 
-
-    r_x = []
-    r_y = []
-
-    for i in range(0,len(dzmax)-1):
-        if (dzmax.data_x[i+1]<(wave.complete_length+wave.offset))and (dzmax.data_x[i]>wave.offset):
-            data = wave.data_slice(dzmax.data_x[i], dzmax.data_x[i]+(dzmax.data_x[i+1]-dzmax.data_x[i])*settings['Time'])
-            data_max = min(data);
-        
-            itemindex = np.where(data==data_max)[0]
-    
-            r_y.append(data[itemindex[0]])
-            r_x.append(dzmax.data_x[i] + itemindex[0]*wave.sample_length)
-
 
+    beats = sm.BeatIndex(wave, dzmax, end_fraction=settings['Time'])
+    valid = beats.valid & (beats.lengths > 0)
+    itemindex = beats.argmin()
+    r_y = wave.data[beats.starts+itemindex][valid]
+    r_x = (dzmax.data_x[:-1] + itemindex*wave.sample_length)[valid]
     return r_x, r_y
 
 def interpret_arguments(waves, points, arguments):
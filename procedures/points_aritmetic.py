@@ -1,12 +1,19 @@
 import numpy as np
 
+from sigman import analyzer
+
 from sigman.analyzer import InvalidArgumentError
 
 procedure_type = 'points'
 description = (
 """Procedure perform basic math operation on given pare of the points (+-*/), as example:
    y[t] = a[t]+b[t]
-   Time is taken from a.
+   Time is taken from a. Points of b are paired with the closest points
+   of a within the tolerance, and points of a without a pair are
+   skipped.
+
+Operation may also be any expression of a and b, e.g. `(a - b) / b`,
+as described in `analyzer.evaluate_points_expression`.
 """)
 author = 'mzylinski'
 arguments = {
@@ -14,60 +21,48 @@ arguments = {
      "- - subtraction;" 
      "* - multiplication;"
      "/ - division;"
-     "sqr - roots a")
+     "sqr - roots a;"
+     "or an expression of a and b"),
+     'Tolerance':"maximum time between paired points of a and b [s]"
     }
 default_arguments = {
     'Operation':'+',
+    'Tolerance':'0.3',
     }
 output_type = 'Points'
-required_waves = ['']
+required_waves = []
 required_points = ['a',  'b']
 
+OPERATIONS = {
+    '+':'a + b',
+    '-':'a - b',
+    '*':'a * b',
+    '/':'a / b',
+    'sqr':'sqrt(a)'}
 
 def procedure(waves, points, begin_time, end_time, settings):
-    a = points['a']
-    b = points['b']
-    
-
-    r_x = []
-    r_y = []
-  
-    if (len(a)>= len(b)):
-        d = len (b)-1
-    else:
-        d = len (a)-1
-
-    for i in range(0,d):
-        if (settings['operacja']== '+'):
-            y = a.data_y[i]+b.data_y[i]
-        if (settings['operacja']== '-'):
-            y = a.data_y[i]-b.data_y[i]
-        if (settings['operacja']== '*'):
-            y = a.data_y[i]*b.data_y[i]
-        if (settings['operacja']== 'sqr'):
-            y = np.sqrt(a.data_y[i])
-        if (settings['operacja']== '/'):
-            if (b.data_y[i] != 0):
-                y = a.data_y[i]/b.data_y[i]
-            else:
-                y = 0
-        r_x.append(a.data_x[i])
-        r_y.append(y)
-
-
-    return r_x, r_y
-
-
+    return analyzer.evaluate_points_expression(
+        settings['Operation'], points, tolerance=settings['Tolerance'],
+        reference='a')
 
 def interpret_arguments(waves, points, arguments):
-    output_arguments = {}
-    for key, item in arguments.items():
-        if (item != '+' and item != '-' and item != '*'and item != 'sqr' and item != '/'):
-             raise InvalidArgumentError("{} is invalid.".format(arguments[key]))
-        else:
-             output_arguments[key] = item
-    return output_arguments
+    operation = OPERATIONS.get(arguments['Operation'],
+                               arguments['Operation'])
+    try:
+        tree, names = analyzer.parse_points_expression(operation)
+    except ValueError:
+        raise InvalidArgumentError("{} is invalid.".format(
+            arguments['Operation']))
+    if not set(names) <= set(required_points):
+        raise InvalidArgumentError("{} is invalid.".format(
+            arguments['Operation']))
+    tolerance = arguments.get('Tolerance', default_arguments['Tolerance'])
+    try:
+        tolerance = float(tolerance)
+    except:
+        raise InvalidArgumentError("{} is invalid.".format(tolerance))
+    return {'Operation':operation, 'Tolerance':tolerance}
 
 def execute(waves, points, begin_time, end_time, arguments):
     arguments = interpret_arguments(waves, points, arguments)
-    return procedure(waves, points, begin_time, end_time, arguments)
\ No newline at end of file
+    return procedure(waves, points, begin_time, end_time, arguments)
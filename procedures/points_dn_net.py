@@ -1,5 +1,6 @@
 from sigman import analyzer 
 import numpy as np
+import os
 import pickle
 
 from sigman.analyzer import InvalidArgumentError
@@ -14,13 +15,18 @@ It also makes use of SBP points to narrow the searching area.
 """)
 author = 'kcybulski'
 arguments = {
-    'net':"Path to the pickled neural network file",
+    'net':("Path to the neural network file, either with weights "
+           "saved by `save_network` (.npz) or a pickled network"),
     'focus_range':("Time range from an SBP point in which DNs are searched "
                    "for; two numbers separated by a comma."),
     'test_every':("Distance between points tested within focus_range. "
-                  "The less the more accurate.")}
-default_arguments = {'net':'procedures/default_dn_net.pickle',
-                     'focus_range':'0.1,0.5', 'test_every':0.005}
+                  "The less the more accurate."),
+    'batch_size':("Number of tested points analysed by the neural net "
+                  "at once. The more the faster, but the more memory "
+                  "is used.")}
+default_arguments = {'net':'procedures/default_dn_net.npz',
+                     'focus_range':'0.1,0.5', 'test_every':0.005,
+                     'batch_size':4096}
 output_type = 'dn'
 required_waves = ['bp','ecg']
 required_points = ['sbp']
@@ -33,6 +39,20 @@ class Temp_Network():
         self.w = network.w
         self.b = network.b
         self.activation = np.tanh
+
+    @classmethod
+    def fromArrays(cls, w, b, sample_length, detection_point_offset):
+        """Creates a network from lists of weight and bias arrays of
+        consecutive layers."""
+        net = cls.__new__(cls)
+        net.input_point_count = w[0].shape[0]
+        net.sample_length = sample_length
+        net.detection_point_offset = detection_point_offset
+        net.w = list(w)
+        net.b = list(b)
+        net.activation = np.tanh
+        return net
+
     def forward(self, x):
         a = x
         for i in range(len(self.w)):
@@ -40,10 +60,74 @@ class Temp_Network():
             a = self.activation(z)
         return a
 
+# Networks loaded by `load_network`, as `<absolute path>:(<mtime>, <net>)`
+_network_cache = {}
+
+def _load_npz_network(file_name):
+    with np.load(file_name, allow_pickle=False) as arrays:
+        layer_count = int(arrays['layer_count'])
+        return Temp_Network.fromArrays(
+            [arrays['w{}'.format(i)] for i in range(layer_count)],
+            [arrays['b{}'.format(i)] for i in range(layer_count)],
+            float(arrays['sample_length']),
+            float(arrays['detection_point_offset']))
+
+def _network_path(file_name):
+    """Returns the absolute path of a network file, looking relative
+    paths not found in the working directory up in
+    `analyzer.SIGMAN_ROOT`."""
+    path = os.path.abspath(file_name)
+    if not os.path.exists(path) and not os.path.isabs(file_name):
+        path = os.path.abspath(analyzer.SIGMAN_ROOT + file_name)
+    return path
+
+def load_network(file_name):
+    """Returns the neural network saved in a file.
+
+    Networks are loaded from .npz files saved with `save_network`, or
+    unpickled from any other file. Loaded networks are cached, so the
+    file is read again only if it has been modified since. Loading
+    networks beforehand allows to avoid the delay on the first search.
+
+    Relative paths which are not found in the working directory are
+    looked up in `analyzer.SIGMAN_ROOT`, like the default network.
+    """
+    path = _network_path(file_name)
+    mtime = os.stat(path).st_mtime_ns
+    cached = _network_cache.get(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    if os.path.splitext(path)[1] == '.npz':
+        net = _load_npz_network(path)
+    else:
+        with open(path, 'rb') as net_file:
+            net = pickle.load(net_file)
+    _network_cache[path] = (mtime, net)
+    return net
+
+def clear_network_cache(file_name=None):
+    """Removes a network, or all networks if `file_name` is None,
+    from the cache of `load_network`."""
+    if file_name is None:
+        _network_cache.clear()
+    else:
+        _network_cache.pop(_network_path(file_name), None)
+
+def save_network(net, file_name):
+    """Saves weights of a network to an .npz file, which unlike
+    a pickled network may be loaded safely."""
+    arrays = {'layer_count':len(net.w),
+              'sample_length':net.sample_length,
+              'detection_point_offset':net.detection_point_offset}
+    for i, (w, b) in enumerate(zip(net.w, net.b)):
+        arrays['w{}'.format(i)] = w
+        arrays['b{}'.format(i)] = b
+    np.savez(file_name, **arrays)
+
 def interpret_arguments(waves, points, arguments):
     # net
     try:
-        net = pickle.load(open(arguments['net'], 'rb'))
+        net = load_network(arguments['net'])
     except:
         raise InvalidArgumentError("Invalid neural net file")
     # focus_range
@@ -58,31 +142,66 @@ def interpret_arguments(waves, points, arguments):
         test_every = float(arguments['test_every'])
     except:
         raise InvalidArgumentError("Invalid `test_every` value")
+    try:
+        batch_size = int(arguments['batch_size'])
+    except:
+        raise InvalidArgumentError("Invalid `batch_size` value")
+    if batch_size < 1:
+        raise InvalidArgumentError("`batch_size` must be positive")
     return {
         'net':net,
         'focus_range':focus_range,
-        'test_every':test_every}
-
-def _generate_input_data_sample(bp_line, ecg_line, test_point, sample_length, 
-                               detection_point_offset, input_point_count):
-    """Generates a single set of input data to analyse with the neural net."""
-    begin_time = test_point - detection_point_offset
-    end_time = begin_time + sample_length
-    bp_data = bp_line.data_slice(begin_time, end_time, 
-                                 value_count = int(input_point_count/2))
-    ecg_data = ecg_line.data_slice(begin_time, end_time, 
-                                   value_count = int(input_point_count/2))
-    # Normalisation
-    bp_data-=np.min(bp_data)
-    bp_data/=np.max(bp_data)
-    bp_data*=2
-    bp_data-=1
-    ecg_data-=np.min(ecg_data)
-    ecg_data/=np.max(ecg_data)
-    ecg_data*=2
-    ecg_data-=1
-    input_data = np.concatenate((bp_data,ecg_data))
-    return input_data
+        'test_every':test_every,
+        'batch_size':batch_size}
+
+def _sample_windows(wave, begin_times, end_times, value_count):
+    """Returns a 2-D array with one row of `value_count` values per
+    time range, equal to `Wave.data_slice` with `value_count` set.
+    """
+    begin_i = ((begin_times-wave.offset) / wave.sample_length).astype(int)
+    end_i = ((end_times-wave.offset) / wave.sample_length).astype(int)
+    if np.any(begin_i < 0) or np.any(end_i > len(wave)):
+        raise ValueError('Sample windows are outside the range of Wave')
+    end_i = np.minimum(end_i, len(wave)-1)
+    # Wanted times are generated like with `np.arange` so that the
+    # values are exactly those of `Wave.data_slice`
+    value_every = (end_times-begin_times) / value_count
+    steps = (begin_times+value_every) - begin_times
+    wanted_times = (begin_times[:,np.newaxis]
+                    + np.arange(value_count)*steps[:,np.newaxis])
+    approx_indices = ((wanted_times-begin_times[:,np.newaxis])
+                      / wave.sample_length)
+    last_indices = (end_i-begin_i-1)[:,np.newaxis]
+    approx_indices = np.clip(approx_indices, 0, last_indices)
+    lower_indices = approx_indices.astype(int)
+    upper_indices = np.minimum(lower_indices+1, last_indices)
+    fractions = approx_indices - lower_indices
+    lower_values = wave.data[begin_i[:,np.newaxis]+lower_indices]
+    upper_values = wave.data[begin_i[:,np.newaxis]+upper_indices]
+    return lower_values + (upper_values-lower_values)*fractions
+
+def _normalize_rows(data):
+    """Scales every row of a 2-D array in place to <-1, 1>."""
+    data -= np.min(data, axis=1)[:,np.newaxis]
+    data /= np.max(data, axis=1)[:,np.newaxis]
+    data *= 2
+    data -= 1
+    return data
+
+def _generate_input_data(bp_line, ecg_line, test_points, sample_length,
+                         detection_point_offset, input_point_count):
+    """Generates a 2-D array of input data to analyse with the neural
+    net, with one row for every tested point.
+    """
+    begin_times = test_points - detection_point_offset
+    end_times = begin_times + sample_length
+    value_count = int(input_point_count/2)
+    bp_data = _sample_windows(bp_line, begin_times, end_times,
+                              value_count)
+    ecg_data = _sample_windows(ecg_line, begin_times, end_times,
+                               value_count)
+    return np.concatenate((_normalize_rows(bp_data),
+                           _normalize_rows(ecg_data)), axis=1)
 
 def procedure(waves, points, begin_time, end_time, arguments):
     ecg_line = waves['ecg']
@@ -90,6 +209,7 @@ def procedure(waves, points, begin_time, end_time, arguments):
     sbp_points = points['sbp']
     focus_range = arguments['focus_range']
     test_every = arguments['test_every']
+    batch_size = arguments['batch_size']
     net = arguments['net']
 
     sample_length = net.sample_length
@@ -97,8 +217,7 @@ def procedure(waves, points, begin_time, end_time, arguments):
     input_point_count = net.input_point_count
     
     sbp_x, sbp_y = sbp_points.data_slice(begin_time, end_time, left_offset = 1)
-    dn_x = []
-    dn_y = []
+    test_points = []
     for helper_x in sbp_x:
         if helper_x + focus_range[0] - sample_length < begin_time:
             continue
@@ -106,21 +225,34 @@ def procedure(waves, points, begin_time, end_time, arguments):
             break
         focus_begin_time = helper_x + focus_range[0]
         focus_end_time = helper_x + focus_range[1]
-        max_val = -1
-        max_x = 0
-        for test_x in np.arange(focus_begin_time, focus_end_time, test_every):
-            input_data = _generate_input_data_sample(
-                bp_line, ecg_line, test_x, 
-                sample_length, detection_point_offset, 
-                input_point_count)
-            val = net.forward(input_data)[0][0]
-            if val > max_val:
-                max_val = val
-                max_x = test_x
-        dn_x.append(max_x)
-        dn_y.append(bp_line.value_at(max_x))
-    dn_x = np.array(dn_x)
-    dn_y = np.array(dn_y)
+        test_points.append(
+            np.arange(focus_begin_time, focus_end_time, test_every))
+    if len(test_points) == 0:
+        return np.array([]), np.array([])
+    beat_begins = np.cumsum([0]+[len(tested) for tested in test_points])
+    test_points = np.concatenate(test_points)
+    # All tested points go through the net together, in batches so
+    # that the input data does not take too much memory
+    values = np.empty(len(test_points))
+    for batch_begin in range(0, len(test_points), batch_size):
+        batch = test_points[batch_begin:batch_begin+batch_size]
+        input_data = _generate_input_data(
+            bp_line, ecg_line, batch,
+            sample_length, detection_point_offset,
+            input_point_count)
+        values[batch_begin:batch_begin+len(batch)] = net.forward(
+            input_data)[:,0]
+    # The first tested point with the highest value above -1 is the
+    # notch of each beat
+    dn_x = np.zeros(len(beat_begins)-1)
+    for i, (begin_i, end_i) in enumerate(zip(beat_begins[:-1],
+                                             beat_begins[1:])):
+        if begin_i == end_i:
+            continue
+        max_i = begin_i + np.argmax(values[begin_i:end_i])
+        if values[max_i] > -1:
+            dn_x[i] = test_points[max_i]
+    dn_y = bp_line.values_at(dn_x)
     return dn_x, dn_y
 
 def execute(waves, points, begin_time, end_time, arguments):
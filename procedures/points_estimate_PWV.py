@@ -1,5 +1,7 @@
 import numpy as np
 
+from sigman import analyzer
+
 from sigman.analyzer import InvalidArgumentError
 
 procedure_type = 'points'
@@ -8,45 +10,28 @@ description = (
     PWV = L/t
     L - distance between sensors - path of the pulse wave
     t - time between points t[i] = b[i].data_x - a[i].data_x
+    Each point of a is paired with the first point of b after it
+    within the tolerance, and points of a without a pair are skipped.
 """)
 author = 'mzylinski'
 arguments = {
-     'distance':"distance between sensors - path of the pulse wave"
-    
+     'distance':"distance between sensors - path of the pulse wave",
+     'Tolerance':"maximum time between paired points of a and b [s]"
     }
 default_arguments = {
     'distance':'0.15',
+    'Tolerance':'0.3',
     }
 output_type = 'PWV'
-required_waves = ['']
+required_waves = []
 required_points = ['a',  'b']
 
-
-
-
 def procedure(waves, points, begin_time, end_time, settings):
-    a = points['a']
-    b = points['b']
-    
-
-    r_x = []
-    r_y = []
-  
-    if (len(a)>= len(b)):
-        d = len (b)-1
-    else:
-        d = len (a)-1
-
-    for i in range(0,d):
-        T = b.data_x[i]-a.data_x[i]
-        if (T!= 0):
-            y = float(settings['Odległość'])/T
-        else:
-            y = 0
-        r_x.append(a.data_x[i])
-        r_y.append(y)
-
-
+    r_x, T = analyzer.evaluate_points_expression(
+        'b.x - a.x', points, tolerance=settings['Tolerance'],
+        direction='forward', reference='a')
+    r_y = np.divide(settings['distance'], T, out=np.zeros(len(T)),
+                    where=T != 0)
     return r_x, r_y
 
 def interpret_arguments(waves, points, arguments):
@@ -60,4 +45,4 @@ def interpret_arguments(waves, points, arguments):
 
 def execute(waves, points, begin_time, end_time, arguments):
     arguments = interpret_arguments(waves, points, arguments)
-    return procedure(waves, points, begin_time, end_time, arguments)
\ No newline at end of file
+    return procedure(waves, points, begin_time, end_time, arguments)
@@ -1,5 +1,7 @@
 import numpy as np
 
+import sigman as sm
+
 from sigman.analyzer import InvalidArgumentError
 
 procedure_type = 'points'
@@ -26,19 +28,13 @@ def procedure(waves, points, begin_time, end_time, settings):
     R = points['R']
     t = settings['Time after R [%]']/100
     blank = settings['Blind spot [%]']/100
-    r_x = []
-    r_y = []
-
-    for i in range(0,len(R)-1):
-        okres= (R.data_x[i+1]-R.data_x[i])
-        data = wave.data_slice(R.data_x[i]+blank*okres, okres*t+R.data_x[i])
-        if (len(data)>0):
-            data_max = max(data);
-            itemindex = np.where(data==data_max)[0]
-            r_y.append(data_max)
-            r_x.append(R.data_x[i] + itemindex[0]*wave.sample_length+blank*okres)
-
 
+    beats = sm.BeatIndex(wave, R, begin_fraction=blank, end_fraction=t)
+    valid = beats.valid & (beats.lengths > 0)
+    itemindex = beats.argmax()
+    r_y = beats.max()[valid]
+    r_x = (R.data_x[:-1] + itemindex*wave.sample_length
+           + blank*beats.periods)[valid]
     return r_x, r_y
 
 def interpret_arguments(waves, points, arguments):
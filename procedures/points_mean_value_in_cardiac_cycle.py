@@ -1,56 +1,46 @@
 
 import numpy as np
 
+import sigman as sm
+
 from sigman.analyzer import InvalidArgumentError
 
 procedure_type = 'points'
 description = ("""Procedure calculate mean value of the signal in cardiac cycles
+
+Other statistics of the signal in cardiac cycles, like its minimum,
+maximum or area under it, may be chosen as well.
 """)
 author = 'mzylinski'
 arguments = {
+    'Statistic':"One of: mean, min, max, area"
     }
 default_arguments = {
+    'Statistic':'mean'
     }
 output_type = 'mean'
 required_waves = ['Signal']
 required_points = ['R']
 
-
-
-def mean(data):
-    sum = 0
-    if (len(data)> 0):
-        for i in range(0,len(data)):
-            sum = sum + data[i]
-
-        return sum / len(data)
-    else:
-        return 0
+_STATISTICS = ['mean', 'min', 'max', 'area']
 
 def procedure(waves, points, begin_time, end_time, settings):
     wave = waves['Signal']
     R = points['R']
 
-    r_x = []
-    r_y = []
-
-    for i in range(0,len(R) - 1):
-        if (R.data_x[i]>begin_time and R.data_x[i + 1] < end_time):
-            data = wave.data_slice(R.data_x[i], R.data_x[i + 1])
-                
-            r_y.append(mean(data))
-            r_x.append(R.data_x[i])
-
-    return r_x, r_y
+    beats = sm.BeatIndex(wave, R)
+    values = getattr(beats, settings['Statistic'])()
+    # Empty cycles have a value of 0
+    values = np.where(beats.lengths > 0, values, 0)
+    wanted = ((R.data_x[:-1] > begin_time) & (R.data_x[1:] < end_time)
+              & beats.valid)
+    return R.data_x[:-1][wanted], values[wanted]
 
 def interpret_arguments(waves, points, arguments):
-    output_arguments = {}
-    for key, item in arguments.items():
-        try:
-            output_arguments[key] = float(item)
-        except:
-            raise InvalidArgumentError("{} is invalid.".format(arguments[key]))
-    return output_arguments
+    statistic = arguments.get('Statistic', 'mean')
+    if statistic not in _STATISTICS:
+        raise InvalidArgumentError("{} is invalid.".format(statistic))
+    return {'Statistic':statistic}
 
 def execute(waves, points, begin_time, end_time, arguments):
     arguments = interpret_arguments(waves, points, arguments)
@@ -1,5 +1,6 @@
 import numpy as np
 
+from sigman import analyzer
 from sigman.analyzer import InvalidArgumentError
 
 procedure_type = 'points'
@@ -35,6 +36,11 @@ def interpret_arguments(waves, points, arguments):
             raise InvalidArgumentError("{} is invalid.".format(arguments[key]))
     return output_arguments
 
+def chunk_overlap(arguments):
+    # Enough for the threshold and the average period between peaks to
+    # settle at the beginning of a chunk
+    return 3*arguments['threshold_period'] + arguments['safe_period']
+
 def procedure(waves, points, begin_time, end_time, settings):
     wave = waves['ecg']
     
@@ -42,50 +48,17 @@ def procedure(waves, points, begin_time, end_time, settings):
     data = wave.data_slice(begin_time, end_time)
     data = np.array(data)
 
-    derivative = [0] * 2
-    for i in range(2,len(data)-2):
-        derivative.append(( (1/8) * (-data[i-2]-2*data[i-1]+2*data[i+1]+data[i+2]) )**2)
-    derivative = derivative + [0] * 2
-    derivative = np.array(derivative)
-
+    derivative = analyzer.five_point_derivative(data)**2
     window_width = 0.15/sample_length # 150 ms
     half_window = int(window_width/2) 
-    integral = [0]  * half_window 
-    for i in range(half_window, len(derivative)-half_window):
-        integral.append(np.sum(derivative[i-half_window:i+half_window]))
-    integral = integral + [0] * half_window
-    integral = np.array(integral)
+    integral = analyzer.window_sum(derivative, half_window)
     
-    threshold = np.max(integral[0:int(settings['threshold_period']/sample_length)]) * settings['threshold_fraction']
-    r_x = []
-    r_y = []
-    begin_i = 0
-    average_period = 0
-    i = 0
-    while i < len(integral):
-        if integral[i] > threshold:
-            if begin_i == 0:
-                begin_i = i
-        else:
-            if begin_i != 0: 
-                if len(r_x)==0 or i*sample_length > r_x[-1] + settings['safe_period'] - begin_time:
-                    hopeful_slice = data[begin_i:i]
-                    maximum_i = np.argmax(hopeful_slice)
-                    fin_i = begin_i + maximum_i
-                    r_x.append(begin_time+sample_length*(fin_i-1))
-                    r_y.append(data[fin_i])
-                    threshold = np.max(integral[fin_i:fin_i+int(settings['threshold_period']/sample_length)]) * settings['threshold_fraction']
-                    begin_i = 0
-                    if len(r_x) > 3:
-                        average_period = ( (r_x[-1]-r_x[-2]) + (r_x[-2]-r_x[-3]) + (r_x[-3]-r_x[-4]) ) / 3
-                    continue
-                else:
-                    begin_i = 0
-            if average_period!=0 and i*sample_length > r_x[-1] + average_period*1.7:
-                threshold *= 0.6
-                i = int((r_x[-1]+settings['safe_period'])/sample_length)
-        i += 1
-    r_x = np.array(r_x)
+    r_indices = analyzer.find_threshold_peaks(
+        integral, data, sample_length,
+        settings['threshold_fraction'], settings['threshold_period'],
+        settings['safe_period'])
+    r_x = begin_time + sample_length*(r_indices-1)
+    r_y = data[r_indices]
     return r_x, r_y
 
 def execute(waves, points, begin_time, end_time, arguments):
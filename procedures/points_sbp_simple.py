@@ -36,6 +36,17 @@ def interpret_arguments(waves, points, arguments):
             raise InvalidArgumentError("{} is invalid.".format(arguments[key]))
     return output_arguments
 
+def chunk_overlap(arguments):
+    # Enough for the threshold and the average period between peaks to
+    # settle at the beginning of a chunk
+    return 3*arguments['threshold_period'] + arguments['safe_period']
+
+def chunk_arguments(waves, points, begin_time, end_time, arguments):
+    # Chunks are normalized like the whole range, as the threshold
+    # depends on its minimum
+    data = waves['bp'].data_slice(begin_time, end_time)
+    return dict(arguments, data_min=np.min(data), data_max=np.max(data))
+
 def procedure(waves, points, begin_time, end_time, settings):
     wave = waves['bp']
     
@@ -43,39 +54,17 @@ def procedure(waves, points, begin_time, end_time, settings):
     data = wave.data_slice(begin_time, end_time)
     data = np.array(data)
 
-    normalized_data = data - np.min(data)
-    normalized_data /= np.max(normalized_data)
+    data_min = settings.get('data_min', np.min(data))
+    data_max = settings.get('data_max', np.max(data))
+    normalized_data = data - data_min
+    normalized_data /= data_max - data_min
 
-    threshold = np.max(normalized_data[0:int(settings['threshold_period']/sample_length)]) * settings['threshold_fraction']
-    sbp_x = []
-    sbp_y = []
-    begin_i = 0
-    average_period = 0
-    i = 0
-    while i < len(data):
-        if normalized_data[i] > threshold:
-            if begin_i == 0:
-                begin_i = i
-        else:
-            if begin_i != 0: 
-                if len(sbp_x)==0 or i*sample_length > sbp_x[-1] + settings['safe_period'] - begin_time:
-                    hopeful_slice = normalized_data[begin_i:i]
-                    maximum_i = np.argmax(hopeful_slice)
-                    fin_i = begin_i + maximum_i
-                    sbp_x.append(begin_time+sample_length*(fin_i-1))
-                    sbp_y.append(data[fin_i])
-                    threshold = np.max(normalized_data[fin_i:fin_i+int(settings['threshold_period']/sample_length)]) * settings['threshold_fraction']
-                    begin_i = 0
-                    if len(sbp_x) > 3:
-                        average_period = ( (sbp_x[-1]-sbp_x[-2]) + (sbp_x[-2]-sbp_x[-3]) + (sbp_x[-3]-sbp_x[-4]) ) / 3
-                    continue
-                else:
-                    begin_i = 0
-            if average_period!=0 and i*sample_length > sbp_x[-1] + average_period*2:
-                threshold *= 0.6
-                i = int((sbp_x[-1]+settings['safe_period'])/sample_length)
-        i += 1
-    sbp_x = np.array(sbp_x)
+    sbp_indices = analyzer.find_threshold_peaks(
+        normalized_data, normalized_data, sample_length,
+        settings['threshold_fraction'], settings['threshold_period'],
+        settings['safe_period'], timeout_factor=2)
+    sbp_x = begin_time + sample_length*(sbp_indices-1)
+    sbp_y = data[sbp_indices]
     return sbp_x, sbp_y
 
 def execute(waves, points, begin_time, end_time, arguments):
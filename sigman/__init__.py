@@ -8,12 +8,15 @@ points within QRS complexes on an ECG signal).
 This file defines the following classes:
     Wave            - signal waveform
     Points          - sorted collection of points
+    BeatIndex       - division of a waveform into beats between points
     Parameter       - parameter calculated in chosen time ranges
     Composite_data  - class containing a set of Wave, Points and 
                       Parameter objects allowing for simultaneous
                       analysis of multiple types of data.
 """
 # TODO: Documentation should be PEP-257 compliant
+from bisect import bisect_left
+from contextlib import contextmanager
 from math import isclose
 
 import numpy as np
@@ -36,8 +39,12 @@ class Wave:
                                   e.g. 'ecg' or 'bp'
         Wave.offset             - time offset
     """
+    # Arguments of `Wave.open_mmap` describing the file this instance's
+    # data is mapped from, or None if it is not mapped or was modified
+    _mmap_source = None
 
-    def __init__(self, data, sample_rate, wave_type, offset=0):
+    def __init__(self, data, sample_rate, wave_type, offset=0,
+                 copy=True):
         """Initializes a Wave object.
         
         Arguments:
@@ -45,6 +52,9 @@ class Wave:
             sample_rate     - sample rate of the signal in Hz
             type            - string describing the type of data,
                               e.g. 'ecg' or 'bp'
+            copy            - if False, a numpy array passed as `data`,
+                              e.g. a `np.memmap`, is used as it is
+                              instead of being copied into memory
         """
         if sample_rate <= 0:
             raise ValueError(("Sample rate must be greater than 0, is "
@@ -53,12 +63,55 @@ class Wave:
         self.sample_length = 1/sample_rate
         self.complete_length = len(data) * self.sample_length
         self.type = wave_type 
-        self.data = np.array(data) 
+        if copy:
+            self.data = np.array(data)
+        elif isinstance(data, np.memmap):
+            self.data = data
+        else:
+            self.data = np.asarray(data)
         self.offset = offset
 
+    @classmethod
+    def open_mmap(cls, path, dtype, sample_rate, wave_type, offset=0,
+                  header_size=0, length=None):
+        """Returns a `Wave` with data memory-mapped from a raw binary
+        file of samples.
+
+        Samples are read from the disk only when they are accessed, so
+        waveforms larger than the available memory may be used. The
+        file is mapped copy-on-write: changes to `Wave.data`, e.g. by
+        `Wave.replace_slice`, are only kept in memory and the file is
+        never modified.
+
+        Arguments:
+            path        - path to the raw file
+            dtype       - numpy data type of samples, e.g. '<f8'
+            sample_rate - sample rate of the signal in Hz
+            wave_type   - string describing the type of data
+            offset      - time offset
+            header_size - number of bytes to skip at the beginning of
+                          the file
+            length      - number of samples to map; by default all
+                          samples until the end of the file
+        """
+        shape = None if length is None else (length,)
+        data = np.memmap(path, dtype=dtype, mode='c', offset=header_size,
+                         shape=shape)
+        wave = cls(data, sample_rate, wave_type, offset=offset, copy=False)
+        wave._mmap_source = {
+            'path':path,
+            'dtype':dtype,
+            'header_size':header_size,
+            'length':len(data)}
+        return wave
+
     @classmethod
     def fromWave(cls, wave):
-        """Returns a new `Wave` exactly like the one given."""
+        """Returns a new `Wave` exactly like the one given.
+
+        Values are copied into memory, also from memory-mapped waves,
+        as their values may have been changed since they were mapped.
+        """
         return cls(wave.data, wave.sample_rate,
                    wave_type=wave.type, offset=wave.offset)
 
@@ -99,6 +152,42 @@ class Wave:
             [self.data[interp_index],  self.data[interp_index+1]])
         return approx_value
     
+    def values_at(self, times, out_of_range='raise'):
+        """Returns an array of values of the waveform at given times in
+        seconds calculated using linear interpolation of surrounding
+        samples, like `Wave.value_at`.
+
+        Times between the last sample and the end of the waveform take
+        the value of the last sample. NaN times are outside of the
+        waveform, but can't be clipped, so their values are NaN unless
+        `out_of_range` is 'raise'.
+
+        Arguments:
+            times        - array of times in seconds
+            out_of_range - what to do with times outside of the
+                           waveform: 'raise' a ValueError, return 'nan'
+                           or 'clip' them to the first or last sample
+        """
+        if out_of_range not in ('raise', 'nan', 'clip'):
+            raise ValueError(("out_of_range must be 'raise', 'nan' or "
+                              "'clip', is {}").format(out_of_range))
+        times = np.asarray(times, dtype=np.float64)
+        approx_indices = (times-self.offset) / self.sample_length
+        unknown = np.isnan(approx_indices)
+        outside = ((approx_indices < 0) | (approx_indices > len(self))
+                   | unknown)
+        if out_of_range == 'raise' and np.any(outside):
+            raise ValueError('Point at %s is outside the range of Wave'
+                             % times[outside][0])
+        if out_of_range == 'clip':
+            outside = unknown
+        values = _interpolate_samples(self.data,
+                                      np.where(unknown, 0, approx_indices))
+        if np.any(outside):
+            values = values.astype(np.float64, copy=False)
+            values[outside] = np.nan
+        return values
+
     def data_slice(self, begin_time, end_time, 
                    value_every=0, value_count=None):
         """Returns a numpy array of values from a time range.
@@ -123,14 +212,15 @@ class Wave:
         end_i = self.sample_at(end_time)
         if value_count is not None:
             value_every = (end_time-begin_time)/value_count
+        data = self.data[begin_i:end_i]
         if value_every == 0 or isclose(self.sample_length, value_every):
-           return self.data[begin_i:end_i]
+           return data
+        # Samples of the slice are spaced `sample_length` apart starting
+        # at `begin_time`, so wanted times map onto fractional indices
+        # without having to search through a table of x coordinates
         wanted_values = np.arange(begin_time, end_time, value_every)
-        coord_x, coord_y = self.generate_coordinate_tables(
-            begin_time = begin_time, end_time = end_time, 
-            begin_x = begin_time)
-        interpolated_table = np.interp(wanted_values, coord_x, coord_y)
-        return interpolated_table
+        approx_indices = (wanted_values - begin_time) / self.sample_length
+        return _interpolate_samples(data, approx_indices)
 
     def replace_slice(self, begin_time, end_time, wave):
         """Replaces the values of this `Wave` instance in a given time 
@@ -151,15 +241,34 @@ class Wave:
             end_time = wave.complete_length - begin_time
         begin_i = self.sample_at(begin_time)
         end_i = self.sample_at(end_time)
-        for j in range(end_i-begin_i):
-            self.data[begin_i+j]=wave.data[j]
+        self.data[begin_i:end_i] = wave.data[:end_i-begin_i]
+        # The data no longer corresponds to the mapped file
+        self._mmap_source = None
+
+    def apply_slice(self, begin_time, end_time, function):
+        """Modifies the values of this `Wave` instance in a given time
+        range in place.
+
+        Arguments:
+            begin_time - beginning of the time range
+            end_time   - end of the time range
+            function   - function taking a view of values in the time
+                         range and modifying them in place, e.g.
+                         `lambda data: np.abs(data, out=data)`
+        """
+        begin_i = self.sample_at(begin_time)
+        end_i = self.sample_at(end_time)
+        function(self.data[begin_i:end_i])
+        # The data no longer corresponds to the mapped file
+        self._mmap_source = None
     
     def generate_coordinate_tables(self, begin_time=0, end_time=None,
                                    begin_x=0):
         """Returns points of the waveform in the form of two arrays - 
         x and y values.
 
-        Useful for visualization.
+        Useful for visualization. The returned y array is a view of
+        `Wave.data` rather than a copy.
 
         Arguments:
             begin_time - the beginning of the time range
@@ -169,16 +278,24 @@ class Wave:
         # TODO: Rethink this; arguments seem shady
         if end_time is None:
             end_time = self.complete_length
-        data = self.data_slice(begin_time, end_time)
-        output_x = []
-        output_y = []
-        for i in range(len(data)):
-            output_x.append(begin_x+i * self.sample_length)
-            output_y.append(data[i])
-        output_x = np.array(output_x)
-        output_y = np.array(output_y)
+        output_y = self.data_slice(begin_time, end_time)
+        output_x = begin_x + np.arange(len(output_y)) * self.sample_length
         return output_x, output_y
 
+def _interpolate_samples(data, approx_indices):
+    """Returns values of evenly spaced samples at fractional indices
+    calculated using linear interpolation of surrounding samples.
+
+    Indices outside of the range of `data` are clipped to its first or
+    last sample, like with `np.interp`.
+    """
+    approx_indices = np.clip(approx_indices, 0, len(data)-1)
+    lower_indices = approx_indices.astype(int)
+    upper_indices = np.minimum(lower_indices+1, len(data)-1)
+    fractions = approx_indices - lower_indices
+    lower_values = data[lower_indices]
+    return lower_values + (data[upper_indices]-lower_values)*fractions
+
 # TODO: Unnecessary
 class EmptyPointsError(Exception):
     """Raised when an empty Points class is initialized."""
@@ -187,7 +304,16 @@ class Points:
     """Class describing points, i.e. events in time with a value.
 
     The points are kept in the form of two arrays, of x and y values,
-    sorted by x.
+    sorted by x. For quick editing they are stored in chunks of about
+    `Points.chunk_size` points, so adding, deleting or moving a single
+    point only reallocates one chunk. `Points.data_x` and
+    `Points.data_y` are concatenated from the chunks when accessed
+    after an edit and the chunks become views of them; assigning new
+    arrays to them replaces all points.
+
+    Many points may be added at once with `Points.add_points`, or
+    within a `Points.batch` block which merges them into the arrays
+    only once it ends.
 
     Attributes:
         Points.data_x - numpy array of x coordinates
@@ -195,6 +321,15 @@ class Points:
         Points.type   - type of points, e.g. 'r' or 'sbp'
     """
     # TODO: rename data_x and data_y into x and y (?may be less clear)
+    chunk_size = 1024
+    _batch_depth = 0
+    _pending = None
+    _data_x = None
+    _data_y = None
+    _chunks_x = None
+    _chunks_y = None
+    _chunk_firsts = None
+
     def __init__(self, data_x, data_y, point_type):
         """Initializes a `Points` instance.
 
@@ -204,9 +339,11 @@ class Points:
             point_type - type of points, e.g. 'r' or 'sbp'
         """
         if len(data_x) > 0:
-            temp_data_x, temp_data_y = zip(*sorted(zip(data_x,data_y)))
-            self.data_x = np.array(temp_data_x) 
-            self.data_y = np.array(temp_data_y) 
+            data_x = np.asarray(data_x)
+            data_y = np.asarray(data_y)
+            order = np.lexsort((data_y, data_x))
+            self.data_x = data_x[order]
+            self.data_y = data_y[order]
             self.type = point_type 
         else:
             raise EmptyPointsError
@@ -222,11 +359,202 @@ class Points:
         """Returns a copy of this `Points` instance."""
         return Points.fromPoints(self)
 
+    @property
+    def data_x(self):
+        if self._data_x is None:
+            self._concatenate_chunks()
+        return self._data_x
+
+    @data_x.setter
+    def data_x(self, data_x):
+        # The other array must not be left only in chunks
+        if self._data_y is None:
+            self._concatenate_chunks()
+        self._data_x = np.asarray(data_x)
+        self._chunks_x = self._chunks_y = self._chunk_firsts = None
+
+    @property
+    def data_y(self):
+        if self._data_y is None:
+            self._concatenate_chunks()
+        return self._data_y
+
+    @data_y.setter
+    def data_y(self, data_y):
+        if self._data_x is None:
+            self._concatenate_chunks()
+        self._data_y = np.asarray(data_y)
+        self._chunks_x = self._chunks_y = self._chunk_firsts = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        for key in ['_data_x', '_data_y', '_chunks_x', '_chunks_y',
+                    '_chunk_firsts', '_pending', '_batch_depth']:
+            state.pop(key, None)
+        # Same layout as before points were kept in chunks
+        state['data_x'] = self.data_x
+        state['data_y'] = self.data_y
+        return state
+
+    def __setstate__(self, state):
+        state = state.copy()
+        data_x = state.pop('data_x')
+        data_y = state.pop('data_y')
+        self.__dict__.update(state)
+        self._data_x = data_x
+        self._data_y = data_y
+
+    def _concatenate_chunks(self):
+        """Concatenates chunks into `Points.data_x` and `Points.data_y`
+        and replaces the chunks with views of them."""
+        if self._chunks_x:
+            self._data_x = np.concatenate(self._chunks_x)
+            self._data_y = np.concatenate(self._chunks_y)
+        else:
+            self._data_x = np.array([])
+            self._data_y = np.array([])
+        self._split_into_chunks()
+
+    def _split_into_chunks(self):
+        """Splits `Points.data_x` and `Points.data_y` into chunks which
+        are views of them."""
+        if len(self._data_x) != len(self._data_y):
+            raise ValueError(("Points.data_x and Points.data_y must have "
+                              "the same length, have {} and {}").format(
+                                  len(self._data_x), len(self._data_y)))
+        bounds = range(0, len(self._data_x), self.chunk_size)
+        self._chunks_x = [self._data_x[i:i+self.chunk_size] for i in bounds]
+        self._chunks_y = [self._data_y[i:i+self.chunk_size] for i in bounds]
+        self._chunk_firsts = [chunk[0] for chunk in self._chunks_x]
+
+    def _chunks(self):
+        """Returns lists of chunks of x and y coordinates."""
+        if self._chunks_x is None:
+            self._split_into_chunks()
+        return self._chunks_x, self._chunks_y
+
+    def _chunk_offsets(self):
+        """Returns an array of indices of the first point of each
+        chunk, followed by the number of points."""
+        chunks_x, _ = self._chunks()
+        offsets = np.zeros(len(chunks_x)+1, dtype=int)
+        np.cumsum([len(chunk) for chunk in chunks_x], out=offsets[1:])
+        return offsets
+
+    def _find_chunk(self, x):
+        """Returns the index of the chunk into which a point with the
+        given x should be inserted and its index within that chunk.
+        
+        Points are inserted before points with the same x, just like
+        with `np.searchsorted`.
+        """
+        chunks_x, _ = self._chunks()
+        if not chunks_x:
+            return 0, 0
+        chunk_i = max(bisect_left(self._chunk_firsts, x) - 1, 0)
+        return chunk_i, int(np.searchsorted(chunks_x[chunk_i], x))
+
+    def _searchsorted(self, x):
+        """Returns the index at which a point with the given x would be
+        inserted, like `np.searchsorted` on `Points.data_x`."""
+        if self._data_x is not None:
+            return int(np.searchsorted(self._data_x, x))
+        chunk_i, i = self._find_chunk(x)
+        return int(self._chunk_offsets()[chunk_i]) + i
+
+    def _chunk_location(self, i):
+        """Returns the index of the chunk that contains the point with
+        a given index and the point's index within that chunk."""
+        offsets = self._chunk_offsets()
+        if i < 0:
+            i += offsets[-1]
+        if not 0 <= i < offsets[-1]:
+            raise IndexError("Points index out of range")
+        chunk_i = int(np.searchsorted(offsets, i, side='right')) - 1
+        return chunk_i, int(i - offsets[chunk_i])
+
+    def _edited(self, chunk_i):
+        """Updates information about a chunk after it was replaced and
+        discards the concatenated arrays."""
+        chunks_x, chunks_y = self._chunks_x, self._chunks_y
+        self._data_x = self._data_y = None
+        if len(chunks_x[chunk_i]) == 0:
+            del chunks_x[chunk_i]
+            del chunks_y[chunk_i]
+            del self._chunk_firsts[chunk_i]
+            return
+        if len(chunks_x[chunk_i]) > 2*self.chunk_size:
+            half = len(chunks_x[chunk_i]) // 2
+            chunks_x[chunk_i:chunk_i+1] = np.split(chunks_x[chunk_i], [half])
+            chunks_y[chunk_i:chunk_i+1] = np.split(chunks_y[chunk_i], [half])
+            self._chunk_firsts.insert(chunk_i+1, chunks_x[chunk_i+1][0])
+        self._chunk_firsts[chunk_i] = chunks_x[chunk_i][0]
+
+    def _insert(self, x, y):
+        """Inserts a single point into the chunks."""
+        chunks_x, chunks_y = self._chunks()
+        if not chunks_x:
+            chunks_x.append(np.array([x]))
+            chunks_y.append(np.array([y]))
+            self._chunk_firsts.append(x)
+            self._edited(0)
+            return
+        chunk_i, i = self._find_chunk(x)
+        chunks_x[chunk_i] = np.insert(chunks_x[chunk_i], i, x)
+        chunks_y[chunk_i] = np.insert(chunks_y[chunk_i], i, y)
+        self._edited(chunk_i)
+
+    def _remove(self, chunk_i, i):
+        """Removes a single point from the chunks."""
+        chunks_x, chunks_y = self._chunks()
+        chunks_x[chunk_i] = np.delete(chunks_x[chunk_i], i)
+        chunks_y[chunk_i] = np.delete(chunks_y[chunk_i], i)
+        self._edited(chunk_i)
+
+    def _closest_location(self, x, y=None):
+        """Returns the chunk index and index within it of the point
+        closest to the given x and y coordinates. If y is not given,
+        then only the x axis is considered.
+        """
+        chunks_x, chunks_y = self._chunks()
+        chunk_i, i = self._find_chunk(x)
+        # Neighbours of x in the order of points
+        candidates = []
+        if i > 0:
+            candidates.append((chunk_i, i-1))
+        elif chunk_i > 0:
+            candidates.append((chunk_i-1, len(chunks_x[chunk_i-1])-1))
+        if i < len(chunks_x[chunk_i]):
+            candidates.append((chunk_i, i))
+        elif chunk_i+1 < len(chunks_x):
+            candidates.append((chunk_i+1, 0))
+        if y is None:
+            return min(candidates,
+                       key=lambda c: abs(chunks_x[c[0]][c[1]] - x))
+        for chunk_i, i in candidates:
+            if chunks_x[chunk_i][i] == x and chunks_y[chunk_i][i] == y:
+                return chunk_i, i
+        # The point is not at x, so all points must be compared
+        closest = None
+        for chunk_i, (chunk_x, chunk_y) in enumerate(zip(chunks_x,
+                                                         chunks_y)):
+            distances = (chunk_x - x)**2 + (chunk_y - y)**2
+            i = int(np.argmin(distances))
+            if closest is None or distances[i] < closest[0]:
+                closest = (distances[i], chunk_i, i)
+        return closest[1], closest[2]
+
     def __len__(self):
         """Returns number of points contained in this instance."""
-        return len(self.data_x)
+        if self._data_x is not None:
+            return len(self._data_x)
+        return sum(len(chunk) for chunk in self._chunks_x)
 
     def __getitem__(self, key):
+        if (self._data_x is None 
+                and isinstance(key, (int, np.integer))):
+            chunk_i, i = self._chunk_location(key)
+            return self._chunks_x[chunk_i][i], self._chunks_y[chunk_i][i]
         x = self.data_x[key]
         y = self.data_y[key]
         if isinstance(key, slice):
@@ -242,8 +570,9 @@ class Points:
             begin_time - beginning of the time range
             end_time   - end of the time range
         """
-        begin_i = np.searchsorted(self.data_x, begin_time)
-        end_i = np.searchsorted(self.data_x, end_time)
+        self._merge_pending()
+        begin_i = self._searchsorted(begin_time)
+        end_i = self._searchsorted(end_time)
         if begin_i != end_i:
             return range(begin_i, end_i)
         else:
@@ -267,7 +596,17 @@ class Points:
         if begin_i < 0:
             begin_i = 0
         end_i = temp_range[-1]+1
-        return self.data_x[begin_i:end_i], self.data_y[begin_i:end_i]
+        if self._data_x is not None:
+            return self._data_x[begin_i:end_i], self._data_y[begin_i:end_i]
+        # Only chunks within the range are concatenated
+        offsets = self._chunk_offsets()
+        first = int(np.searchsorted(offsets, begin_i, side='right')) - 1
+        last = int(np.searchsorted(offsets, end_i, side='left'))
+        data_x = np.concatenate(self._chunks_x[first:last])
+        data_y = np.concatenate(self._chunks_y[first:last])
+        begin_i -= offsets[first]
+        end_i -= offsets[first]
+        return data_x[begin_i:end_i], data_y[begin_i:end_i]
 
     def delete_slice(self, begin_time, end_time):
         """Deletes points contained in this instance from a time
@@ -277,6 +616,7 @@ class Points:
             begin_time  - beginning of the time range
             end_time    - end of the time range
         """
+        self._merge_pending()
         temp_range = self.slice_range(begin_time, end_time)
         self.data_x = np.delete(self.data_x, temp_range)
         self.data_y = np.delete(self.data_y, temp_range)
@@ -290,82 +630,420 @@ class Points:
             begin_time  - beginning of the time range
             end_time    - end of the time range
             points      - `Points` instance with which to replace this
-                          instance's points
-        """
-        begin_i = self.delete_slice(begin_time, end_time)
-        j = 0
-        while (j < len(points) and 
-                points.data_x[j] < end_time-begin_time):
-            np.insert(self.data_x, begin_i+j, points.data_x[j]+begin_time)
-            np.insert(self.data_y, begin_i+j, points.data_y[j])
+                          instance's points; its x coordinates are
+                          relative to `begin_time`
+        """
+        self._merge_pending()
+        begin_i = self._searchsorted(begin_time)
+        end_i = self._searchsorted(end_time)
+        self.data_x = np.delete(self.data_x, np.s_[begin_i:end_i])
+        self.data_y = np.delete(self.data_y, np.s_[begin_i:end_i])
+        end_j = np.searchsorted(points.data_x, end_time-begin_time)
+        self._merge(points.data_x[:end_j]+begin_time,
+                    points.data_y[:end_j])
     
     def add_point(self, x, y):
         """Adds a point with a given x and y coordinates to this
         `Points` instance.
         """
-        i = np.searchsorted(self.data_x, x)
-        self.data_x=np.insert(self.data_x, i, x)
-        self.data_y=np.insert(self.data_y, i, y)
+        x = np.asarray(x).item()
+        y = np.asarray(y).item()
+        if self._batch_depth > 0:
+            self._pending.append((np.array([x]), np.array([y])))
+            return
+        self._insert(x, y)
         
     def add_points(self, points, begin_time=0):
-        """Adds points from a given `Points` instance to this instance."""
-        for x, y in zip(points.data_x, points.data_y):
-            self.add_point(x+begin_time, y)
+        """Adds points from a given `Points` instance to this instance.
+
+        Arguments:
+            points      - `Points` instance to add
+            begin_time  - time by which added points are offset
+        """
+        data_x = np.asarray(points.data_x) + begin_time
+        data_y = np.array(points.data_y)
+        if self._batch_depth > 0:
+            self._pending.append((data_x, data_y))
+        else:
+            self._merge(data_x, data_y)
+
+    @contextmanager
+    def batch(self):
+        """Returns a context manager within which points added with
+        `Points.add_point` and `Points.add_points` are only collected
+        and merged into this instance all at once when it exits.
+
+        Other methods merge the collected points before they run, but
+        `Points.data_x` and `Points.data_y` do not contain them until
+        the batch ends. Batches may be nested.
+        """
+        if self._batch_depth == 0:
+            self._pending = []
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0:
+                self._merge_pending()
+                self._pending = None
+
+    def _merge_pending(self):
+        """Merges points collected within a batch into the arrays."""
+        if self._pending:
+            data_x, data_y = zip(*self._pending)
+            self._pending.clear()
+            self._merge(np.concatenate(data_x), np.concatenate(data_y))
+
+    def _merge(self, data_x, data_y):
+        """Merges arrays of x and y coordinates into this instance.
+        
+        New points are placed before existing points with the same x,
+        just like with `Points.add_point`.
+        """
+        if len(data_x) == 0:
+            return
+        all_x = np.concatenate((data_x, self.data_x))
+        all_y = np.concatenate((data_y, self.data_y))
+        order = np.argsort(all_x, kind='stable')
+        self.data_x = all_x[order]
+        self.data_y = all_y[order]
 
     def delete_point(self, x, y=None):
         """Deletes a point closest to the given x and y coordinates.
         If y is not given, then only the x axis is considered.
         """
+        self._merge_pending()
+        x = np.asarray(x).item()
         if y is not None:
-            closest_id = self.closest_point_id(x, y)
-        else:
-            closest_id = np.argmin(np.abs(self.data_x - x))
-        self.data_x = np.delete(self.data_x, closest_id)
-        self.data_y = np.delete(self.data_y, closest_id)
+            y = np.asarray(y).item()
+        self._remove(*self._closest_location(x, y))
     
     def move_point(self, x1, y1, x2, y2):
         """Moves a point with the given x and y coordinates to a
         new position.
         """
-        closest_id = self.closest_point_id(x1, y1)
-        if not (isclose(self.data_x[closest_id], x1) and
-                isclose(self.data_y[closest_id], y1)):
+        self._merge_pending()
+        x1, y1, x2, y2 = (np.asarray(v).item() for v in (x1, y1, x2, y2))
+        chunk_i, i = self._closest_location(x1, y1)
+        if not (isclose(self._chunks_x[chunk_i][i], x1) and
+                isclose(self._chunks_y[chunk_i][i], y1)):
             raise ValueError(('A point with the given x1 and y1 coordinates'
                               'does not exist: {}, {}').format(x1, y1))
-        self.data_x = np.delete(self.data_x, closest_id)
-        self.data_y = np.delete(self.data_y, closest_id)
-        i = np.searchsorted(self.data_x, x2)
-        self.data_x=np.insert(self.data_x, i, x2)
-        self.data_y=np.insert(self.data_y, i, y2)
+        self._remove(chunk_i, i)
+        self._insert(x2, y2)
 
     def closest_point_id(self, x, y):
         """Returns the index of the closest point to the point with
         given x and y coordinates.
         """
-        points = np.vstack((self.data_x, self.data_y))
-        point = np.array([[x,y]])
-        comparison_distances = np.sum((points - point)**2, axis=1)
-        return np.argmin(comparison_distances) 
+        self._merge_pending()
+        chunk_i, i = self._closest_location(np.asarray(x).item(),
+                                            np.asarray(y).item())
+        return int(self._chunk_offsets()[chunk_i]) + i
 
     def align_to_line(self, wave):
         """Aligns all points' y values to the value of a `Wave` at the
         same x.
         """
-        for i in range(len(self)):
-            self.data_y[i] = wave.value_at(self.data_x[i])
+        self._merge_pending()
+        self.data_y = wave.values_at(self.data_x)
+
+    def match_points(self, other, tolerance=np.inf, direction='nearest'):
+        """Pairs points with points of another `Points` instance by
+        their x coordinates.
+
+        Each point is paired with at most one point of `other`, but
+        many points may be paired with the same one. Points without
+        a point of `other` within `tolerance` stay unpaired.
+
+        Arguments:
+            other     - `Points` to pair with
+            tolerance - maximum distance between paired points
+            direction - 'nearest' to pair with the closest point,
+                        'forward' with the closest point at the same
+                        x or after it and 'backward' with the closest
+                        point at the same x or before it
+
+        Returns two arrays of indices of paired points of this
+        instance and of `other`.
+        """
+        x = self.data_x
+        other_x = other.data_x
+        if direction == 'forward':
+            matches = np.searchsorted(other_x, x, side='left')
+        elif direction == 'backward':
+            matches = np.searchsorted(other_x, x, side='right') - 1
+        elif direction == 'nearest':
+            after = np.searchsorted(other_x, x, side='left')
+            before = np.maximum(after-1, 0)
+            after = np.minimum(after, len(other_x)-1)
+            if len(other_x) == 0:
+                matches = after
+            else:
+                matches = np.where(
+                    np.abs(other_x[after]-x) < np.abs(x-other_x[before]),
+                    after, before)
+        else:
+            raise ValueError('Invalid direction {}'.format(direction))
+        paired = (matches >= 0) & (matches < len(other_x))
+        paired[paired] = (np.abs(other_x[matches[paired]]-x[paired])
+                          <= tolerance)
+        return np.flatnonzero(paired), matches[paired]
 
     def offset(self, time):
         """Offsets all points' x coordinates."""
-        for i in range(len(self)):
-            self.data_x[i] += time
+        self._merge_pending()
+        self.data_x = self.data_x + time
     
     def move_in_time(self, time):
         # DEPRECATED
         self.offset(time)
 
+class BeatIndex:
+    """Class dividing a `Wave` into beats, i.e. ranges of samples
+    between consecutive points, like R points on an ECG signal.
+
+    Sample boundaries of all beats are calculated once, so that values
+    within beats may be reduced for all beats at once, e.g. with
+    `BeatIndex.argmax`. The beat between points `i` and `i+1` may be
+    narrowed down to a part of it with `begin_fraction` and
+    `end_fraction`, which are fractions of its length.
+
+    Beats between points outside of the range of the `Wave` are
+    invalid and have no samples. Reductions return `empty` values for
+    beats without samples. Unlike `Wave.data_slice`, which raises
+    a ValueError for such time ranges, invalid beats are not an error;
+    procedures using `BeatIndex` leave them out of their output.
+
+    Attributes:
+        BeatIndex.wave        - the divided `Wave`
+        BeatIndex.periods     - times between consecutive points
+        BeatIndex.begin_times - beginnings of beats
+        BeatIndex.end_times   - ends of beats
+        BeatIndex.valid       - boolean array whether each beat is
+                                within the range of the `Wave`
+        BeatIndex.starts      - indices of first samples of beats
+        BeatIndex.ends        - indices after last samples of beats
+        BeatIndex.lengths     - numbers of samples of beats
+        BeatIndex.offsets     - indices of first samples of beats in
+                                arrays of values of all beats
+    """
+
+    def __init__(self, wave, points, begin_fraction=0, end_fraction=1):
+        """Initializes BeatIndex.
+
+        Arguments:
+            wave           - `Wave` to divide into beats
+            points         - `Points` dividing the `Wave`
+            begin_fraction - beginning of beats as a fraction of the
+                             time between points
+            end_fraction   - end of beats as a fraction of the time
+                             between points
+        """
+        self.wave = wave
+        points_x = np.asarray(points.data_x)
+        self.periods = np.diff(points_x)
+        self.begin_times = points_x[:-1] + begin_fraction*self.periods
+        self.end_times = self.periods*end_fraction + points_x[:-1]
+        self.valid = ((points_x[:-1] >= wave.offset)
+            & (points_x[1:] <= wave.offset+wave.complete_length))
+        # Boundaries are calculated like with `Wave.sample_at`, so that
+        # beats are the same as `Wave.data_slice` of their time range
+        self.starts = np.where(self.valid,
+                               self._samples_at(self.begin_times), 0)
+        self.ends = np.where(self.valid,
+                             self._samples_at(self.end_times), 0)
+        self.ends = np.maximum(self.ends, self.starts)
+        self.lengths = self.ends - self.starts
+        self.offsets = np.concatenate(([0], np.cumsum(self.lengths)[:-1]))
+        self._sample_indices = None
+        self._positions = None
+
+    def _samples_at(self, times):
+        indices = ((times-self.wave.offset)
+                   / self.wave.sample_length).astype(int)
+        indices[indices == len(self.wave)] -= 1
+        return np.clip(indices, 0, len(self.wave))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, i):
+        """Returns values of the `Wave` within the `i`th beat."""
+        return self.wave.data[self.starts[i]:self.ends[i]]
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    @property
+    def sample_indices(self):
+        """Indices of samples of all beats, one beat after another."""
+        if self._sample_indices is None:
+            self._sample_indices = (
+                np.arange(np.sum(self.lengths))
+                + self.repeat(self.starts-self.offsets))
+        return self._sample_indices
+
+    @property
+    def positions(self):
+        """Indices of samples of all beats relative to the beginning
+        of their beat, one beat after another."""
+        if self._positions is None:
+            self._positions = (np.arange(np.sum(self.lengths))
+                               - self.repeat(self.offsets))
+        return self._positions
+
+    def repeat(self, beat_values):
+        """Repeats values given for each beat for every sample of it."""
+        return np.repeat(np.broadcast_to(beat_values, len(self)),
+                         self.lengths)
+
+    def values(self, shift=0):
+        """Returns values of samples of all beats, one beat after
+        another.
+
+        Values may be shifted by a number of samples, e.g. with
+        `shift=-1` each value is replaced by the one before it. Samples
+        outside of the `Wave` are replaced by its first or last one.
+        """
+        indices = self.sample_indices
+        if shift != 0:
+            indices = np.clip(indices+shift, 0, len(self.wave)-1)
+        return self.wave.data[indices]
+
+    def reduce(self, ufunc, values=None, empty=np.nan):
+        """Reduces values of samples of every beat with a NumPy ufunc,
+        e.g. `np.maximum`.
+
+        Arguments:
+            ufunc  - NumPy ufunc used with its `reduceat` method
+            values - array of values of samples of all beats, like
+                     returned by `BeatIndex.values`. If None, values
+                     of the `Wave` are used.
+            empty  - value returned for beats without samples
+        """
+        not_empty = self.lengths > 0
+        if values is None:
+            starts = self.starts[not_empty]
+            ends = self.ends[not_empty]
+            if np.array_equal(starts[1:], ends[:-1]):
+                # Beats follow one another, so the values of the Wave
+                # may be reduced without gathering them
+                values = self.wave.data[:ends[-1] if len(ends) else 0]
+                indices = starts
+            else:
+                values = self.values()
+                indices = self.offsets[not_empty]
+        else:
+            indices = self.offsets[not_empty]
+        output = np.full(len(self), empty,
+                         dtype=np.result_type(values, empty))
+        if len(indices) > 0:
+            output[not_empty] = ufunc.reduceat(values, indices)
+        return output
+
+    def max(self):
+        """Returns the highest value of every beat."""
+        return self.reduce(np.maximum)
+
+    def min(self):
+        """Returns the lowest value of every beat."""
+        return self.reduce(np.minimum)
+
+    def sum(self):
+        """Returns the sum of values of every beat."""
+        return self.reduce(np.add)
+
+    def mean(self):
+        """Returns the mean value of every beat."""
+        return self.sum() / np.maximum(self.lengths, 1)
+
+    def area(self):
+        """Returns the area under the signal within every beat
+        calculated with the trapezoidal rule."""
+        last_values = self.wave.data[np.maximum(self.ends-1, 0)]
+        edges = (self.wave.data[self.starts] + last_values) / 2
+        return (self.sum()-edges) * self.wave.sample_length
+
+    def first_index(self, mask, begin=0, end=None, empty=-1):
+        """Returns the index of the first sample of every beat for
+        which `mask` is True, relative to the beginning of the beat.
+
+        Arguments:
+            mask  - boolean array for samples of all beats, like
+                    values returned by `BeatIndex.values`
+            begin - first index, or an array of first indices for
+                    each beat, from which samples are considered
+            end   - last index, or an array of last indices for each
+                    beat, up to which samples are considered
+            empty - value returned for beats without such samples
+        """
+        mask = self._mask_range(mask, begin, end)
+        not_found = np.iinfo(int).max
+        indices = self.reduce(np.minimum,
+                              np.where(mask, self.positions, not_found),
+                              not_found)
+        return np.where(indices == not_found, empty, indices)
+
+    def last_index(self, mask, begin=0, end=None, empty=-1):
+        """Returns the index of the last sample of every beat for which
+        `mask` is True, relative to the beginning of the beat.
+
+        Arguments are the same as for `BeatIndex.first_index`.
+        """
+        mask = self._mask_range(mask, begin, end)
+        indices = self.reduce(np.maximum,
+                              np.where(mask, self.positions, -1), -1)
+        return np.where(indices == -1, empty, indices)
+
+    def _mask_range(self, mask, begin, end):
+        mask = mask & (self.positions >= self.repeat(begin))
+        if end is not None:
+            mask &= self.positions <= self.repeat(end)
+        return mask
+
+    def argmax(self):
+        """Returns the index of the first highest value of every beat,
+        relative to the beginning of the beat, or -1 for beats without
+        samples."""
+        return self.first_index(self.values() == self.repeat(self.max()))
+
+    def argmin(self):
+        """Returns the index of the first lowest value of every beat,
+        relative to the beginning of the beat, or -1 for beats without
+        samples."""
+        return self.first_index(self.values() == self.repeat(self.min()))
+
+    def last_crossing(self, thresholds, before, begin=0, empty=-1):
+        """Returns the index of the last sample of every beat at or
+        before `before` which is not above its threshold, i.e. where
+        the signal last crossed the threshold before rising above it.
+
+        Arguments:
+            thresholds - threshold, or an array of thresholds for each
+                         beat
+            before     - index, or an array of indices for each beat,
+                         up to which samples are considered
+            begin      - first index, or an array of first indices for
+                         each beat, from which samples are considered
+            empty      - value returned for beats without such samples
+        """
+        mask = self.values() <= self.repeat(thresholds)
+        return self.last_index(mask, begin, before, empty)
+
 class Parameter:
     """Class denoting a parameter calculated over time ranges.
 
+    Time ranges are sorted by their beginnings. Queries about time use
+    an index of ranges grouped by their lengths, each group spanning
+    lengths up to twice its shortest one. Within a group, only ranges
+    beginning at most the longest length before a given time may
+    contain it, so a query compares only a few ranges besides those
+    containing it, even if some ranges are much longer than others.
+    The index is rebuilt when any of the arrays below is replaced.
+
     Attributes:
         Parameter.type          - string describing the type of the
                                   parameter, e.g. 'hr'
@@ -380,6 +1058,9 @@ class Parameter:
                                   above time ranges
     """
     # The architecture of the Parameter class should probably be reconsidered
+    _indexed_arrays = None
+    _length_groups = None
+
     def __init__(self, parameter_type):
         self.type = parameter_type
         self.begin_times = np.array([])
@@ -394,6 +1075,30 @@ class Parameter:
         out.values = np.copy(parameter.values)
         return out
 
+    @classmethod
+    def fromArrays(cls, parameter_type, begin_times, end_times, values):
+        """Initializes a `Parameter` with all values at once.
+
+        Arguments:
+            parameter_type - string describing the type of the
+                             parameter, e.g. 'hr'
+            begin_times    - list of beginnings of time ranges
+            end_times      - list of endings of time ranges
+            values         - list of values in the time ranges
+        """
+        begin_times = np.asarray(begin_times, dtype=np.float64)
+        order = np.argsort(begin_times, kind='stable')
+        out = cls(parameter_type)
+        out.begin_times = begin_times[order]
+        out.end_times = np.asarray(end_times, dtype=np.float64)[order]
+        values = np.asarray(values)
+        if values.dtype == object:
+            # Procedures return None where there is no value
+            values = np.array([np.nan if value is None else value
+                               for value in values], dtype=np.float64)
+        out.values = np.asarray(values, dtype=np.float64)[order]
+        return out
+
     def copy(self):
         return Parameter.fromParameter(self)
 
@@ -411,34 +1116,112 @@ class Parameter:
             self.end_times = np.insert(self.end_times, i, end_time)
             self.values = np.insert(self.values, i, value)
 
+    def _interval_index(self):
+        """Returns a list of `(<longest length>, <indices>, <begin
+        times>)` tuples of groups of time ranges, rebuilding it if the
+        arrays were replaced.
+
+        Lengths in a group are between half of the longest one and the
+        longest one. Ranges of zero, negative or unknown length are in
+        a group of their own, as are infinitely long ones.
+        """
+        indexed_arrays = (self.begin_times, self.end_times)
+        if (self._indexed_arrays is None
+                or any(a is not b for a, b in zip(self._indexed_arrays,
+                                                  indexed_arrays))):
+            lengths = self.end_times - self.begin_times
+            positive = lengths > 0
+            # Exponents e of lengths in [2**(e-1), 2**e)
+            _, exponents = np.frexp(np.where(np.isfinite(lengths),
+                                             lengths, 0))
+            longest = np.where(positive, np.ldexp(1.0, exponents), 0.0)
+            longest[np.isinf(lengths) & positive] = np.inf
+            self._length_groups = []
+            for length in np.unique(longest):
+                # Indices are increasing, so begin times stay sorted
+                indices = np.flatnonzero(longest == length)
+                self._length_groups.append(
+                    (length, indices, self.begin_times[indices]))
+            self._indexed_arrays = indexed_arrays
+        return self._length_groups
+
+    def _candidates(self, begin_times, end_times):
+        """Returns indices of queried time ranges and of time ranges
+        which may overlap with them, as two arrays of the same
+        length."""
+        queries = []
+        candidates = []
+        for length, indices, group_begin_times in self._interval_index():
+            begin_i = np.searchsorted(group_begin_times,
+                                      begin_times-length)
+            end_i = np.searchsorted(group_begin_times, end_times,
+                                    side='right')
+            counts = np.maximum(end_i - begin_i, 0)
+            # Candidates of all queries in a single flat array
+            queries.append(np.repeat(np.arange(len(begin_times)), counts))
+            candidates.append(indices[
+                np.arange(counts.sum())
+                - np.repeat(np.cumsum(counts) - counts, counts)
+                + np.repeat(begin_i, counts)])
+        if not candidates:
+            return np.array([], dtype=int), np.array([], dtype=int)
+        return np.concatenate(queries), np.concatenate(candidates)
+
+    def indices_in_range(self, begin_time, end_time):
+        """Returns an array of indices of time ranges which overlap
+        with a given time range, including those only touching it.
+
+        Arguments:
+            begin_time - beginning of the time range
+            end_time   - end of the time range
+        """
+        _, indices = self._candidates(np.array([begin_time], dtype=float),
+                                      np.array([end_time], dtype=float))
+        return np.sort(indices[self.end_times[indices] >= begin_time])
+
     def contained_in(self, time):
-        contained_indices = []
-        for index, begin_time, end_time in zip(range(len(self)),self.begin_times,
-                                        self.end_times):
-            if time >= begin_time and time <= end_time:
-                contained_indices.append(index)
-            elif time > begin_time:
-                break
-        return contained_indices
+        """Returns a list of indices of time ranges containing a given
+        time."""
+        return list(self.indices_in_range(time, time))
 
     def value_at(self, time):
-        parameter_indices = self.contained_in(time)
+        """Returns the average value of the parameter in time ranges
+        containing a given time, or None if there are none."""
+        parameter_indices = self.indices_in_range(time, time)
         if len(parameter_indices) == 0:
             return None
         else:
             return np.average(self.values[parameter_indices])
 
+    def values_at(self, times):
+        """Returns an array of values of the parameter at given times,
+        like `Parameter.value_at`, with NaN where there are none.
+
+        Arguments:
+            times - array of times
+        """
+        times = np.asarray(times, dtype=np.float64)
+        owners, indices = self._candidates(times, times)
+        contained = self.end_times[indices] >= times[owners]
+        owners = owners[contained]
+        indices = indices[contained]
+        sums = np.bincount(owners, weights=self.values[indices],
+                           minlength=len(times))
+        found = np.bincount(owners, minlength=len(times))
+        output = np.full(len(times), np.nan)
+        np.divide(sums, found, out=output, where=found > 0)
+        return output
+
     def generate_parameter_line_tuples(self, begin_time=None, end_time=None):
+        if begin_time is None:
+            begin_time = -np.inf
+        if end_time is None:
+            end_time = np.inf
         line_tuples = []
-        for param_begin_time, param_end_time, value in zip(self.begin_times,
-                                                           self.end_times,
-                                                           self.values):
-            if begin_time is not None and param_end_time < begin_time:
-                continue
-            if end_time is not None and param_begin_time > end_time:
-                break
-            temp_begin_time = max(begin_time, param_begin_time)
-            temp_end_time = min(end_time, param_end_time)
+        for i in self.indices_in_range(begin_time, end_time):
+            temp_begin_time = max(begin_time, self.begin_times[i])
+            temp_end_time = min(end_time, self.end_times[i])
+            value = self.values[i]
             line_tuples.append(((temp_begin_time, temp_end_time),(value, value)))
         return line_tuples
 
@@ -54,6 +54,50 @@ return specific results:
         Procedure must return the value of the parameter in the given
         time range.
 
+`modify` procedures which change every value independently of others
+may also contain:
+    <function> elementwise(<numpy array> data, <dict> arguments)
+        Function modifying given values in place, e.g. with NumPy
+        ufuncs and their `out` argument. Arguments are interpreted by
+        `interpret_arguments` beforehand. It allows
+        `modify_wave_in_place` to modify a `Wave` without copying its
+        values.
+
+`points` procedures whose points depend only on the signal near them
+may also contain:
+    <function> chunk_overlap(<dict> arguments)
+        Function returning the time in seconds of signal needed before
+        and after a chunk of the time range to find the same points
+        within it as in the whole range. Arguments are interpreted by
+        `interpret_arguments` beforehand. It allows
+        `find_points_parallel` to split the time range into chunks.
+    <function> chunk_arguments(<dict> waves, <dict> points,
+                               <float> begin_time, <float> end_time,
+                               <dict> arguments)
+        Function returning arguments given to the procedure in every
+        chunk of `find_points_parallel`, e.g. with values which the
+        procedure otherwise calculates over the whole time range.
+        Arguments are interpreted by `interpret_arguments` beforehand.
+
+`parameter` procedures may also contain:
+    <function> procedure_vectorized(<dict> waves, <dict> points,
+                                    <numpy array> begin_times,
+                                    <numpy array> end_times,
+                                    <dict> arguments)
+        Function returning an array of values of the parameter in all
+        given time ranges at once. Arguments are interpreted by
+        `interpret_arguments` beforehand. It is used by
+        `calculate_parameter` instead of calling `execute` for every
+        time range.
+
+Procedures may use functions from the last section of this module,
+which implement steps common to many of them, e.g. finding peaks
+with an adaptive threshold in `find_threshold_peaks`.
+
+Outputs of procedures may be cached in a `Result_cache` given to the
+functions running them, so that running a procedure again with the
+same inputs and arguments doesn't recalculate them.
+
 Sample usage:
     butterworth = analyzer.import_procedure("modify_filter_butterworth")
     arguments = butterworth.default_arguments
@@ -63,9 +107,21 @@ Sample usage:
     complete_data.waves['bp'].replace_slice(60, 70, filtered_wave)
 """
 
+import ast
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
 import importlib.util
 import glob
+import hashlib
+import json
+from multiprocessing import shared_memory
 import os
+import sys
+import threading
+import types
+
+import numpy as np
 
 import sigman as sm
 
@@ -146,18 +202,146 @@ def dictify_procedures(type_filter="",
     list_ = list_procedures(type_filter, procedure_directory=procedure_directory)
     return {_get_module_from_path(path): path for path in list_}
 
+# Modules imported by `_import_module_from_path`, as
+# `<path>:(<modification time>, <module>)` pairs
+_procedure_modules = {}
+# Results of `read_procedure_metadata`, as
+# `<path>:(<modification time>, <metadata>, <names>)` pairs
+_procedure_metadata = {}
+
+METADATA_ATTRIBUTES = [
+    "procedure_type",
+    "description",
+    "author",
+    "arguments",
+    "default_arguments",
+    "output_type",
+    "required_waves",
+    "required_points"]
+
+def clear_procedure_cache():
+    """Forgets all imported procedure modules and read metadata, so
+    that they are read from their files again when needed."""
+    _procedure_modules.clear()
+    _procedure_metadata.clear()
+
+def _modification_time(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        raise FileNotFoundError("Module file {} not found".format(path))
+
 def _import_module_from_path(path, package_prefix):
-    """Imports a module from a file with the given path."""
-    module_name = _get_module_from_path(path)
-    spec = importlib.util.spec_from_file_location(package_prefix+module_name,
-                                                  path)
+    """Imports a module from a file with the given path.
+
+    Modules are executed only once and then kept in a cache, unless
+    their file is modified in the meantime.
+    """
+    path = os.path.abspath(path)
+    modification_time = _modification_time(path)
+    cached = _procedure_modules.get(path)
+    if cached is not None and cached[0] == modification_time:
+        return cached[1]
+    module_name = package_prefix+_get_module_from_path(path)
+    spec = importlib.util.spec_from_file_location(module_name, path)
     if spec is None:
         raise FileNotFoundError("Module file {} not found".format(path))
     procedure = importlib.util.module_from_spec(spec)
-    spec.loader.exec_module(procedure)
-    procedure = importlib.import_module(package_prefix+module_name)
+    # The module is registered like an ordinary import, so that
+    # objects defined in it may be pickled
+    previous_module = sys.modules.get(module_name)
+    sys.modules[module_name] = procedure
+    try:
+        spec.loader.exec_module(procedure)
+    except BaseException:
+        if previous_module is None:
+            del sys.modules[module_name]
+        else:
+            sys.modules[module_name] = previous_module
+        raise
+    _procedure_modules[path] = (modification_time, procedure)
     return procedure
 
+def read_procedure_metadata(path):
+    """Reads attributes listed in `METADATA_ATTRIBUTES` from a procedure
+    file without executing it.
+
+    Returns a `dict` of `<attribute>:<value>` pairs and a set of names
+    defined at the top level of the module, or None if they can't all
+    be found, e.g. because some are defined conditionally. Attributes
+    whose values are not plain literals are left out of the `dict`.
+    """
+    path = os.path.abspath(path)
+    modification_time = _modification_time(path)
+    cached = _procedure_metadata.get(path)
+    if cached is not None and cached[0] == modification_time:
+        return cached[1], cached[2]
+    with open(path, encoding='utf-8') as file_:
+        tree = ast.parse(file_.read(), path)
+    metadata = {}
+    names = set()
+    for node in tree.body:
+        if isinstance(node, (ast.FunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            for alias in node.names:
+                names.add(alias.asname or alias.name.split('.')[0])
+        elif isinstance(node, (ast.Assign, ast.AnnAssign)):
+            targets = (node.targets if isinstance(node, ast.Assign)
+                       else [node.target])
+            for target in targets:
+                for name_node in ast.walk(target):
+                    if isinstance(name_node, ast.Name):
+                        names.add(name_node.id)
+                if (not isinstance(target, ast.Name)
+                        or target.id not in METADATA_ATTRIBUTES):
+                    continue
+                metadata.pop(target.id, None)
+                try:
+                    metadata[target.id] = ast.literal_eval(node.value)
+                except (ValueError, TypeError, SyntaxError):
+                    pass
+        elif not isinstance(node, ast.Expr):
+            names = None
+            break
+    _procedure_metadata[path] = (modification_time, metadata, names)
+    return metadata, names
+
+class Lazy_procedure:
+    """Procedure whose module is executed only once an attribute other
+    than its metadata is needed, e.g. `execute`.
+
+    Metadata is read with `read_procedure_metadata`, so listing
+    procedures doesn't import the modules they use.
+    """
+
+    def __init__(self, path, package_prefix, metadata, names):
+        self.path = os.path.abspath(path)
+        self.package_prefix = package_prefix
+        self.metadata = metadata
+        self.names = names
+        self.__name__ = package_prefix+_get_module_from_path(path)
+        self.__file__ = self.path
+
+    @property
+    def module(self):
+        """The imported procedure module."""
+        return _import_module_from_path(self.path, self.package_prefix)
+
+    def __getattr__(self, name):
+        # Only called for attributes not found in the usual way
+        if name.startswith('__') or name in ('metadata', 'names'):
+            raise AttributeError(name)
+        if name in self.metadata:
+            return self.metadata[name]
+        if self.names is not None and name not in self.names:
+            raise AttributeError("Procedure {} has no attribute {}".format(
+                self.__name__, name))
+        return getattr(self.module, name)
+
+    def __repr__(self):
+        return "<procedure {} from {}>".format(self.__name__, self.path)
+
 def import_procedure(procedure_name, package_prefix='procedures.',
                      procedure_directory=SIGMAN_ROOT+"procedures/"):
     """Imports a procedure from a file given its module name or path.
@@ -169,7 +353,8 @@ def import_procedure(procedure_name, package_prefix='procedures.',
     
     Once a file is found it will be imported like any ordinary python
     module and then validated whether or not it is compatible with our
-    API. If not, `InvalidProcedureError` will be raised.
+    API. If not, `InvalidProcedureError` will be raised. Imported
+    modules are cached, so importing a procedure again is cheap.
     """
     try:
         procedure = _import_module_from_path(procedure_name, package_prefix)
@@ -186,11 +371,38 @@ def import_procedure(procedure_name, package_prefix='procedures.',
         raise InvalidProcedureError(error_message)
     return procedure
 
+def _lazy_procedure(path, package_prefix):
+    """Returns a validated `Lazy_procedure` for a procedure file, or its
+    imported module if its metadata can't be read without executing
+    it."""
+    metadata, names = read_procedure_metadata(path)
+    if names is None or any(attribute in names
+                            and attribute not in metadata
+                            for attribute in METADATA_ATTRIBUTES):
+        procedure = _import_module_from_path(path, package_prefix)
+    else:
+        procedure = Lazy_procedure(path, package_prefix, metadata, names)
+        attributes = dict.fromkeys(names)
+        attributes.update(metadata)
+        attributes = types.SimpleNamespace(**attributes)
+        valid, error_message = validate_procedure_compatibility(attributes)
+        if not valid:
+            raise InvalidProcedureError(error_message)
+        return procedure
+    valid, error_message = validate_procedure_compatibility(procedure)
+    if not valid:
+        raise InvalidProcedureError(error_message)
+    return procedure
+
 def import_procedures(type_filter="", package_prefix='procedures.',
                       procedure_directory=SIGMAN_ROOT+"procedures/",
                       safe=False):
-    """Runs `import_procedure` on the output of `list_procedures` and
-    returns a list of imported procedures.
+    """Returns a list of procedures from files found by
+    `list_procedures`.
+
+    Procedures are returned as `Lazy_procedure` objects whose modules
+    are imported only when the procedure is used, so listing them is
+    cheap. They may be used like modules returned by `import_procedure`.
     
     If `safe` is False `InvalidProcedureError` exceptions will be
     skipped.
@@ -200,63 +412,1057 @@ def import_procedures(type_filter="", package_prefix='procedures.',
     procedure_list = []
     for procedure_path in list_:
         try:
-            procedure_list.append(import_procedure(
-                procedure_path,
-                package_prefix=package_prefix,
-                procedure_directory=procedure_directory))
+            procedure_list.append(_lazy_procedure(procedure_path,
+                                                  package_prefix))
         except InvalidProcedureError:
             if safe:
                 raise
     return procedure_list
 
+### ~~~ Result cache ~~~ ###
+
+def _hash_arrays(hash_, *arrays):
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        hash_.update(repr((array.dtype.str, array.shape)).encode())
+        hash_.update(memoryview(array).cast('B'))
+
+def fingerprint_data(data):
+    """Returns a hex digest of the values of a `Wave`, `Points` or
+    `Parameter`."""
+    hash_ = hashlib.blake2b(digest_size=16)
+    hash_.update(repr((type(data).__name__, data.type)).encode())
+    if isinstance(data, sm.Wave):
+        hash_.update(repr((data.sample_rate, data.offset)).encode())
+        _hash_arrays(hash_, data.data)
+    elif isinstance(data, sm.Points):
+        _hash_arrays(hash_, data.data_x, data.data_y)
+    else:
+        _hash_arrays(hash_, data.begin_times, data.end_times, data.values)
+    return hash_.hexdigest()
+
+# Digests of files calculated by `fingerprint_file`, as
+# `<path>:(<modification time>, <digest>)` pairs
+_file_fingerprints = {}
+
+def fingerprint_file(file_name):
+    """Returns a hex digest of the contents of a file.
+
+    Digests are cached until the file is modified.
+    """
+    path = os.path.abspath(file_name)
+    modification_time = os.stat(path).st_mtime_ns
+    cached = _file_fingerprints.get(path)
+    if cached is not None and cached[0] == modification_time:
+        return cached[1]
+    hash_ = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as file_:
+        for block in iter(lambda: file_.read(1 << 20), b''):
+            hash_.update(block)
+    _file_fingerprints[path] = (modification_time, hash_.hexdigest())
+    return hash_.hexdigest()
+
+def library_fingerprint():
+    """Returns a hex digest of the modules of sigman which run
+    procedures and define data types, so that outputs cached by
+    a different version are not used."""
+    hash_ = hashlib.blake2b(digest_size=16)
+    for file_name in (__file__, sm.__file__):
+        hash_.update(fingerprint_file(file_name).encode())
+    return hash_.hexdigest()
+
+def fingerprint_argument_files(arguments):
+    """Returns a `dict` of hex digests of files named by arguments,
+    e.g. a neural network loaded by a procedure.
+
+    Relative paths not found in the working directory are looked up in
+    `SIGMAN_ROOT`, like procedures do. Arguments which don't name
+    existing files are left out.
+    """
+    fingerprints = {}
+    for key, value in arguments.items():
+        if not isinstance(value, str) or not value:
+            continue
+        for path in (value, SIGMAN_ROOT + value):
+            if os.path.isfile(path):
+                fingerprints[key] = fingerprint_file(path)
+                break
+            if os.path.isabs(value):
+                break
+    return fingerprints
+
+def result_key(procedure, arguments, waves, points, time_range):
+    """Returns a key of `Result_cache` identifying the output of a
+    procedure.
+
+    The key is a digest of the procedure file, arguments, files named
+    by them, time range, values of waves and points required by the
+    procedure and `library_fingerprint`. Argument values are compared
+    as strings, the way they are given in QtSigman, so e.g. 3 and '3'
+    are the same.
+
+    Arguments:
+        procedure  - imported procedure
+        arguments  - `dict` of arguments of the procedure
+        waves      - `dict` of `Wave` instances given to the procedure
+        points     - `dict` of `Points` instances, or None
+        time_range - JSON serializable description of the time range
+    """
+    required_points = getattr(procedure, 'required_points', [])
+    description = {
+        'procedure':fingerprint_file(procedure.__file__),
+        'arguments':{key: str(value) for key, value in arguments.items()},
+        'files':fingerprint_argument_files(arguments),
+        'waves':{key: fingerprint_data(wave)
+                 for key, wave in waves.items()},
+        'points':{key: fingerprint_data(points[key])
+                  for key in required_points
+                  if points and key in points},
+        'time_range':time_range,
+        'library':library_fingerprint()}
+    hash_ = hashlib.blake2b(digest_size=16)
+    hash_.update(json.dumps(description, sort_keys=True).encode())
+    return hash_.hexdigest()
+
+class Result_cache:
+    """Cache of outputs of procedures, used by functions running them
+    when given as their `cache` argument.
+
+    Outputs are stored under keys calculated by `result_key` from the
+    content of their inputs, so they are found again e.g. after a
+    project is reloaded. They are kept in memory and optionally in
+    .npz files in a directory. Least recently used outputs are
+    forgotten once either exceeds its size limit.
+
+    Attributes:
+        Result_cache.directory   - directory of the disk tier, or None
+        Result_cache.memory_size - maximum number of bytes of arrays
+                                   kept in memory
+        Result_cache.disk_size   - maximum number of bytes of files in
+                                   the directory
+    """
+
+    def __init__(self, directory=None, memory_size=256*2**20,
+                 disk_size=2**30):
+        self.directory = directory
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self._memory = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npz')
+
+    def get(self, key):
+        """Returns a `dict` of arrays stored under a key, or None."""
+        with self._lock:
+            arrays = self._memory.get(key)
+            if arrays is not None:
+                self._memory.move_to_end(key)
+        if arrays is not None:
+            self._touch(key)
+            return arrays
+        if self.directory is None:
+            return None
+        path = self._path(key)
+        try:
+            with np.load(path, allow_pickle=False) as file_:
+                arrays = {name: file_[name] for name in file_.files}
+        except (OSError, ValueError):
+            return None
+        self._touch(key)
+        self._remember(key, arrays)
+        return arrays
+
+    def _touch(self, key):
+        # Modification times order files by their last use
+        if self.directory is not None:
+            try:
+                os.utime(self._path(key))
+            except OSError:
+                pass
+
+    def put(self, key, arrays):
+        """Stores a `dict` of arrays under a key."""
+        # Copied, so that later changes to the arrays aren't stored
+        arrays = {name: np.array(array) for name, array in arrays.items()}
+        self._remember(key, arrays)
+        if self.directory is None:
+            return
+        path = self._path(key)
+        temporary_path = '{}.{}.{}.tmp.npz'.format(
+            path[:-len('.npz')], os.getpid(), threading.get_ident())
+        np.savez(temporary_path, **arrays)
+        os.replace(temporary_path, path)
+        self._evict_files()
+
+    def _remember(self, key, arrays):
+        size = sum(array.nbytes for array in arrays.values())
+        if size > self.memory_size:
+            return
+        with self._lock:
+            if key in self._memory:
+                self._memory_used -= sum(
+                    array.nbytes for array in self._memory[key].values())
+            self._memory[key] = arrays
+            self._memory.move_to_end(key)
+            self._memory_used += size
+            while self._memory_used > self.memory_size:
+                _, forgotten = self._memory.popitem(last=False)
+                self._memory_used -= sum(array.nbytes
+                                         for array in forgotten.values())
+
+    def _evict_files(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npz') and '.tmp.' not in entry.name:
+                stat = entry.stat()
+                files.append((stat.st_mtime_ns, stat.st_size, entry.path))
+        total_size = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total_size <= self.disk_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        """Removes all stored outputs."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+        if self.directory is not None:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.npz'):
+                    os.remove(entry.path)
+
 ### ~~~ Execution ~~~ ###
 
 def modify_wave(wave, points, begin_time, end_time, 
                 procedure, arguments, 
-                wave_type=None):
-    """Runs a `modify` procedure and returns a Wave corresponding to its output."""
+                wave_type=None, cache=None):
+    """Runs a `modify` procedure and returns a Wave corresponding to
+    its output.
+
+    If a `Result_cache` is given as `cache`, the output is taken from
+    it if the procedure has already been run with the same inputs.
+    """
     if wave_type is None:
         wave_type = wave.type
-    modified_data = procedure.execute(wave, points, begin_time, end_time, arguments)
+    if cache is None:
+        modified_data = procedure.execute(wave, points, begin_time,
+                                          end_time, arguments)
+    else:
+        key = result_key(procedure, arguments, {'':wave}, points,
+                         [begin_time, end_time])
+        cached = cache.get(key)
+        if cached is None:
+            modified_data = procedure.execute(wave, points, begin_time,
+                                              end_time, arguments)
+            cache.put(key, {'data':modified_data})
+        else:
+            modified_data = cached['data']
     return sm.Wave(modified_data, 
                    len(modified_data)/(end_time-begin_time), wave_type)
-    
-def find_points(waves, points, begin_time, end_time, 
-                procedure, arguments):
-    """Runs a `points` procedure and returns a `Points` instance
-    corresponding to its output.
+
+def modify_wave_in_place(wave, points, begin_time, end_time,
+                         procedure, arguments, cache=None):
+    """Runs a `modify` procedure and replaces the values of the Wave
+    in the time range with its output.
+
+    Procedures with an `elementwise` function modify floating point
+    values in place, without copying them. Their outputs are not
+    cached, as modifying the values is quicker than finding them in
+    `cache`. Other values, e.g. integer samples of a raw recording
+    mapped with `Wave.open_mmap`, are replaced like with other
+    procedures.
     """
+    if (not hasattr(procedure, 'elementwise')
+            or not np.issubdtype(wave.data.dtype, np.floating)):
+        modified_wave = modify_wave(wave, points, begin_time, end_time,
+                                    procedure, arguments, cache=cache)
+        wave.replace_slice(begin_time, end_time, modified_wave)
+        return
+    if len(procedure.arguments) > 0:
+        arguments = procedure.interpret_arguments(wave, points, arguments)
+    wave.apply_slice(begin_time, end_time,
+                     lambda data: procedure.elementwise(data, arguments))
+    
+def _check_required(procedure, waves, points):
+    """Raises a ValueError if not all waves and points required by
+    a procedure are given."""
     if (procedure.required_waves
         and not all(wave in waves for wave in procedure.required_waves)):
         raise ValueError('Not all waves from {} provided.'.format(
             procedure.required_waves))
     if (procedure.required_points
-        and not all(points_ in points for points_ in procedure.required_points)):
+        and not all(points_ in points
+                    for points_ in procedure.required_points)):
         raise ValueError('Not all points from {} provided.'.format(
             procedure.required_points))
+
+def find_points(waves, points, begin_time, end_time, 
+                procedure, arguments, cache=None):
+    """Runs a `points` procedure and returns a `Points` instance
+    corresponding to its output.
+
+    If a `Result_cache` is given as `cache`, the output is taken from
+    it if the procedure has already been run with the same inputs.
+    """
+    _check_required(procedure, waves, points)
+    if cache is not None:
+        required_waves = {name: waves[name]
+                          for name in procedure.required_waves}
+        key = result_key(procedure, arguments, required_waves, points,
+                         [begin_time, end_time])
+        cached = cache.get(key)
+        if cached is not None:
+            return sm.Points(cached['x'], cached['y'],
+                             procedure.output_type)
     found_points_x, found_points_y = procedure.execute(
         waves, points,
         begin_time, end_time, 
         arguments)
+    if cache is not None:
+        cache.put(key, {'x':found_points_x, 'y':found_points_y})
     return sm.Points(found_points_x, found_points_y, procedure.output_type)
 
+def _share_wave(wave):
+    """Copies the values of a `Wave` into shared memory and returns the
+    `SharedMemory` along with a description from which `_shared_wave`
+    recreates the `Wave` in another process."""
+    data = np.ascontiguousarray(wave.data)
+    shared = shared_memory.SharedMemory(create=True,
+                                        size=max(data.nbytes, 1))
+    np.ndarray(data.shape, data.dtype, buffer=shared.buf)[:] = data
+    description = (shared.name, data.shape, data.dtype.str,
+                   wave.sample_rate, wave.type, wave.offset)
+    return shared, description
+
+def _shared_wave(description):
+    """Returns a `Wave` using values in shared memory described by
+    `_share_wave`, along with the `SharedMemory` to close afterwards."""
+    name, shape, dtype, sample_rate, wave_type, offset = description
+    shared = shared_memory.SharedMemory(name=name)
+    data = np.ndarray(shape, dtype, buffer=shared.buf)
+    return (sm.Wave(data, sample_rate, wave_type, offset, copy=False),
+            shared)
+
+def _share_waves(waves):
+    """Runs `_share_wave` on a `dict` of waves and returns a list of
+    `SharedMemory` instances to unlink afterwards along with a `dict`
+    of descriptions."""
+    shared_list = []
+    descriptions = {}
+    try:
+        for key, wave in waves.items():
+            shared, descriptions[key] = _share_wave(wave)
+            shared_list.append(shared)
+    except BaseException:
+        _unlink_shared(shared_list)
+        raise
+    return shared_list, descriptions
+
+def _shared_waves(descriptions):
+    """Runs `_shared_wave` on a `dict` of descriptions and returns a
+    `dict` of waves along with a list of `SharedMemory` instances to
+    close afterwards."""
+    waves = {}
+    shared_list = []
+    for key, description in descriptions.items():
+        waves[key], shared = _shared_wave(description)
+        shared_list.append(shared)
+    return waves, shared_list
+
+def _unlink_shared(shared_list):
+    for shared in shared_list:
+        shared.close()
+        shared.unlink()
+
+def _procedure_location(procedure):
+    """Returns the path and package prefix with which a procedure may
+    be imported again in a worker process."""
+    module_name = _get_module_from_path(procedure.__file__)
+    return procedure.__file__, procedure.__name__[:-len(module_name)]
+
+def _find_points_in_chunk(procedure_path, package_prefix, wave_descriptions,
+                          points, begin_time, end_time, arguments):
+    """Runs a `points` procedure in one chunk of `find_points_parallel`
+    in a worker process."""
+    procedure = import_procedure(procedure_path, package_prefix)
+    waves, shared_list = _shared_waves(wave_descriptions)
+    try:
+        points_x, points_y = procedure.execute(waves, points,
+                                               begin_time, end_time,
+                                               arguments)
+        # Copied, so that no views of shared memory remain once it is
+        # closed
+        return (np.array(points_x, dtype=np.float64),
+                np.array(points_y, dtype=np.float64))
+    finally:
+        del waves
+        for shared in shared_list:
+            shared.close()
+
+def _chunk_begin_time(wave, begin_time, time):
+    """Returns a time close to `time` which lies a whole number of
+    samples of `wave` after `begin_time`, so that points found from it
+    lie on the same samples as those found from `begin_time`."""
+    sample_count = int(round((time-begin_time) / wave.sample_length))
+    wanted_i = wave.sample_at(begin_time) + sample_count
+    time = begin_time + sample_count*wave.sample_length
+    # Rounding errors may place the time just before the wanted sample
+    while wave.sample_at(time) < wanted_i:
+        time = np.nextafter(time, np.inf)
+    return time
+
+def find_points_parallel(waves, points, begin_time, end_time,
+                         procedure, arguments, chunk_length=600,
+                         overlap=None, max_workers=None, cache=None):
+    """Runs a `points` procedure like `find_points`, but in chunks of
+    the time range executed in parallel by worker processes.
+
+    Each chunk is extended on both sides by `overlap` seconds, so that
+    the procedure has enough signal to settle before the points it
+    finds within the chunk itself. Only those points are kept, so
+    points within overlapping parts are not duplicated. As long as the
+    procedure depends only on the signal within `overlap` of a point,
+    the output is the same as that of `find_points`. Values of waves
+    are passed to workers through shared memory instead of being
+    copied for every chunk.
+
+    Arguments:
+        waves        - `dict` of `Wave` instances, like in
+                       `find_points`
+        points       - `dict` of `Points` instances
+        begin_time   - beginning of the time range
+        end_time     - end of the time range
+        procedure    - imported `points` procedure
+        arguments    - `dict` of arguments of the procedure
+        chunk_length - length of a chunk in seconds, without overlap
+        overlap      - time in seconds by which chunks are extended on
+                       both sides. By default it is taken from the
+                       `chunk_overlap` function of the procedure.
+        max_workers  - number of worker processes; by default the
+                       number of processors
+        cache        - `Result_cache` in which the output is looked up
+                       before running the procedure, or None
+    """
+    if chunk_length <= 0:
+        raise ValueError("Chunk length must be greater than 0, is "
+                         "{}".format(chunk_length))
+    if overlap is None and not hasattr(procedure, 'chunk_overlap'):
+        raise ValueError("Procedure {} does not declare its overlap; "
+                         "`overlap` must be given".format(
+                             procedure.__name__))
+    interpreted_arguments = arguments
+    if len(procedure.arguments) > 0:
+        interpreted_arguments = procedure.interpret_arguments(
+            waves, points, arguments)
+    if overlap is None:
+        overlap = procedure.chunk_overlap(interpreted_arguments)
+    chunk_count = int(np.ceil((end_time-begin_time) / chunk_length))
+    if chunk_count <= 1:
+        return find_points(waves, points, begin_time, end_time,
+                           procedure, arguments, cache=cache)
+    _check_required(procedure, waves, points)
+    waves = {name: waves[name] for name in procedure.required_waves}
+    if points is not None:
+        points = {key: points[key] for key in procedure.required_points}
+    if cache is not None:
+        # Chunks may give slightly different points than a single run
+        key = result_key(procedure, arguments, waves, points,
+                         [begin_time, end_time, chunk_length, overlap])
+        cached = cache.get(key)
+        if cached is not None:
+            return sm.Points(cached['x'], cached['y'],
+                             procedure.output_type)
+    # Chunks own points from their beginning up to the beginning of the
+    # next one
+    bounds = begin_time + chunk_length*np.arange(chunk_count+1)
+    bounds[-1] = end_time
+    chunk_ranges = []
+    for i in range(chunk_count):
+        chunk_begin = max(begin_time, bounds[i]-overlap)
+        chunk_end = min(end_time, bounds[i+1]+overlap)
+        if waves:
+            chunk_begin = _chunk_begin_time(
+                waves[procedure.required_waves[0]], begin_time, chunk_begin)
+        chunk_ranges.append((chunk_begin, chunk_end))
+
+    chunk_arguments = arguments
+    if hasattr(procedure, 'chunk_arguments'):
+        chunk_arguments = procedure.chunk_arguments(
+            waves, points, begin_time, end_time, interpreted_arguments)
+
+    procedure_path, package_prefix = _procedure_location(procedure)
+    shared_list, wave_descriptions = _share_waves(waves)
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(
+                _find_points_in_chunk, procedure_path, package_prefix,
+                wave_descriptions, points, chunk_begin, chunk_end,
+                chunk_arguments)
+                for chunk_begin, chunk_end in chunk_ranges]
+            results = [future.result() for future in futures]
+    finally:
+        _unlink_shared(shared_list)
+
+    found_x = []
+    found_y = []
+    for i, (points_x, points_y) in enumerate(results):
+        if i == chunk_count-1:
+            owned = points_x >= bounds[i]
+        else:
+            owned = (points_x >= bounds[i]) & (points_x < bounds[i+1])
+        found_x.append(points_x[owned])
+        found_y.append(points_y[owned])
+    found_x = np.concatenate(found_x)
+    found_y = np.concatenate(found_y)
+    if cache is not None:
+        cache.put(key, {'x':found_x, 'y':found_y})
+    return sm.Points(found_x, found_y, procedure.output_type)
+
+def generate_windows(begin_time, end_time, length, step=None):
+    """Returns an array of `(begin, end)` rows of time windows of a
+    given length within a time range, which may be used as
+    `time_tuples` of `calculate_parameter`.
+
+    Only windows which fit entirely within the time range are returned.
+
+    Arguments:
+        begin_time - beginning of the time range
+        end_time   - end of the time range
+        length     - length of a window in seconds
+        step       - time in seconds between beginnings of consecutive
+                     windows. By default it is equal to `length`, so
+                     windows follow one another; a shorter step gives
+                     sliding, overlapping windows.
+    """
+    if step is None:
+        step = length
+    if length <= 0 or step <= 0:
+        raise ValueError("Window length and step must be greater than 0, "
+                         "are {} and {}".format(length, step))
+    window_count = int(np.floor((end_time-begin_time-length) / step)) + 1
+    begin_times = begin_time + step*np.arange(max(window_count, 0))
+    return np.column_stack((begin_times, begin_times+length))
+
+def _calculate_parameter_in_batch(procedure_path, package_prefix,
+                                  wave_descriptions, points, time_tuples,
+                                  arguments):
+    """Runs a `parameter` procedure in a batch of time ranges of
+    `calculate_parameter` in a worker process."""
+    procedure = import_procedure(procedure_path, package_prefix)
+    waves, shared_list = _shared_waves(wave_descriptions)
+    try:
+        return [procedure.execute(waves, points, begin_time, end_time,
+                                  arguments)
+                for begin_time, end_time in time_tuples]
+    finally:
+        del waves
+        for shared in shared_list:
+            shared.close()
+
 def calculate_parameter(waves, points, time_tuples,
-                        procedure, arguments):
+                        procedure, arguments, max_workers=1,
+                        batch_size=256, cache=None):
     """Runs a `parameter` procedure in given time ranges and returns 
-    a `Parameter`."""
-    if (procedure.required_waves
-        and not all(wave in waves for wave in procedure.required_waves)):
-        raise ValueError('Not all waves from {} provided.'.format(
-            procedure.required_waves))
-    if (procedure.required_points
-        and not all(points_ in points for points_ in procedure.required_points)):
-        raise ValueError('Not all points from {} provided.'.format(
-            procedure.required_points))
-    parameter = sm.Parameter(procedure.output_type)
-    for begin_time, end_time in time_tuples:
-        value = procedure.execute(
-            waves, points,
-            begin_time, end_time,
-            arguments)
-        parameter.add_value(begin_time, end_time, value)
-    return parameter
+    a `Parameter`.
+
+    Procedures with a `procedure_vectorized` function calculate all
+    values at once. Otherwise, if `max_workers` is other than 1, time
+    ranges are split into batches executed in parallel by worker
+    processes, which read values of waves from shared memory.
+
+    If a `Result_cache` is given as `cache`, the output is taken from
+    it if the procedure has already been run with the same inputs.
+
+    Arguments:
+        waves       - `dict` of `Wave` instances
+        points      - `dict` of `Points` instances
+        time_tuples - list of `(begin, end)` tuples of time ranges,
+                      e.g. from `generate_windows`
+        procedure   - imported `parameter` procedure
+        arguments   - `dict` of arguments of the procedure
+        max_workers - number of worker processes; None for the number
+                      of processors
+        batch_size  - number of time ranges executed by a worker at
+                      once
+        cache       - `Result_cache` or None
+    """
+    _check_required(procedure, waves, points)
+    time_tuples = np.asarray(time_tuples, dtype=np.float64).reshape(-1, 2)
+    begin_times = time_tuples[:, 0]
+    end_times = time_tuples[:, 1]
+    if cache is not None:
+        required_waves = {name: waves[name]
+                          for name in procedure.required_waves}
+        key = result_key(procedure, arguments, required_waves, points,
+                         time_tuples.tolist())
+        cached = cache.get(key)
+        if cached is not None:
+            return sm.Parameter.fromArrays(procedure.output_type,
+                                           begin_times, end_times,
+                                           cached['values'])
+    if hasattr(procedure, 'procedure_vectorized'):
+        if len(procedure.arguments) > 0:
+            arguments = procedure.interpret_arguments(waves, points,
+                                                      arguments)
+        values = procedure.procedure_vectorized(waves, points, begin_times,
+                                                end_times, arguments)
+    elif max_workers == 1 or len(time_tuples) <= batch_size:
+        values = [procedure.execute(waves, points, begin_time, end_time,
+                                    arguments)
+                  for begin_time, end_time in time_tuples]
+    else:
+        waves = {name: waves[name] for name in procedure.required_waves}
+        if points is not None:
+            points = {key: points[key] for key in procedure.required_points}
+        procedure_path, package_prefix = _procedure_location(procedure)
+        shared_list, wave_descriptions = _share_waves(waves)
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as executor:
+                futures = [executor.submit(
+                    _calculate_parameter_in_batch, procedure_path,
+                    package_prefix, wave_descriptions, points,
+                    time_tuples[i:i+batch_size], arguments)
+                    for i in range(0, len(time_tuples), batch_size)]
+                values = [value for future in futures
+                          for value in future.result()]
+        finally:
+            _unlink_shared(shared_list)
+    if cache is not None:
+        # None can't be stored in an array of numbers
+        cache.put(key, {'values':[np.nan if value is None else value
+                                  for value in values]})
+    return sm.Parameter.fromArrays(procedure.output_type, begin_times,
+                                   end_times, values)
+
+### ~~~ Tools for procedures ~~~ ###
+
+def five_point_derivative(data):
+    """Returns the five point derivative of an array of samples, 
+    `(-x[i-2] - 2x[i-1] + 2x[i+1] + x[i+2]) / 8`, with zeros in place
+    of the first and last two values.
+    """
+    derivative = np.zeros(len(data))
+    derivative[2:-2] = (1/8) * (-data[:-4]-2*data[1:-3]+2*data[3:-1]
+                                +data[4:])
+    return derivative
+
+def window_sum(values, half_window):
+    """Returns an array of sums of `values[i-half_window:i+half_window]`
+    for each i, with zeros where the window does not fit in the array.
+    """
+    sums = np.zeros(len(values))
+    if half_window > 0 and len(values) > 2*half_window:
+        sums[half_window:-half_window] = moving_sum(
+            values, 2*half_window)[half_window:-half_window]
+    return sums
+
+# Moving window statistics. The window of value i is
+# `data[i-width//2:i-width//2+width]`, and `edges` decides what happens
+# where it does not fit in the data:
+#   'shrink'  - only values within the data are used
+#   'nearest' - the data is extended by repeating the edge values
+#   'reflect' - the data is extended by reflecting it about its edges
+#   'nan'     - the output is NaN
+EDGE_MODES = ['shrink', 'nearest', 'reflect', 'nan']
+
+def _window_sums(data, width, edges):
+    """Returns moving sums of an array along with the number of values
+    in each window."""
+    if width < 1:
+        raise ValueError("Window width must be at least 1, is {}".format(
+            width))
+    if edges not in EDGE_MODES:
+        raise ValueError("Invalid edge mode {}".format(edges))
+    before = width // 2
+    after = width - 1 - before
+    if edges in ['nearest', 'reflect']:
+        padding_mode = 'edge' if edges == 'nearest' else 'symmetric'
+        padded = np.pad(data, (before, after), mode=padding_mode)
+        cumulative = np.concatenate(([0], np.cumsum(padded)))
+        sums = cumulative[width:] - cumulative[:-width]
+        return sums, np.full(len(data), width)
+    cumulative = np.concatenate(([0], np.cumsum(data)))
+    indices = np.arange(len(data))
+    begins = np.clip(indices - before, 0, len(data))
+    ends = np.clip(indices + after + 1, 0, len(data))
+    sums = cumulative[ends] - cumulative[begins]
+    counts = ends - begins
+    if edges == 'nan':
+        sums[counts < width] = np.nan
+    return sums, counts
+
+def moving_sum(data, width, edges='shrink'):
+    """Returns sums of values in a moving window of `width` values,
+    calculated from a cumulative sum. See `EDGE_MODES`."""
+    data = np.asarray(data, dtype=np.float64)
+    return _window_sums(data, width, edges)[0]
+
+def moving_mean(data, width, edges='shrink'):
+    """Returns means of values in a moving window of `width` values.
+    See `EDGE_MODES`."""
+    data = np.asarray(data, dtype=np.float64)
+    sums, counts = _window_sums(data, width, edges)
+    return sums / counts
+
+def moving_var(data, width, edges='shrink'):
+    """Returns variances of values in a moving window of `width`
+    values. See `EDGE_MODES`."""
+    data = np.asarray(data, dtype=np.float64)
+    # Centering the data limits the loss of precision when subtracting
+    # the squared mean from the mean of squares
+    if len(data) > 0:
+        data = data - np.mean(data)
+    sums, counts = _window_sums(data, width, edges)
+    square_sums, _ = _window_sums(data**2, width, edges)
+    means = sums / counts
+    return np.maximum(square_sums/counts - means**2, 0)
+
+def moving_rms(data, width, edges='shrink'):
+    """Returns root mean squares of values in a moving window of
+    `width` values. See `EDGE_MODES`."""
+    data = np.asarray(data, dtype=np.float64)
+    square_sums, counts = _window_sums(data**2, width, edges)
+    return np.sqrt(square_sums / counts)
+
+def _moving_extremum(filter_name, fill_value, data, width, edges):
+    # scipy is only imported when needed, as it takes long to import
+    from scipy import ndimage
+    filter_ = getattr(ndimage, filter_name)
+    if width < 1:
+        raise ValueError("Window width must be at least 1, is {}".format(
+            width))
+    if edges not in EDGE_MODES:
+        raise ValueError("Invalid edge mode {}".format(edges))
+    data = np.asarray(data, dtype=np.float64)
+    if edges in ['nearest', 'reflect']:
+        return filter_(data, width, mode=edges)
+    output = filter_(data, width, mode='constant', cval=fill_value)
+    if edges == 'nan':
+        before = width // 2
+        after = width - 1 - before
+        output[:before] = np.nan
+        output[max(len(data)-after, 0):] = np.nan
+    return output
+
+def moving_min(data, width, edges='shrink'):
+    """Returns minima of values in a moving window of `width` values.
+    See `EDGE_MODES`."""
+    return _moving_extremum('minimum_filter1d', np.inf, data, width,
+                            edges)
+
+def moving_max(data, width, edges='shrink'):
+    """Returns maxima of values in a moving window of `width` values.
+    See `EDGE_MODES`."""
+    return _moving_extremum('maximum_filter1d', -np.inf, data, width,
+                            edges)
+
+def moving_median(data, half_window, recursive=False):
+    """Returns a copy of an array with every value replaced by the
+    median of `data[i-half_window:i+half_window+1]`. The first and last
+    `half_window` values, for which the window does not fit, are left
+    unchanged.
+
+    Arguments:
+        data        - array of values
+        half_window - number of values on each side of the median
+        recursive   - if True, medians replace values as they are
+                      calculated, so windows contain already filtered
+                      values to their left
+    """
+    data = np.asarray(data)
+    output = np.array(data, dtype=np.float64)
+    width = 2*half_window + 1
+    if half_window <= 0 or len(data) < width:
+        return output
+    if not recursive:
+        from scipy import ndimage
+        output[half_window:-half_window] = ndimage.median_filter(
+            output, size=width)[half_window:-half_window]
+        return output
+    # Python floats in lists are much quicker to handle one by one than
+    # numpy scalars
+    values = output.tolist()
+    window = sorted(values[:width])
+    for i in range(half_window, len(values)-half_window):
+        median = window[half_window]
+        # The next window loses the oldest filtered value and gains the
+        # median in place of the original value at i
+        del window[bisect_left(window, values[i-half_window])]
+        del window[bisect_left(window, values[i])]
+        values[i] = median
+        insort(window, median)
+        if i+half_window+1 < len(values):
+            insort(window, values[i+half_window+1])
+    return np.array(values)
+
+def _first_index(array, threshold, above, begin_i, block=1024):
+    """Returns the index of the first value of `array` from `begin_i`
+    onwards which is above `threshold`, or not above it if `above` is
+    False. Returns None if there is no such value.
+    
+    The array is searched in growing blocks, so the cost depends on
+    the distance to the found value rather than the length of the
+    array.
+    """
+    while begin_i < len(array):
+        end_i = min(begin_i + block, len(array))
+        if above:
+            mask = array[begin_i:end_i] > threshold
+        else:
+            mask = array[begin_i:end_i] <= threshold
+        i = int(np.argmax(mask))
+        if mask[i]:
+            return begin_i + i
+        begin_i = end_i
+        block *= 2
+    return None
+
+def _first_index_after(time, sample_length):
+    """Returns the lowest index `i` such that
+    `i*sample_length > time`."""
+    i = max(int(time/sample_length), 0)
+    while i*sample_length <= time:
+        i += 1
+    while i > 0 and (i-1)*sample_length > time:
+        i -= 1
+    return i
+
+def find_threshold_peaks(signal, data, sample_length, threshold_fraction,
+                         threshold_period, safe_period,
+                         extremum=np.argmax, timeout_factor=1.7):
+    """Returns an array of indices of peaks, e.g. R or SBP, found using
+    an adaptive threshold of a detection signal.
+
+    Every run of samples of `signal` above the threshold is a
+    candidate, and the sample within it chosen by `extremum` from
+    `data` is a peak, unless the run ends within `safe_period` of the
+    previous peak. The threshold is `threshold_fraction` of the maximum
+    of `signal` within `threshold_period` from the beginning and then
+    from each peak. If no peak is found for `timeout_factor` times the
+    average of the last three periods between peaks, the threshold is
+    lowered to 60% and the search starts over `safe_period` after the
+    last peak.
+
+    The search jumps between threshold crossings, which are found
+    with array operations, instead of visiting every sample.
+
+    Arguments:
+        signal             - detection signal, e.g. a window integral
+                             of the derivative of `data`
+        data               - waveform from which peaks are chosen
+        sample_length      - length of a sample in seconds
+        threshold_fraction - fraction of the maximum of `signal`
+                             used as the threshold
+        threshold_period   - period in seconds over which the maximum
+                             of `signal` is found
+        safe_period        - period in seconds after a peak in which
+                             another one may not be found
+        extremum           - function returning the index of the peak
+                             within a slice of `data`, e.g. `np.argmax`
+        timeout_factor     - multiple of the average period between
+                             peaks after which the threshold is lowered
+    """
+    threshold_length = int(threshold_period/sample_length)
+    threshold = np.max(signal[0:threshold_length]) * threshold_fraction
+    peak_indices = []
+    last_peak = None
+    average_period = 0
+    timeout_i = None
+    # Times are relative to the first sample. The first sample may not
+    # begin a candidate, as index 0 marked no candidate in the original
+    # per-sample loop.
+    i = 1
+    while i < len(signal):
+        begin_i = _first_index(signal, threshold, True, i)
+        if timeout_i is not None:
+            check_i = max(i, timeout_i)
+            if (check_i < len(signal) 
+                    and (begin_i is None or check_i < begin_i)):
+                threshold *= 0.6
+                i = int((last_peak+safe_period)/sample_length) + 1
+                continue
+        if begin_i is None:
+            break
+        end_i = _first_index(signal, threshold, False, begin_i+1)
+        if end_i is None:
+            break
+        if last_peak is None or end_i*sample_length > last_peak + safe_period:
+            peak_i = begin_i + int(extremum(data[begin_i:end_i]))
+            peak_indices.append(peak_i)
+            # Peak times are one sample early, like in the original
+            # implementations of procedures using this function
+            last_peak = sample_length*(peak_i-1)
+            threshold = (np.max(signal[peak_i:peak_i+threshold_length])
+                         * threshold_fraction)
+            if len(peak_indices) > 3:
+                times = sample_length*(np.array(peak_indices[-4:])-1)
+                average_period = ((times[3]-times[2]) + (times[2]-times[1]) 
+                                  + (times[1]-times[0])) / 3
+            if average_period != 0:
+                timeout_i = _first_index_after(
+                    last_peak + average_period*timeout_factor,
+                    sample_length)
+        # The sample which ended the candidate is checked again, as the
+        # threshold may have changed
+        i = end_i
+    return np.array(peak_indices, dtype=int)
+
+_EXPRESSION_OPERATORS = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Pow: np.power,
+    ast.USub: np.negative,
+    ast.UAdd: np.positive}
+_EXPRESSION_FUNCTIONS = {
+    'sqrt': np.sqrt,
+    'abs': np.abs,
+    'log': np.log,
+    'exp': np.exp}
+
+def _divide(numerator, denominator):
+    """Divides arrays, giving 0 where the denominator is 0."""
+    numerator, denominator = np.broadcast_arrays(numerator, denominator)
+    output = np.zeros(numerator.shape)
+    return np.divide(numerator, denominator, out=output,
+                     where=denominator != 0)
+
+def parse_points_expression(expression):
+    """Returns the parsed tree of an arithmetic expression on
+    `Points` and a list of names of `Points` used in it, in order of
+    appearance.
+
+    Raises ValueError if the expression is invalid. See
+    `evaluate_points_expression` for its syntax.
+    """
+    try:
+        tree = ast.parse(expression, mode='eval')
+    except SyntaxError:
+        raise ValueError('Invalid expression {}'.format(expression))
+    names = []
+    function_names = []
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            if (not isinstance(node.func, ast.Name)
+                    or node.func.id not in _EXPRESSION_FUNCTIONS
+                    or len(node.args) != 1 or node.keywords):
+                raise ValueError('Invalid function call in {}'.format(
+                    expression))
+            function_names.append(node.func)
+        elif isinstance(node, ast.Attribute):
+            if (node.attr not in ['x', 'y']
+                    or not isinstance(node.value, ast.Name)):
+                raise ValueError('Invalid attribute {} in {}'.format(
+                    node.attr, expression))
+        elif isinstance(node, ast.Name):
+            if not any(node is function for function in function_names):
+                names.append(node)
+        elif isinstance(node, ast.Constant):
+            if (not isinstance(node.value, (int, float))
+                    or isinstance(node.value, bool)):
+                raise ValueError('Invalid constant in {}'.format(
+                    expression))
+        elif isinstance(node, ast.BinOp):
+            if type(node.op) not in _EXPRESSION_OPERATORS and not (
+                    isinstance(node.op, ast.Div)):
+                raise ValueError('Invalid operator in {}'.format(
+                    expression))
+        elif isinstance(node, ast.UnaryOp):
+            if type(node.op) not in _EXPRESSION_OPERATORS:
+                raise ValueError('Invalid operator in {}'.format(
+                    expression))
+        elif not isinstance(node, (ast.Expression, ast.Load,
+                                   ast.operator, ast.unaryop)):
+            raise ValueError('Invalid expression {}'.format(expression))
+    names.sort(key=lambda node: node.col_offset)
+    unique_names = []
+    for node in names:
+        if node.id not in unique_names:
+            unique_names.append(node.id)
+    return tree, unique_names
+
+def _evaluate_expression_node(node, values):
+    if isinstance(node, ast.Expression):
+        return _evaluate_expression_node(node.body, values)
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        return values[node.id, 'y']
+    if isinstance(node, ast.Attribute):
+        return values[node.value.id, node.attr]
+    if isinstance(node, ast.Call):
+        return _EXPRESSION_FUNCTIONS[node.func.id](
+            _evaluate_expression_node(node.args[0], values))
+    if isinstance(node, ast.UnaryOp):
+        return _EXPRESSION_OPERATORS[type(node.op)](
+            _evaluate_expression_node(node.operand, values))
+    left = _evaluate_expression_node(node.left, values)
+    right = _evaluate_expression_node(node.right, values)
+    if isinstance(node.op, ast.Div):
+        return _divide(left, right)
+    return _EXPRESSION_OPERATORS[type(node.op)](left, right)
+
+def evaluate_points_expression(expression, points, tolerance=np.inf,
+                               direction='nearest', reference=None):
+    """Evaluates an arithmetic expression on `Points` and returns
+    two arrays of x and y values of resulting points.
+
+    Names in the expression refer to y values of `Points` from the
+    `points` dict, and `<name>.x` or `<name>.y` to their x or y values.
+    Numbers, operators + - * / ** and functions sqrt, abs, log and exp
+    may be used, e.g. `"sqrt(a) + b.x - a.x"`. Division by zero gives
+    0, like in the procedures using this function.
+
+    Points are paired by their x coordinates with
+    `Points.match_points`. Resulting points lie at points of the
+    reference `Points` which are paired with points of all others.
+
+    Arguments:
+        expression - string with the expression
+        points     - dict of `<name>:<Points>` pairs
+        tolerance  - maximum distance between paired points
+        direction  - direction in which points of the reference
+                     `Points` are paired, as in `Points.match_points`
+        reference  - name of `Points` whose x values are used for
+                     resulting points. If None, it is the first name
+                     in the expression.
+    """
+    tree, names = parse_points_expression(expression)
+    if reference is None:
+        if len(names) == 0:
+            raise ValueError('No points in expression {}'.format(
+                expression))
+        reference = names[0]
+    for name in names + [reference]:
+        if name not in points:
+            raise ValueError('Points {} not provided'.format(name))
+    reference_points = points[reference]
+    # Index of the paired point of each `Points` for every reference
+    # point, or -1 if it is unpaired
+    matches = {}
+    paired = np.ones(len(reference_points), dtype=bool)
+    for name in names:
+        reference_indices, indices = reference_points.match_points(
+            points[name], tolerance, direction)
+        matches[name] = np.full(len(reference_points), -1)
+        matches[name][reference_indices] = indices
+        paired &= matches[name] >= 0
+    values = {}
+    for name in names:
+        indices = matches[name][paired]
+        values[name, 'x'] = points[name].data_x[indices]
+        values[name, 'y'] = points[name].data_y[indices]
+    output_x = reference_points.data_x[paired]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        output_y = _evaluate_expression_node(tree, values)
+    return output_x, np.broadcast_to(output_y, output_x.shape).astype(float)
@@ -1,50 +1,319 @@
 """
 This file contains functions allowing the import and export of data.
+
+`Composite_data` is saved in a binary project file with the following
+layout:
+    8 bytes - magic string `PROJECT_MAGIC`
+    8 bytes - length of the header as a little-endian unsigned integer
+    header  - UTF-8 encoded JSON describing every `Wave`, `Points` and
+              `Parameter` along with the location of their arrays
+    arrays  - raw little-endian arrays, optionally compressed with
+              zlib, each beginning at a multiple of `_PROJECT_ALIGNMENT`
+              bytes from the start of the file
+
+Uncompressed waves are memory-mapped when a project is loaded, so
+loading only requires reading the header.
 """
 
 import csv
-import os.path
+import itertools
+import json
+import os
 import pickle
+import struct
+import tempfile
+import warnings
+import zlib
 
 import numpy as np
 from QtSigman import DefaultColors
 import sigman as sm 
 
-def save_composite_data(file_name, composite_data):
-    """Saves the given `Composite_data` in a pickle file."""
-    with open(file_name, 'wb') as pickle_file:
-        pickle.dump(composite_data, pickle_file)
+# Number of lines of a .dat file parsed at once when importing waves
+DAT_CHUNK_LINES = 65536
+# Largest allowed deviation of the spacing between x values of a wave
+# in a .dat file from its sample length, as a fraction of it
+DAT_JITTER_TOLERANCE = 0.5
+
+PROJECT_MAGIC = b'SIGMAN\x00\x01'
+PROJECT_VERSION = 1
+_PROJECT_ALIGNMENT = 64
+
+def _align(position):
+    return -(-position // _PROJECT_ALIGNMENT) * _PROJECT_ALIGNMENT
+
+class _ProjectArrayWriter:
+    """Collects arrays to be written to a project file and describes
+    their position within the data section of the file.
+    """
+    def __init__(self, compress=False):
+        self.compress = compress
+        self.payloads = []
+        self.size = 0
+
+    def add(self, array):
+        """Queues an array to be written and returns its description
+        for the header.
+        """
+        array = np.asarray(array)
+        array = np.ascontiguousarray(
+            array, dtype=array.dtype.newbyteorder('<'))
+        if self.compress:
+            payload = zlib.compress(array.tobytes())
+            size = len(payload)
+        else:
+            payload = array
+            size = array.nbytes
+        position = _align(self.size)
+        self.payloads.append((position, payload))
+        self.size = position + size
+        return {
+            'position':position,
+            'size':size,
+            'dtype':array.dtype.str,
+            'length':len(array),
+            'compression':'zlib' if self.compress else None}
+
+    def write(self, file_, data_begin):
+        for position, payload in self.payloads:
+            file_.seek(data_begin + position)
+            if isinstance(payload, np.ndarray):
+                payload = payload.data
+            file_.write(payload)
+
+def save_composite_data(file_name, composite_data, compress=False):
+    """Saves the given `Composite_data` in a project file.
+
+    Arguments:
+        file_name      - path to the project file
+        composite_data - `Composite_data` to save
+        compress       - whether to compress arrays with zlib. Waves of
+                         compressed projects cannot be memory-mapped
+                         when loaded.
+    """
+    arrays = _ProjectArrayWriter(compress=compress)
+    header = {
+        'version':PROJECT_VERSION,
+        'waves':{},
+        'points':{},
+        'parameters':{}}
+    for key, wave in composite_data.waves.items():
+        header['waves'][key] = {
+            'type':wave.type,
+            'sample_rate':float(wave.sample_rate),
+            'offset':float(wave.offset),
+            'data':arrays.add(wave.data)}
+    for key, points in composite_data.points.items():
+        header['points'][key] = {
+            'type':points.type,
+            'data_x':arrays.add(points.data_x),
+            'data_y':arrays.add(points.data_y)}
+    for key, parameter in composite_data.parameters.items():
+        header['parameters'][key] = {
+            'type':parameter.type,
+            'begin_times':arrays.add(parameter.begin_times),
+            'end_times':arrays.add(parameter.end_times),
+            'values':arrays.add(parameter.values)}
+    encoded_header = json.dumps(header).encode('utf-8')
+    data_begin = _align(len(PROJECT_MAGIC) + 8 + len(encoded_header))
+    # Waves may be memory-mapped from the file being overwritten, so the
+    # project is written to a temporary file first
+    directory = os.path.dirname(os.path.abspath(file_name))
+    file_descriptor, temp_name = tempfile.mkstemp(dir=directory)
+    try:
+        with os.fdopen(file_descriptor, 'wb') as project_file:
+            project_file.write(PROJECT_MAGIC)
+            project_file.write(struct.pack('<Q', len(encoded_header)))
+            project_file.write(encoded_header)
+            arrays.write(project_file, data_begin)
+            project_file.truncate(data_begin + arrays.size)
+        # mkstemp creates files readable only by their owner
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp_name, 0o666 & ~umask)
+        # Mapped files may not be replaced on Windows, and mappings of
+        # a replaced file would no longer match its layout
+        mapped_keys = _release_mapped_waves(file_name, composite_data)
+        os.replace(temp_name, file_name)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+    if not compress:
+        for key in mapped_keys:
+            _map_project_wave(file_name, composite_data.waves[key],
+                              data_begin, header['waves'][key]['data'])
+
+def _release_mapped_waves(file_name, composite_data):
+    """Loads into memory values of waves of `composite_data` which are
+    memory-mapped from a given file and returns their keys."""
+    path = os.path.abspath(file_name)
+    mapped_keys = []
+    for key, wave in composite_data.waves.items():
+        mapped_file = getattr(wave.data, 'filename', None)
+        if mapped_file is not None and os.path.abspath(mapped_file) == path:
+            wave.data = np.array(wave.data)
+            wave._mmap_source = None
+            mapped_keys.append(key)
+    return mapped_keys
+
+def _map_project_wave(file_name, wave, data_begin, description):
+    """Replaces values of a `Wave` with a memory-map of its array in a
+    project file."""
+    if description['length'] == 0:
+        return
+    mapped_wave = sm.Wave.open_mmap(
+        file_name, description['dtype'], wave.sample_rate, wave.type,
+        offset=wave.offset, header_size=data_begin+description['position'],
+        length=description['length'])
+    wave.data = mapped_wave.data
+    wave._mmap_source = mapped_wave._mmap_source
 
-def load_composite_data(file_name):
+def _read_project_array(project_file, data_begin, description):
+    """Reads an array described in the project header into memory."""
+    project_file.seek(data_begin + description['position'])
+    payload = project_file.read(description['size'])
+    if description['compression'] == 'zlib':
+        payload = zlib.decompress(payload)
+    elif description['compression'] is not None:
+        raise ValueError("Unknown compression {}".format(
+            description['compression']))
+    return np.frombuffer(payload, dtype=description['dtype']).copy()
+
+def _load_project_wave(file_name, project_file, data_begin, wave_header,
+                       mmap=True):
+    description = wave_header['data']
+    if (mmap and description['compression'] is None
+            and description['length'] > 0):
+        return sm.Wave.open_mmap(
+            file_name, description['dtype'], wave_header['sample_rate'],
+            wave_header['type'], offset=wave_header['offset'],
+            header_size=data_begin + description['position'],
+            length=description['length'])
+    data = _read_project_array(project_file, data_begin, description)
+    return sm.Wave(data, wave_header['sample_rate'], wave_header['type'],
+                   offset=wave_header['offset'])
+
+def load_composite_data(file_name, mmap=True):
+    """Loads `Composite_data` from a given project file.
+
+    Uncompressed values of waves are memory-mapped from the file unless
+    `mmap` is False, in which case they are read into memory, e.g. so
+    that the file may be overwritten while they are used.
+
+    Projects saved as pickle files by older versions are also loaded.
+    Please note that unpickling is not safe for files of unknown
+    origin.
+    """
+    with open(file_name, 'rb') as project_file:
+        if project_file.read(len(PROJECT_MAGIC)) != PROJECT_MAGIC:
+            return _load_pickled_composite_data(file_name)
+        header_length, = struct.unpack('<Q', project_file.read(8))
+        header = json.loads(project_file.read(header_length).decode('utf-8'))
+        if header['version'] > PROJECT_VERSION:
+            raise ValueError("Unsupported project version {}".format(
+                header['version']))
+        data_begin = _align(len(PROJECT_MAGIC) + 8 + header_length)
+        composite_data = sm.Composite_data()
+        for key, wave_header in header['waves'].items():
+            composite_data.add_wave(
+                _load_project_wave(file_name, project_file, data_begin,
+                                   wave_header, mmap),
+                key)
+        for key, points_header in header['points'].items():
+            data_x = _read_project_array(project_file, data_begin,
+                                         points_header['data_x'])
+            data_y = _read_project_array(project_file, data_begin,
+                                         points_header['data_y'])
+            composite_data.add_points(
+                sm.Points(data_x, data_y, points_header['type']), key)
+        for key, parameter_header in header['parameters'].items():
+            begin_times, end_times, values = (
+                _read_project_array(project_file, data_begin,
+                                    parameter_header[attribute])
+                for attribute in ['begin_times', 'end_times', 'values'])
+            parameter = sm.Parameter.fromArrays(
+                parameter_header['type'], begin_times, end_times, values)
+            composite_data.add_parameter(parameter, key)
+    return composite_data
+
+def _load_pickled_composite_data(file_name):
     """Loads `Composite_data` from a given pickle file."""
     with open(file_name, 'rb') as pickle_file:
         return pickle.load(pickle_file)
 
 def _import_dat(file_name):
-    """Imports two tables of coordinates from a .dat file."""
-    x = []
-    y = []
-    with open(file_name) as csv_file:
-        reader = csv.reader(csv_file, delimiter=' ')
-        for row in reader:              
-            x.append(float(row[0]))
-            # Some .dat files have two spaces instead of one, in which case
-            # row[1] is empty
-            if row[1]=="": 
-                y.append(float(row[2]))
-            else:
-                y.append(float(row[1]))
-    return x, y
-
-
-def _import_wave_dat(file_name, wave_type, offset=0):
+    """Imports two arrays of coordinates from a .dat file."""
+    # Columns are split on any whitespace, as some .dat files have two
+    # spaces between values instead of one
+    table = np.loadtxt(file_name, dtype=np.float64, usecols=(0, 1),
+                       ndmin=2)
+    return table[:, 0], table[:, 1]
+
+
+def _iterate_dat_chunks(file_name, chunk_lines=DAT_CHUNK_LINES):
+    """Yields x and y arrays of consecutive chunks of at most
+    `chunk_lines` lines of a .dat file, along with the number of
+    characters the chunk takes up in the file."""
+    with open(file_name) as dat_file:
+        while True:
+            lines = list(itertools.islice(dat_file, chunk_lines))
+            if not lines:
+                return
+            table = np.loadtxt(lines, dtype=np.float64, usecols=(0, 1),
+                               ndmin=2)
+            yield table[:, 0], table[:, 1], sum(map(len, lines))
+
+def _import_wave_dat(file_name, wave_type, offset=0,
+                     chunk_lines=DAT_CHUNK_LINES):
     """Imports a waveform of constant frequency from a .dat file and
-    returns a corresponding `Wave`."""
-    x, y = _import_dat(file_name)
-    sample_rate = len(x)/(x[-1]-x[0])
-    return sm.Wave(y, sample_rate, 
+    returns a corresponding `Wave`.
+
+    The file is read in chunks of `chunk_lines` lines and only y values
+    are kept, in an array preallocated based on the size of the file.
+    The spacing of x values in the first chunk is used to check that
+    the rest of the file is evenly spaced and a warning is issued if
+    it is not. Either way the sample rate is calculated from the number
+    of samples and the time between the first and last one.
+    """
+    file_size = os.path.getsize(file_name)
+    data = np.empty(0)
+    count = 0
+    first_x = last_x = sample_length = None
+    regular = True
+    for x, y, characters in _iterate_dat_chunks(file_name, chunk_lines):
+        if len(x) == 0:
+            continue
+        if count == 0:
+            first_x = x[0]
+            capacity = int(file_size / characters * len(x) * 1.01) + 1
+            data.resize(max(capacity, len(x)), refcheck=False)
+        else:
+            x = np.concatenate(([last_x], x))
+        if len(x) > 1:
+            spacing = np.diff(x)
+            if sample_length is None:
+                sample_length = np.median(spacing)
+            if regular and np.any(np.abs(spacing - sample_length)
+                                  > DAT_JITTER_TOLERANCE * sample_length):
+                regular = False
+        last_x = x[-1]
+        if count + len(y) > len(data):
+            data.resize(max(2 * len(data), count + len(y)), refcheck=False)
+        data[count:count+len(y)] = y
+        count += len(y)
+    if count < 2:
+        raise ValueError(("A wave requires at least two samples, {} has "
+                          "{}").format(file_name, count))
+    if not regular:
+        warnings.warn(("x values in {} are not evenly spaced; the sample "
+                       "rate is an average over the entire "
+                       "file").format(file_name))
+    data.resize(count, refcheck=False)
+    sample_rate = count/(last_x-first_x)
+    return sm.Wave(data, sample_rate, 
                       wave_type=wave_type, 
-                      offset=offset)
+                      offset=offset,
+                      copy=False)
     
 def _import_point_dat(file_name, point_type):
     """Imports coordinates from a .dat file and returns a corresponding
@@ -0,0 +1,500 @@
+"""
+This module runs pipelines of procedures from `sigman.analyzer` on
+`Composite_data`, e.g. filtering an ECG signal, finding R points on it
+and calculating the heart rate.
+
+A pipeline is described by a `dict`, usually read from a JSON file:
+    {
+        "inputs": {
+            "waves": {"ecg": {"file": "ECG.dat", "type": "ecg"}},
+            "points": {},
+            "project": null
+        },
+        "steps": [
+            {"procedure": "modify_filter_butterworth", "wave": "ecg",
+             "arguments": {"N": 3, "Wn": 30}},
+            {"procedure": "points_r_simple"},
+            {"procedure": "parameter_heart_rate",
+             "windows": {"length": 60, "step": 10}}
+        ]
+    }
+
+`inputs` describes data imported with `file_manager` before the steps
+are run; `project` is a file saved with `save_composite_data`. File
+names are relative to the directory of the pipeline file. `inputs` may
+be left out if data is given to `Pipeline.run` directly.
+
+Each step may contain:
+    procedure  - name of or path to the procedure to run
+    name       - unique name of the step; by default the name of the
+                 procedure
+    arguments  - `dict` of arguments replacing those from
+                 `default_arguments` of the procedure
+    waves      - `dict` of `<required wave>:<key>` pairs mapping waves
+                 required by the procedure to keys of `Composite_data`.
+                 Required waves which are not listed use the same key.
+    points     - the same as `waves`, for required points
+    wave       - key of the wave modified by a `modify` step
+    output     - key under which the output is stored; by default
+                 `wave` for `modify` steps and `output_type` of the
+                 procedure for others
+    begin_time - beginning of the time range; by default the beginning
+                 of the range in which all input data overlaps
+    end_time   - end of the time range, likewise
+    windows    - `dict` of arguments of `analyzer.generate_windows`
+                 besides the time range, i.e. `length` and `step`, for
+                 `parameter` steps. By default the parameter is
+                 calculated over the whole time range.
+    parallel   - if true, `points` steps are run in chunks by
+                 `analyzer.find_points_parallel`
+`begin_time` and `end_time` may also be set for all steps at the top
+level of the pipeline.
+
+A step uses data written by the last step before it with the same key
+or, if there is none, data given as input. Steps are run in threads as
+soon as the steps whose data they use are done, so independent
+branches, e.g. analysis of ECG and BP, run concurrently. Outputs of
+steps are new objects; inputs are not modified.
+
+Threads share the global interpreter lock, so steps only run in
+parallel while they spend time in NumPy and SciPy functions which
+release it. Procedures looping over samples in Python, e.g. most
+`points` procedures, run one at a time; long `points` steps should be
+marked `parallel`, which runs them in processes.
+
+Every step has a fingerprint calculated from its procedure file,
+arguments, files named by them, time range, fingerprints of its inputs
+and `analyzer.library_fingerprint`. Steps whose fingerprints are the
+same as in a previous run are skipped and their outputs are taken from
+the data saved by that run.
+
+Sample usage:
+    pipeline = Pipeline.fromFile('analysis.json')
+    composite_data = pipeline.load_inputs()
+    fingerprints = pipeline.run(composite_data)
+or from the command line:
+    python -m sigman.pipeline analysis.json output.sigman
+"""
+
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import sigman as sm
+from sigman import analyzer
+from sigman import file_manager as fm
+
+# Attributes of `Composite_data` holding outputs of each type of
+# procedure
+OUTPUT_DICTS = {
+    'modify':'waves',
+    'points':'points',
+    'parameter':'parameters'}
+
+class PipelineError(Exception):
+    """Raised when a pipeline is described incorrectly."""
+
+class Step:
+    """Class describing a single step of a `Pipeline`.
+
+    Attributes:
+        Step.name       - unique name of the step
+        Step.procedure  - imported procedure
+        Step.arguments  - `dict` of arguments of the procedure
+        Step.waves      - `dict` of `<required wave>:<key>` pairs
+        Step.points     - `dict` of `<required points>:<key>` pairs
+        Step.wave       - key of the modified wave of a `modify` step
+        Step.output     - `(<data dict>, <key>)` tuple describing where
+                          the output is stored, e.g. `('points', 'r')`
+        Step.begin_time - beginning of the time range or None
+        Step.end_time   - end of the time range or None
+        Step.windows    - `dict` of arguments of `generate_windows` or
+                          None
+        Step.parallel   - whether `find_points_parallel` is used
+    """
+
+    def __init__(self, spec, procedure_directory='', begin_time=None,
+                 end_time=None):
+        """Initializes a `Step` from its description in a pipeline.
+
+        Arguments:
+            spec                - `dict` describing the step
+            procedure_directory - directory relative to which paths of
+                                  procedures are given
+            begin_time          - default beginning of the time range
+            end_time            - default end of the time range
+        """
+        unknown_keys = set(spec) - {
+            'procedure', 'name', 'arguments', 'waves', 'points', 'wave',
+            'output', 'begin_time', 'end_time', 'windows', 'parallel'}
+        if unknown_keys:
+            raise PipelineError("Unknown keys {} in step {}".format(
+                sorted(unknown_keys), spec))
+        if 'procedure' not in spec:
+            raise PipelineError("Step {} has no procedure".format(spec))
+        procedure_name = spec['procedure']
+        if procedure_name.endswith('.py'):
+            procedure_name = os.path.join(procedure_directory,
+                                          procedure_name)
+        self.procedure = analyzer.import_procedure(procedure_name)
+        self.name = spec.get('name', analyzer._get_module_from_path(
+            self.procedure.__file__))
+        self.arguments = dict(self.procedure.default_arguments)
+        self.arguments.update(spec.get('arguments', {}))
+        procedure_type = self.procedure.procedure_type
+        required_waves = getattr(self.procedure, 'required_waves', [])
+        required_points = getattr(self.procedure, 'required_points', [])
+        self.waves = {key: key for key in required_waves}
+        self.waves.update(spec.get('waves', {}))
+        self.points = {key: key for key in required_points}
+        self.points.update(spec.get('points', {}))
+        self.wave = spec.get('wave')
+        if procedure_type == 'modify':
+            if self.wave is None:
+                raise PipelineError(
+                    "Step {} modifies no wave".format(self.name))
+            default_output = self.wave
+        else:
+            default_output = self.procedure.output_type
+        self.output = (OUTPUT_DICTS[procedure_type],
+                       spec.get('output', default_output))
+        self.begin_time = spec.get('begin_time', begin_time)
+        self.end_time = spec.get('end_time', end_time)
+        self.windows = spec.get('windows')
+        self.parallel = bool(spec.get('parallel', False))
+
+    @property
+    def inputs(self):
+        """List of `(<data dict>, <key>)` tuples of data used by the
+        step."""
+        inputs = [('waves', key) for key in self.waves.values()]
+        inputs.extend(('points', key) for key in self.points.values())
+        if self.wave is not None:
+            inputs.append(('waves', self.wave))
+        return inputs
+
+    def fingerprint(self, input_fingerprints):
+        """Returns a hex digest describing the step and its inputs.
+
+        Arguments:
+            input_fingerprints - list of fingerprints of data in
+                                 `Step.inputs`
+        """
+        description = {
+            'procedure':analyzer.fingerprint_file(self.procedure.__file__),
+            'library':analyzer.library_fingerprint(),
+            'arguments':self.arguments,
+            'files':analyzer.fingerprint_argument_files(self.arguments),
+            'waves':self.waves,
+            'points':self.points,
+            'wave':self.wave,
+            'output':self.output,
+            'begin_time':self.begin_time,
+            'end_time':self.end_time,
+            'windows':self.windows,
+            'inputs':input_fingerprints}
+        hash_ = hashlib.blake2b(digest_size=16)
+        hash_.update(json.dumps(description, sort_keys=True,
+                                default=str).encode())
+        return hash_.hexdigest()
+
+    def _time_range(self, waves, points):
+        begin_time = self.begin_time
+        end_time = self.end_time
+        if waves:
+            data_begin = max(wave.offset for wave in waves.values())
+            data_end = min(wave.offset+wave.complete_length
+                           for wave in waves.values())
+        else:
+            points_list = [points_ for points_ in points.values()
+                           if len(points_) > 0]
+            if not points_list:
+                raise PipelineError("Step {} has no data in its time "
+                                    "range".format(self.name))
+            data_begin = min(points_.data_x[0] for points_ in points_list)
+            # The last point is within the range as well
+            data_end = np.nextafter(
+                max(points_.data_x[-1] for points_ in points_list),
+                np.inf)
+        if begin_time is None:
+            begin_time = data_begin
+        if end_time is None:
+            end_time = data_end
+        return begin_time, end_time
+
+    def execute(self, data, cache=None):
+        """Runs the procedure of the step and returns its output.
+
+        Arguments:
+            data  - `dict` of `(<data dict>, <key>):<data>` pairs
+                    containing `Step.inputs`
+            cache - `analyzer.Result_cache` or None
+        """
+        waves = {required: data['waves', key]
+                 for required, key in self.waves.items()}
+        points = {required: data['points', key]
+                  for required, key in self.points.items()}
+        procedure_type = self.procedure.procedure_type
+        if procedure_type == 'modify':
+            wave = data['waves', self.wave].copy()
+            begin_time, end_time = self._time_range({'':wave}, points)
+            analyzer.modify_wave_in_place(wave, points, begin_time,
+                                          end_time, self.procedure,
+                                          self.arguments, cache=cache)
+            return wave
+        begin_time, end_time = self._time_range(waves, points)
+        if procedure_type == 'points':
+            find_points = (analyzer.find_points_parallel if self.parallel
+                           else analyzer.find_points)
+            return find_points(waves, points, begin_time, end_time,
+                               self.procedure, self.arguments,
+                               cache=cache)
+        if self.windows is None:
+            time_tuples = [(begin_time, end_time)]
+        else:
+            time_tuples = analyzer.generate_windows(
+                begin_time, end_time, **self.windows)
+        return analyzer.calculate_parameter(waves, points, time_tuples,
+                                            self.procedure, self.arguments,
+                                            cache=cache)
+
+class Pipeline:
+    """Class describing a pipeline of procedures. See the description
+    of this module.
+
+    Attributes:
+        Pipeline.steps        - list of `Step` instances in the order
+                                they were given
+        Pipeline.dependencies - `dict` of `<step name>:<list of step
+                                names>` pairs of steps whose outputs
+                                are used by each step
+        Pipeline.writers      - `dict` of `<step name>:<dict>` pairs,
+                                where each `dict` maps inputs of the
+                                step to names of steps which write
+                                them, or None for input data
+        Pipeline.inputs       - `dict` describing input files
+        Pipeline.directory    - directory relative to which file names
+                                are given
+    """
+
+    def __init__(self, spec, directory=''):
+        """Initializes a `Pipeline` from its description.
+
+        Arguments:
+            spec      - `dict` describing the pipeline
+            directory - directory relative to which file names in the
+                        description are given
+        """
+        self.directory = directory
+        self.inputs = spec.get('inputs', {})
+        self.steps = []
+        self.dependencies = {}
+        self.writers = {}
+        # Steps which last wrote each output so far
+        last_writers = {}
+        for step_spec in spec.get('steps', []):
+            step = Step(step_spec, directory,
+                        begin_time=spec.get('begin_time'),
+                        end_time=spec.get('end_time'))
+            if step.name in self.dependencies:
+                raise PipelineError("Step name {} is repeated".format(
+                    step.name))
+            self.writers[step.name] = {input_: last_writers.get(input_)
+                                       for input_ in step.inputs}
+            self.dependencies[step.name] = sorted(
+                {writer for writer in self.writers[step.name].values()
+                 if writer is not None})
+            last_writers[step.output] = step.name
+            self.steps.append(step)
+        self._last_writers = last_writers
+
+    @classmethod
+    def fromFile(cls, file_name):
+        """Returns a `Pipeline` described in a JSON file."""
+        with open(file_name) as file_:
+            spec = json.load(file_)
+        return cls(spec, os.path.dirname(os.path.abspath(file_name)))
+
+    def load_inputs(self):
+        """Returns a `Composite_data` with data imported from files
+        described in `Pipeline.inputs`."""
+        project = self.inputs.get('project')
+        if project is not None:
+            composite_data = fm.load_composite_data(
+                os.path.join(self.directory, project))
+        else:
+            composite_data = sm.Composite_data()
+        for key, description in self.inputs.get('waves', {}).items():
+            composite_data.waves[key] = fm.import_wave(
+                os.path.join(self.directory, description['file']),
+                description.get('type', key),
+                offset=description.get('offset', 0))
+        for key, description in self.inputs.get('points', {}).items():
+            composite_data.points[key] = fm.import_points(
+                os.path.join(self.directory, description['file']),
+                description.get('type', key))
+        return composite_data
+
+    def run(self, composite_data, previous_data=None,
+            previous_fingerprints=None, max_workers=None, cache=None):
+        """Runs all steps and stores their outputs in `composite_data`.
+        Returns a `dict` of `<step name>:<fingerprint>` pairs.
+
+        Arguments:
+            composite_data        - `Composite_data` with the input
+                                    data, to which outputs are added
+            previous_data         - `Composite_data` with outputs of a
+                                    previous run
+            previous_fingerprints - `dict` of fingerprints returned by
+                                    that run
+            max_workers           - number of steps run at once; None
+                                    for the default of
+                                    `ThreadPoolExecutor`
+            cache                 - `analyzer.Result_cache` in which
+                                    outputs of steps are looked up
+                                    before running them, or None
+        """
+        if previous_fingerprints is None:
+            previous_fingerprints = {}
+        results = {}
+        fingerprints = {}
+        input_fingerprints = {}
+
+        def prepare(step):
+            # Returns the inputs of a step after calculating its
+            # fingerprint, or None if its output may be reused
+            inputs = {}
+            step_fingerprints = []
+            for input_, writer in self.writers[step.name].items():
+                if writer is not None:
+                    inputs[input_] = results[writer]
+                    step_fingerprints.append(fingerprints[writer])
+                    continue
+                dict_name, key = input_
+                if key not in getattr(composite_data, dict_name):
+                    raise PipelineError(
+                        "Step {} requires {} {} which is not "
+                        "available".format(step.name, dict_name, key))
+                inputs[input_] = getattr(composite_data, dict_name)[key]
+                if input_ not in input_fingerprints:
+                    input_fingerprints[input_] = analyzer.fingerprint_data(
+                        inputs[input_])
+                step_fingerprints.append(input_fingerprints[input_])
+            fingerprint = step.fingerprint(step_fingerprints)
+            fingerprints[step.name] = fingerprint
+            dict_name, key = step.output
+            # Only outputs not overwritten by later steps were saved
+            if (previous_data is not None
+                    and previous_fingerprints.get(step.name) == fingerprint
+                    and self._last_writers[step.output] == step.name
+                    and key in getattr(previous_data, dict_name)):
+                results[step.name] = getattr(previous_data, dict_name)[key]
+                return None
+            return inputs
+
+        remaining = list(self.steps)
+        done = set()
+        running = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            while remaining or running:
+                for step in list(remaining):
+                    if not all(name in done
+                               for name in self.dependencies[step.name]):
+                        continue
+                    remaining.remove(step)
+                    inputs = prepare(step)
+                    if inputs is None:
+                        done.add(step.name)
+                    else:
+                        running[executor.submit(step.execute, inputs,
+                                                cache)] = step
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    step = running.pop(future)
+                    results[step.name] = future.result()
+                    done.add(step.name)
+
+        for step in self.steps:
+            if self._last_writers[step.output] == step.name:
+                dict_name, key = step.output
+                getattr(composite_data, dict_name)[key] = results[step.name]
+        return fingerprints
+
+def _fingerprints_file(output_file):
+    return output_file + '.pipeline.json'
+
+def run_file(pipeline_file, output_file, input_file=None, force=False,
+             max_workers=None, cache_directory=None):
+    """Runs a pipeline described in a JSON file and saves the outputs
+    with `file_manager.save_composite_data`.
+
+    Fingerprints of steps are saved alongside the output file, so that
+    running the pipeline again skips steps whose inputs did not change.
+    Outputs of procedures may also be kept in a `Result_cache` in a
+    directory, so that they are reused e.g. after an argument is
+    changed back or by other pipelines.
+
+    Arguments:
+        pipeline_file   - name of the JSON file describing the
+                          pipeline
+        output_file     - name of the file to save the outputs in
+        input_file      - name of a project file with input data, used
+                          in place of `project` from the pipeline
+        force           - if True, all steps are run again
+        max_workers     - number of steps run at once
+        cache_directory - directory of the `Result_cache`, or None
+    """
+    pipeline = Pipeline.fromFile(pipeline_file)
+    if input_file is not None:
+        pipeline.inputs = dict(pipeline.inputs,
+                               project=os.path.abspath(input_file))
+    composite_data = pipeline.load_inputs()
+    previous_data = None
+    previous_fingerprints = None
+    if (not force and os.path.exists(output_file)
+            and os.path.exists(_fingerprints_file(output_file))):
+        # The output file is overwritten below, so its data can't be
+        # memory-mapped
+        previous_data = fm.load_composite_data(output_file, mmap=False)
+        with open(_fingerprints_file(output_file)) as file_:
+            previous_fingerprints = json.load(file_)
+    cache = None
+    if cache_directory is not None:
+        cache = analyzer.Result_cache(cache_directory)
+    fingerprints = pipeline.run(composite_data, previous_data,
+                                previous_fingerprints, max_workers, cache)
+    fm.save_composite_data(output_file, composite_data)
+    with open(_fingerprints_file(output_file), 'w') as file_:
+        json.dump(fingerprints, file_, indent=4, sort_keys=True)
+    return composite_data
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m sigman.pipeline',
+        description="Runs a pipeline of sigman procedures.")
+    parser.add_argument('pipeline', help="JSON file describing the "
+                        "pipeline")
+    parser.add_argument('output', help="project file to save the "
+                        "outputs in")
+    parser.add_argument('-i', '--input', help="project file with the "
+                        "input data")
+    parser.add_argument('-f', '--force', action='store_true',
+                        help="run all steps again, even unchanged ones")
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help="number of steps run at once")
+    parser.add_argument('-c', '--cache', default=None,
+                        help="directory in which outputs of procedures "
+                        "are cached")
+    args = parser.parse_args(argv)
+    run_file(args.pipeline, args.output, input_file=args.input,
+             force=args.force, max_workers=args.workers,
+             cache_directory=args.cache)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,797 @@
+#!/usr/bin/env python3
+# This script compares the speed of `sigman` operations with their
+# previous implementations. It is not run by pytest; run it directly:
+#   python benchmark_sigman.py
+
+import csv
+import importlib.util
+import statistics
+import sys
+import os
+import tempfile
+import time
+import tracemalloc
+_script_path = os.path.abspath(__file__)
+_script_directory = os.path.dirname(_script_path)
+_sigman_root_directory = os.path.dirname(_script_directory)
+os.chdir(_script_directory)
+sys.path.append(_sigman_root_directory)
+
+import numpy as np
+
+import sigman as sm
+from sigman import file_manager as fm
+from sigman import analyzer
+
+def _measure(function, *args, repeat=3, **kwargs):
+    """Returns the shortest time in seconds out of `repeat` calls."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        elapsed = time.perf_counter() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def _report(name, legacy_time, current_time):
+    print("{:<40} legacy {:>9.4f}s  current {:>9.4f}s  x{:.1f}".format(
+        name, legacy_time, current_time, legacy_time/current_time))
+
+def _repeated_wave(file_name, wave_type, hours):
+    """Imports a wave and repeats its data until it lasts `hours`."""
+    wave = fm.import_wave(file_name, wave_type)
+    repeats = int(np.ceil(hours*3600 / wave.complete_length))
+    return sm.Wave(np.tile(wave.data, repeats), wave.sample_rate, wave_type)
+
+### Wave.generate_coordinate_tables ###
+
+def _legacy_generate_coordinate_tables(wave, begin_time=0, end_time=None,
+                                       begin_x=0):
+    if end_time is None:
+        end_time = wave.complete_length
+    data = wave.data_slice(begin_time, end_time)
+    output_x = []
+    output_y = []
+    for i in range(len(data)):
+        output_x.append(begin_x+i * wave.sample_length)
+        output_y.append(data[i])
+    output_x = np.array(output_x)
+    output_y = np.array(output_y)
+    return output_x, output_y
+
+def benchmark_coordinate_tables(hours=24):
+    ecg_wave = _repeated_wave('example_data/ECG.dat', 'ecg', hours)
+    for name, begin_time, end_time in [
+            ('10 s window', 3600, 3610),
+            ('10 min window', 3600, 4200),
+            ('{} h recording'.format(hours), 0, ecg_wave.complete_length)]:
+        legacy_time = _measure(
+            _legacy_generate_coordinate_tables, ecg_wave,
+            begin_time=begin_time, end_time=end_time, begin_x=begin_time,
+            repeat=1)
+        current_time = _measure(
+            ecg_wave.generate_coordinate_tables,
+            begin_time=begin_time, end_time=end_time, begin_x=begin_time)
+        _report('coordinate tables, ' + name, legacy_time, current_time)
+
+### file_manager._import_dat ###
+
+def _legacy_import_dat(file_name):
+    x = []
+    y = []
+    with open(file_name) as csv_file:
+        reader = csv.reader(csv_file, delimiter=' ')
+        for row in reader:
+            x.append(float(row[0]))
+            if row[1]=="":
+                y.append(float(row[2]))
+            else:
+                y.append(float(row[1]))
+    return x, y
+
+def benchmark_dat_import(line_count=2000000):
+    with open('example_data/ECG.dat') as dat_file:
+        lines = dat_file.readlines()
+    repeats = int(np.ceil(line_count / len(lines)))
+    with tempfile.TemporaryDirectory() as directory:
+        for name, source in [
+                ('ECG.dat', 'example_data/ECG.dat'),
+                ('{} lines'.format(line_count),
+                 os.path.join(directory, 'long.dat'))]:
+            if not os.path.exists(source):
+                with open(source, 'w') as long_file:
+                    for _ in range(repeats):
+                        long_file.writelines(lines)
+            legacy_time = _measure(_legacy_import_dat, source, repeat=1)
+            current_time = _measure(fm._import_dat, source, repeat=1)
+            _report('.dat import, ' + name, legacy_time, current_time)
+
+### file_manager._import_wave_dat ###
+
+def _legacy_import_wave_dat(file_name, wave_type):
+    x, y = _legacy_import_dat(file_name)
+    sample_rate = len(x)/(x[-1]-x[0])
+    return sm.Wave(y, sample_rate, wave_type)
+
+def _peak_memory(function, *args, **kwargs):
+    """Returns the peak memory in MiB allocated during a call."""
+    tracemalloc.start()
+    function(*args, **kwargs)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak / 2**20
+
+def benchmark_wave_import(line_count=2000000):
+    ecg_wave = fm.import_wave('example_data/ECG.dat', 'ecg')
+    repeats = int(np.ceil(line_count / len(ecg_wave)))
+    data_y = np.tile(ecg_wave.data, repeats)
+    data_x = np.arange(len(data_y)) * ecg_wave.sample_length
+    with tempfile.TemporaryDirectory() as directory:
+        source = os.path.join(directory, 'long.dat')
+        np.savetxt(source, np.column_stack((data_x, data_y)), fmt='%.5f')
+        legacy_memory = _peak_memory(_legacy_import_wave_dat, source, 'ecg')
+        current_memory = _peak_memory(fm._import_wave_dat, source, 'ecg')
+        print("{:<40} legacy {:>8.1f}MiB current {:>8.1f}MiB "
+              "samples {:>8.1f}MiB".format(
+                  'wave import peak memory', legacy_memory, current_memory,
+                  data_y.nbytes / 2**20))
+
+### Points.add_points ###
+
+def _legacy_add_points(points, new_points):
+    for x, y in zip(new_points.data_x, new_points.data_y):
+        i = np.searchsorted(points.data_x, x)
+        points.data_x = np.insert(points.data_x, i, x)
+        points.data_y = np.insert(points.data_y, i, y)
+
+def benchmark_add_points(point_count=20000):
+    r_points = fm.import_points('example_data/R.dat', 'r')
+    period = r_points.data_x[-1] + 1
+    repeats = int(np.ceil(point_count / len(r_points)))
+    data_x = np.concatenate([r_points.data_x + i*period
+                             for i in range(repeats)])
+    data_y = np.tile(r_points.data_y, repeats)
+    existing = sm.Points(data_x[::2], data_y[::2], 'r')
+    added = sm.Points(data_x[1::2], data_y[1::2], 'r')
+    legacy_time = _measure(lambda: _legacy_add_points(existing.copy(),
+                                                      added), repeat=1)
+    current_time = _measure(lambda: existing.copy().add_points(added))
+    _report('add_points, {} points'.format(len(data_x)),
+            legacy_time, current_time)
+
+### Points.move_point ###
+
+def _legacy_move_point(data_x, data_y, x1, x2, y2):
+    i = np.searchsorted(data_x, x1)
+    data_x = np.delete(data_x, i)
+    data_y = np.delete(data_y, i)
+    i = np.searchsorted(data_x, x2)
+    return np.insert(data_x, i, x2), np.insert(data_y, i, y2)
+
+def benchmark_point_dragging(point_count=100000, move_count=1000):
+    data_x = np.arange(point_count) * 0.8
+    data_y = np.ones(point_count)
+    positions = data_x[point_count//2] + np.linspace(0, 0.5, move_count)
+    def legacy_drag():
+        x, y = data_x, data_y
+        for x1, x2 in zip(positions[:-1], positions[1:]):
+            x, y = _legacy_move_point(x, y, x1, x2, 1)
+    def current_drag():
+        points = sm.Points(data_x, data_y, 'r')
+        points.data_x # chunks are only split on the first edit
+        for x1, x2 in zip(positions[:-1], positions[1:]):
+            points.move_point(x1, 1, x2, 1)
+    _report('dragging a point, {} points'.format(point_count),
+            _measure(legacy_drag, repeat=1), _measure(current_drag))
+
+### Parameter ###
+
+def _legacy_value_at(parameter, time):
+    contained_indices = []
+    for index, begin_time, end_time in zip(range(len(parameter)),
+                                           parameter.begin_times,
+                                           parameter.end_times):
+        if time >= begin_time and time <= end_time:
+            contained_indices.append(index)
+        elif time > begin_time:
+            break
+    if len(contained_indices) == 0:
+        return None
+    return np.average(parameter.values[contained_indices])
+
+def benchmark_parameter(window_count=20000, query_count=2000):
+    begin_times = np.arange(window_count) * 10.
+    end_times = begin_times + 10
+    values = np.random.random(window_count)
+    def legacy_build():
+        parameter = sm.Parameter('hr')
+        for begin_time, end_time, value in zip(begin_times, end_times,
+                                               values):
+            parameter.add_value(begin_time, end_time, value)
+    _report('parameter, {} windows'.format(window_count),
+            _measure(legacy_build, repeat=1),
+            _measure(sm.Parameter.fromArrays, 'hr', begin_times,
+                     end_times, values))
+    parameter = sm.Parameter.fromArrays('hr', begin_times, end_times,
+                                        values)
+    times = np.linspace(0, end_times[-1], query_count)
+    _report('parameter, {} queries'.format(query_count),
+            _measure(lambda: [_legacy_value_at(parameter, time)
+                              for time in times], repeat=1),
+            _measure(parameter.values_at, times))
+
+### Points.align_to_line ###
+
+def benchmark_align_to_line(point_count=100000):
+    ecg_wave = _repeated_wave('example_data/ECG.dat', 'ecg', 24)
+    data_x = np.sort(np.random.random(point_count)) * ecg_wave.complete_length
+    points = sm.Points(data_x, np.zeros(point_count), 'r')
+    _report('align_to_line, {} points'.format(point_count),
+            _measure(lambda: [ecg_wave.value_at(x) for x in data_x],
+                     repeat=1),
+            _measure(points.align_to_line, ecg_wave))
+
+### procedures/points_*_simple ###
+
+def _legacy_r_simple(waves, points, begin_time, end_time, settings):
+    wave = waves['ecg']
+    
+    sample_length = wave.sample_length
+    data = wave.data_slice(begin_time, end_time)
+    data = np.array(data)
+
+    derivative = [0] * 2
+    for i in range(2,len(data)-2):
+        derivative.append(( (1/8) * (-data[i-2]-2*data[i-1]+2*data[i+1]+data[i+2]) )**2)
+    derivative = derivative + [0] * 2
+    derivative = np.array(derivative)
+
+    window_width = 0.15/sample_length # 150 ms
+    half_window = int(window_width/2) 
+    integral = [0]  * half_window 
+    for i in range(half_window, len(derivative)-half_window):
+        integral.append(np.sum(derivative[i-half_window:i+half_window]))
+    integral = integral + [0] * half_window
+    integral = np.array(integral)
+    
+    threshold = np.max(integral[0:int(settings['threshold_period']/sample_length)]) * settings['threshold_fraction']
+    r_x = []
+    r_y = []
+    begin_i = 0
+    average_period = 0
+    i = 0
+    while i < len(integral):
+        if integral[i] > threshold:
+            if begin_i == 0:
+                begin_i = i
+        else:
+            if begin_i != 0: 
+                if len(r_x)==0 or i*sample_length > r_x[-1] + settings['safe_period'] - begin_time:
+                    hopeful_slice = data[begin_i:i]
+                    maximum_i = np.argmax(hopeful_slice)
+                    fin_i = begin_i + maximum_i
+                    r_x.append(begin_time+sample_length*(fin_i-1))
+                    r_y.append(data[fin_i])
+                    threshold = np.max(integral[fin_i:fin_i+int(settings['threshold_period']/sample_length)]) * settings['threshold_fraction']
+                    begin_i = 0
+                    if len(r_x) > 3:
+                        average_period = ( (r_x[-1]-r_x[-2]) + (r_x[-2]-r_x[-3]) + (r_x[-3]-r_x[-4]) ) / 3
+                    continue
+                else:
+                    begin_i = 0
+            if average_period!=0 and i*sample_length > r_x[-1] + average_period*1.7:
+                threshold *= 0.6
+                i = int((r_x[-1]+settings['safe_period'])/sample_length)
+        i += 1
+    r_x = np.array(r_x)
+    return r_x, r_y
+
+def _legacy_dbp_simple(waves, points, begin_time, end_time, arguments):
+    wave = waves['bp']
+    
+    sample_length = wave.sample_length
+    data = wave.data_slice(begin_time, end_time)
+    data = np.array(data)
+
+    derivative = [0] * 2
+    for i in range(2,len(data)-2):
+        derivative.append(
+            (1/8) * (-data[i-2]-2*data[i-1]+2*data[i+1]+data[i+2]))
+    derivative = derivative + [0] * 2
+    derivative = np.array(derivative)
+
+    window_width = 0.15/sample_length # 150 ms
+    half_window = int(window_width/2) 
+    integral = [0]  * half_window
+    for i in range(half_window, len(derivative)-half_window):
+        integral.append(np.sum(derivative[i-half_window:i+half_window]))
+    integral = integral + [0] * half_window
+    integral = np.array(integral)
+    
+    threshold = (
+        np.max(integral[0:int(arguments['threshold_period']/sample_length)])
+        * arguments['threshold_fraction'])
+    dbp_x = []
+    dbp_y = []
+    begin_i = 0
+    average_period = 0
+    i = 0
+    while i < len(integral):
+        if integral[i] > threshold:
+            if begin_i == 0:
+                begin_i = i
+        else:
+            if begin_i != 0: 
+                if len(dbp_x)==0 or i*sample_length > dbp_x[-1] + arguments['safe_period'] - begin_time:
+                    hopeful_slice = data[begin_i:i]
+                    maximum_i = np.argmin(hopeful_slice)
+                    fin_i = begin_i + maximum_i
+                    dbp_x.append(begin_time+sample_length*(fin_i-1))
+                    dbp_y.append(data[fin_i])
+                    threshold = np.max(integral[fin_i:fin_i+int(arguments['threshold_period']/sample_length)]) * arguments['threshold_fraction']
+                    begin_i = 0
+                    if len(dbp_x) > 3:
+                        average_period = ( (dbp_x[-1]-dbp_x[-2]) + (dbp_x[-2]-dbp_x[-3]) + (dbp_x[-3]-dbp_x[-4]) ) / 3
+                    continue
+                else:
+                    begin_i = 0
+            if average_period!=0 and i*sample_length > dbp_x[-1] + average_period*1.7:
+                threshold *= 0.6
+                i = int((dbp_x[-1]+arguments['safe_period'])/sample_length)
+        i += 1
+    dbp_x = np.array(dbp_x)
+    return dbp_x, dbp_y
+
+def _legacy_sbp_simple(waves, points, begin_time, end_time, settings):
+    wave = waves['bp']
+    
+    sample_length = wave.sample_length
+    data = wave.data_slice(begin_time, end_time)
+    data = np.array(data)
+
+    normalized_data = data - np.min(data)
+    normalized_data /= np.max(normalized_data)
+
+    threshold = np.max(normalized_data[0:int(settings['threshold_period']/sample_length)]) * settings['threshold_fraction']
+    sbp_x = []
+    sbp_y = []
+    begin_i = 0
+    average_period = 0
+    i = 0
+    while i < len(data):
+        if normalized_data[i] > threshold:
+            if begin_i == 0:
+                begin_i = i
+        else:
+            if begin_i != 0: 
+                if len(sbp_x)==0 or i*sample_length > sbp_x[-1] + settings['safe_period'] - begin_time:
+                    hopeful_slice = normalized_data[begin_i:i]
+                    maximum_i = np.argmax(hopeful_slice)
+                    fin_i = begin_i + maximum_i
+                    sbp_x.append(begin_time+sample_length*(fin_i-1))
+                    sbp_y.append(data[fin_i])
+                    threshold = np.max(normalized_data[fin_i:fin_i+int(settings['threshold_period']/sample_length)]) * settings['threshold_fraction']
+                    begin_i = 0
+                    if len(sbp_x) > 3:
+                        average_period = ( (sbp_x[-1]-sbp_x[-2]) + (sbp_x[-2]-sbp_x[-3]) + (sbp_x[-3]-sbp_x[-4]) ) / 3
+                    continue
+                else:
+                    begin_i = 0
+            if average_period!=0 and i*sample_length > sbp_x[-1] + average_period*2:
+                threshold *= 0.6
+                i = int((sbp_x[-1]+settings['safe_period'])/sample_length)
+        i += 1
+    sbp_x = np.array(sbp_x)
+    return sbp_x, sbp_y
+
+def benchmark_simple_detectors(hours=1):
+    ecg_wave = _repeated_wave('example_data/ECG.dat', 'ecg', hours)
+    bp_wave = _repeated_wave('example_data/BP.dat', 'bp', hours)
+    for procedure_name, legacy_procedure, waves in [
+            ('points_r_simple', _legacy_r_simple, {'ecg':ecg_wave}),
+            ('points_dbp_simple', _legacy_dbp_simple, {'bp':bp_wave}),
+            ('points_sbp_simple', _legacy_sbp_simple, {'bp':bp_wave})]:
+        procedure = analyzer.import_procedure(procedure_name)
+        arguments = procedure.interpret_arguments(
+            None, None, procedure.default_arguments)
+        end_time = list(waves.values())[0].complete_length
+        legacy_time = _measure(legacy_procedure, waves, None, 0,
+                               end_time, arguments, repeat=1)
+        current_time = _measure(procedure.procedure, waves, None, 0,
+                                end_time, arguments)
+        _report('{}, {} h'.format(procedure_name, hours), legacy_time,
+                current_time)
+
+### procedures/modify_median_filter ###
+
+def _legacy_median_filter(data, a):
+    data = np.array(data)
+    for i in range((a),len(data)-(a)):
+        items = data[range (i-a,i+a+1)]
+        data[i] = statistics.median(items)
+    return data
+
+def benchmark_median_filter(minutes=10, half_window=5):
+    sample_count = minutes*60*1000 # 1 kHz
+    data = np.random.random(sample_count)
+    legacy_time = _measure(_legacy_median_filter, data, half_window,
+                           repeat=1)
+    for recursive in [False, True]:
+        current_time = _measure(analyzer.moving_median, data,
+                                half_window, recursive=recursive,
+                                repeat=1)
+        _report('median filter, {} min, {}'.format(
+                    minutes, 'recursive' if recursive else 'standard'),
+                legacy_time, current_time)
+
+### procedures/modify_mean_filter ###
+
+def _legacy_mean_filter(data, a):
+    data = np.array(data)
+    mean = 0
+    for i in range(0,a):
+        mean = mean + data[i]
+        data[i] = mean / (i+1)
+    for i in range((a),len(data)-(a)-1):
+        data[i] = mean / a
+        mean = mean + data[i+1]
+        mean = mean - data[i+1-a]
+    for i in range(len(data)-(a)-1, len(data)):
+        data[i] = mean / (a)
+    return data
+
+def benchmark_mean_filter(minutes=60, width=100):
+    data = np.random.random(minutes*60*1000) # 1 kHz
+    _report('mean filter, {} min'.format(minutes),
+            _measure(_legacy_mean_filter, data, width, repeat=1),
+            _measure(analyzer.moving_mean, data, width))
+
+### procedures/points_dn_net ###
+
+def _legacy_dn_net(waves, points, begin_time, end_time, arguments):
+    ecg_line = waves['ecg']
+    bp_line = waves['bp']
+    focus_range = arguments['focus_range']
+    net = arguments['net']
+    sbp_x, sbp_y = points['sbp'].data_slice(begin_time, end_time,
+                                            left_offset=1)
+    dn_x = []
+    for helper_x in sbp_x:
+        if helper_x + focus_range[0] - net.sample_length < begin_time:
+            continue
+        if (helper_x + focus_range[1] - net.detection_point_offset
+                + net.sample_length > end_time):
+            break
+        max_val = -1
+        max_x = 0
+        for test_x in np.arange(helper_x + focus_range[0],
+                                helper_x + focus_range[1],
+                                arguments['test_every']):
+            slice_begin = test_x - net.detection_point_offset
+            slice_end = slice_begin + net.sample_length
+            input_data = []
+            for line in [bp_line, ecg_line]:
+                data = line.data_slice(
+                    slice_begin, slice_end,
+                    value_count=int(net.input_point_count/2))
+                data -= np.min(data)
+                data /= np.max(data)
+                input_data.append(data*2-1)
+            val = net.forward(np.concatenate(input_data))[0][0]
+            if val > max_val:
+                max_val = val
+                max_x = test_x
+        dn_x.append(max_x)
+    dn_x = np.array(dn_x)
+    return dn_x, bp_line.values_at(dn_x)
+
+def benchmark_dn_net(minutes=10):
+    hours = minutes/60
+    waves = {'ecg':_repeated_wave('example_data/ECG.dat', 'ecg', hours),
+             'bp':_repeated_wave('example_data/BP.dat', 'bp', hours)}
+    end_time = waves['bp'].complete_length
+    sbp_procedure = analyzer.import_procedure('points_sbp_simple')
+    points = {'sbp':analyzer.find_points(
+        waves, None, 0, end_time, sbp_procedure,
+        sbp_procedure.default_arguments)}
+    procedure = analyzer.import_procedure('points_dn_net')
+    arguments = dict(procedure.default_arguments)
+    arguments['net'] = '../' + arguments['net']
+    arguments = procedure.interpret_arguments(waves, points, arguments)
+    legacy_time = _measure(_legacy_dn_net, waves, points, 0, end_time,
+                           arguments, repeat=1)
+    current_time = _measure(procedure.procedure, waves, points, 0,
+                            end_time, arguments)
+    _report('points_dn_net, {} min'.format(minutes), legacy_time,
+            current_time)
+
+### procedures/modify_signal_calibration ###
+
+def _legacy_calibration(data, a, b):
+    for i in range(0,len(data)):
+        data[i] = a*data[i]+b
+    return data
+
+def benchmark_calibration(sample_count=10000000):
+    wave = sm.Wave(np.random.random(sample_count), 1000, 'bp')
+    procedure = analyzer.import_procedure('modify_signal_calibration')
+    arguments = {'a':'2', 'b':'1'}
+    legacy_time = _measure(_legacy_calibration, wave.data, 2.0, 1.0,
+                           repeat=1)
+    current_time = _measure(analyzer.modify_wave_in_place, wave, None, 0,
+                            wave.complete_length, procedure, arguments)
+    _report('calibration, {} samples'.format(sample_count), legacy_time,
+            current_time)
+
+### sigman.BeatIndex ###
+
+def _legacy_max_after_r(waves, points, begin_time, end_time, settings):
+    wave = waves['Signal']
+    R = points['R']
+    t = settings['Time after R [%]']/100
+    blank = settings['Blind spot [%]']/100
+    r_x = []
+    r_y = []
+    for i in range(0,len(R)-1):
+        okres= (R.data_x[i+1]-R.data_x[i])
+        data = wave.data_slice(R.data_x[i]+blank*okres, okres*t+R.data_x[i])
+        if (len(data)>0):
+            data_max = max(data);
+            itemindex = np.where(data==data_max)[0]
+            r_y.append(data_max)
+            r_x.append(R.data_x[i] + itemindex[0]*wave.sample_length+blank*okres)
+    return r_x, r_y
+
+def benchmark_beat_index(hours=1):
+    wave = _repeated_wave('example_data/ECG.dat', 'ecg', hours)
+    r_procedure = analyzer.import_procedure('points_r_simple')
+    r = analyzer.find_points({'ecg':wave}, None, 0, wave.complete_length,
+                             r_procedure, r_procedure.default_arguments)
+    procedure = analyzer.import_procedure('points_max_after_r')
+    arguments = procedure.interpret_arguments(
+        None, None, procedure.default_arguments)
+    waves = {'Signal':wave}
+    points = {'R':r}
+    legacy_time = _measure(_legacy_max_after_r, waves, points, 0,
+                           wave.complete_length, arguments, repeat=1)
+    current_time = _measure(procedure.procedure, waves, points, 0,
+                            wave.complete_length, arguments)
+    _report('points_max_after_r, {} h'.format(hours), legacy_time,
+            current_time)
+
+### procedures/points_mean_value_in_cardiac_cycle ###
+
+def _legacy_mean_value_in_cardiac_cycle(waves, points, begin_time,
+                                        end_time, settings):
+    def mean(data):
+        sum = 0
+        if (len(data)> 0):
+            for i in range(0,len(data)):
+                sum = sum + data[i]
+            return sum / len(data)
+        else:
+            return 0
+    wave = waves['Signal']
+    R = points['R']
+    r_x = []
+    r_y = []
+    for i in range(0,len(R) - 1):
+        if (R.data_x[i]>begin_time and R.data_x[i + 1] < end_time):
+            data = wave.data_slice(R.data_x[i], R.data_x[i + 1])
+            r_y.append(mean(data))
+            r_x.append(R.data_x[i])
+    return r_x, r_y
+
+def benchmark_mean_value_in_cardiac_cycle(hours=1):
+    wave = _repeated_wave('example_data/ECG.dat', 'ecg', hours)
+    r_procedure = analyzer.import_procedure('points_r_simple')
+    r = analyzer.find_points({'ecg':wave}, None, 0, wave.complete_length,
+                             r_procedure, r_procedure.default_arguments)
+    procedure = analyzer.import_procedure(
+        'points_mean_value_in_cardiac_cycle')
+    waves = {'Signal':wave}
+    points = {'R':r}
+    legacy_time = _measure(_legacy_mean_value_in_cardiac_cycle, waves,
+                           points, 0, wave.complete_length, {}, repeat=1)
+    current_time = _measure(procedure.procedure, waves, points, 0,
+                            wave.complete_length, {'Statistic':'mean'})
+    _report('points_mean_value_in_cardiac_cycle, {} h'.format(hours),
+            legacy_time, current_time)
+
+### procedures/points_aritmetic ###
+
+def _legacy_aritmetic(a, b, operation):
+    r_x = []
+    r_y = []
+    for i in range(0,min(len(a), len(b))-1):
+        if (operation== '+'):
+            y = a.data_y[i]+b.data_y[i]
+        if (operation== '/'):
+            if (b.data_y[i] != 0):
+                y = a.data_y[i]/b.data_y[i]
+            else:
+                y = 0
+        r_x.append(a.data_x[i])
+        r_y.append(y)
+    return r_x, r_y
+
+def benchmark_points_expression(point_count=100000):
+    x = np.cumsum(np.random.uniform(0.6, 1, point_count))
+    a = sm.Points(x, np.random.random(point_count), 'a')
+    b = sm.Points(x+0.05, np.random.random(point_count), 'b')
+    legacy_time = _measure(_legacy_aritmetic, a, b, '/', repeat=1)
+    current_time = _measure(analyzer.evaluate_points_expression, 'a / b',
+                            {'a':a, 'b':b}, tolerance=0.3)
+    _report('points a / b, {} points'.format(point_count), legacy_time,
+            current_time)
+
+### procedures/modify_adaptive_filter ###
+
+def _legacy_reference_signal(signalLength, sampleNumber):
+    H = int(np.floor(signalLength/2)-1)
+    p = np.sqrt (H)
+    x = np.matrix(np.zeros(H*2))
+    for i in range (1,H*2+1):
+        if (np.mod(i,2)== 0):
+            x[0,i-1] = (1/p)*np.cos(2*3.14*((i-1)*sampleNumber/signalLength))
+        else:
+            x[0,i-1] = (1/p)*np.sin(2*3.14*((i)*sampleNumber/signalLength))
+    return x
+
+def _legacy_adaptive_filter(wave, R, begin_time, end_time, u):
+    data = wave.data_slice(begin_time, end_time)
+    SR = np.floor(wave.sample_rate)
+    N = int((R.data_x[1]-begin_time)*SR)
+    X = []
+    W = []
+    result = np.array(np.zeros(len(data)))
+    result[0:N] = data[0:N]
+    for j in range (0,(len(R.data_x)-1)):
+        a = data[int(( R.data_x[j]*SR)):int(np.floor(R.data_x[j+1]*SR))]
+        H = int(np.floor(len(a)/2)-1)
+        for i in range(0,len(a)):
+            if (i >= len (W)):
+                x = _legacy_reference_signal (len(a), i+1)
+                X.append(x)
+                w = ((a[i]*x.T)/(x*x.T)).T
+                W.append(w)
+            else:
+                x = X[i][0,0:(2*H)]
+                w = W[i][0,0:(2*H)]
+            if (N  >= len(data)):
+                 break
+            # Indexing the 1x1 matrix is needed with recent NumPy
+            result[N] = (x*w.T)[0,0]
+            errorEstimate = a[i] - result[N]
+            newW = W[i]
+            newW[0,0:(2*H)]= w + ((2*u*errorEstimate)*x)
+            W[i] = newW
+            N = N + 1
+    result [N:len(data)] = data [N:len(data)]
+    return result
+
+def benchmark_adaptive_filter(minutes=3):
+    sample_rate = 200
+    cycle = np.concatenate((np.sin(np.linspace(0, np.pi, 60))**2,
+                            -0.2*np.sin(np.linspace(0, np.pi, 100))))
+    cycle_count = int(minutes*60*sample_rate / len(cycle))
+    data = (np.tile(cycle, cycle_count)
+            + np.random.normal(scale=0.2, size=cycle_count*len(cycle)))
+    wave = sm.Wave(data, sample_rate, 'icg')
+    r = sm.Points(np.arange(cycle_count)*len(cycle)/sample_rate,
+                  np.zeros(cycle_count), 'r')
+    procedure = analyzer.import_procedure('modify_adaptive_filter')
+    legacy_time = _measure(_legacy_adaptive_filter, wave, r, 0,
+                           wave.complete_length, 0.05, repeat=1)
+    current_time = _measure(procedure.procedure, wave, {'R':r}, 0,
+                            wave.complete_length, {'u':0.05})
+    _report('adaptive filter, {} min'.format(minutes), legacy_time,
+            current_time)
+
+### analyzer.import_procedures ###
+
+def _legacy_import_procedures(package_prefix='procedures.'):
+    procedure_list = []
+    for path in analyzer.list_procedures():
+        module_name = package_prefix+analyzer._get_module_from_path(path)
+        spec = importlib.util.spec_from_file_location(module_name, path)
+        procedure = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(procedure)
+        procedure_list.append(procedure)
+    return procedure_list
+
+def benchmark_import_procedures():
+    legacy_time = _measure(_legacy_import_procedures)
+    analyzer.clear_procedure_cache()
+    current_time = _measure(analyzer.import_procedures)
+    _report("import_procedures", legacy_time, current_time)
+
+### analyzer.find_points_parallel ###
+
+def benchmark_find_points_parallel(hours=2):
+    # Compared with `find_points`, which runs in a single process
+    for procedure_name, file_name, wave_type in [
+            ('points_r_simple', 'example_data/ECG.dat', 'ecg'),
+            ('points_dbp_simple', 'example_data/BP.dat', 'bp'),
+            ('points_sbp_simple', 'example_data/BP.dat', 'bp')]:
+        procedure = analyzer.import_procedure(procedure_name)
+        wave = _repeated_wave(file_name, wave_type, hours)
+        waves = {wave_type:wave}
+        serial_time = _measure(
+            analyzer.find_points, waves, None, 0, wave.complete_length,
+            procedure, procedure.default_arguments, repeat=1)
+        parallel_time = _measure(
+            analyzer.find_points_parallel, waves, None, 0,
+            wave.complete_length, procedure, procedure.default_arguments,
+            repeat=1)
+        _report("find_points_parallel " + procedure_name, serial_time,
+                parallel_time)
+
+### analyzer.calculate_parameter ###
+
+def _legacy_calculate_parameter(waves, points, time_tuples, procedure,
+                                arguments):
+    parameter = sm.Parameter(procedure.output_type)
+    for begin_time, end_time in time_tuples:
+        value = procedure.execute(waves, points, begin_time, end_time,
+                                  arguments)
+        parameter.add_value(begin_time, end_time, value)
+    return parameter
+
+def benchmark_calculate_parameter(hours=24):
+    # Heart rate in one minute windows every 10 seconds
+    procedure = analyzer.import_procedure('parameter_heart_rate')
+    period = 0.8
+    r = sm.Points(period*np.arange(int(hours*3600/period)),
+                  np.ones(int(hours*3600/period)), 'r')
+    points = {'r':r}
+    windows = analyzer.generate_windows(0, hours*3600, 60, step=10)
+    legacy_time = _measure(_legacy_calculate_parameter, None, points,
+                           windows, procedure, {}, repeat=1)
+    current_time = _measure(analyzer.calculate_parameter, None, points,
+                            windows, procedure, {})
+    _report("calculate_parameter", legacy_time, current_time)
+
+### analyzer.Result_cache ###
+
+def benchmark_result_cache(hours=1):
+    # Compared with running the procedure again, a cache hit costs
+    # hashing the wave
+    procedure = analyzer.import_procedure('points_r_simple')
+    wave = _repeated_wave('example_data/ECG.dat', 'ecg', hours)
+    waves = {'ecg':wave}
+    arguments = procedure.default_arguments
+    with tempfile.TemporaryDirectory() as directory:
+        cache = analyzer.Result_cache(directory)
+        analyzer.find_points(waves, None, 0, wave.complete_length,
+                             procedure, arguments, cache=cache)
+        uncached_time = _measure(
+            analyzer.find_points, waves, None, 0, wave.complete_length,
+            procedure, arguments)
+        cached_time = _measure(
+            analyzer.find_points, waves, None, 0, wave.complete_length,
+            procedure, arguments, cache=cache)
+    _report("find_points with Result_cache", uncached_time, cached_time)
+
+if __name__ == '__main__':
+    benchmark_coordinate_tables()
+    benchmark_dat_import()
+    benchmark_wave_import()
+    benchmark_add_points()
+    benchmark_point_dragging()
+    benchmark_parameter()
+    benchmark_align_to_line()
+    benchmark_simple_detectors()
+    benchmark_median_filter()
+    benchmark_mean_filter()
+    benchmark_dn_net()
+    benchmark_calibration()
+    benchmark_beat_index()
+    benchmark_mean_value_in_cardiac_cycle()
+    benchmark_points_expression()
+    benchmark_adaptive_filter()
+    benchmark_import_procedures()
+    benchmark_find_points_parallel()
+    benchmark_calculate_parameter()
+    benchmark_result_cache()
@@ -10,8 +10,12 @@ os.chdir(_script_directory)
 sys.path.append(_sigman_root_directory)
 import pytest
 
+import numpy as np
+
+import sigman as sm
 from sigman import file_manager as fm
 from sigman import analyzer
+from sigman import pipeline
 
 @pytest.fixture
 def messy_ecg_wave():
@@ -57,3 +61,411 @@ def test_full_analysis(messy_ecg_wave, filter_procedure, r_points_procedure,
     heart_rate = hr_procedure(points, 0, filtered_wave.complete_length)
     print(heart_rate.values[0])
     assert heart_rate.values[0] > 50 and heart_rate.values[0] < 200
+
+@pytest.mark.parametrize('procedure_name, wave_file, wave_type, reference', [
+    ('points_r_simple', 'ECG.dat', 'ecg', 'ECG_R_simple.dat'),
+    ('points_dbp_simple', 'BP.dat', 'bp', 'BP_DBP_simple.dat'),
+    ('points_sbp_simple', 'BP.dat', 'bp', 'BP_SBP_simple.dat')])
+def test_simple_detector_reference(procedure_name, wave_file, wave_type,
+                                   reference):
+    # Reference files hold points found by the original loop-based
+    # implementations of the procedures
+    procedure = analyzer.import_procedure(procedure_name)
+    wave = fm.import_wave('example_data/' + wave_file, wave_type)
+    reference = fm.import_points('example_data/' + reference, wave_type)
+    points = analyzer.find_points({wave_type:wave}, [], 0,
+                                  wave.complete_length, procedure,
+                                  procedure.default_arguments)
+    assert np.array_equal(points.data_x, reference.data_x)
+    assert np.array_equal(points.data_y, reference.data_y)
+
+@pytest.mark.parametrize('procedure_name, wave_file, wave_type', [
+    ('points_r_simple', 'ECG.dat', 'ecg'),
+    ('points_dbp_simple', 'BP.dat', 'bp'),
+    ('points_sbp_simple', 'BP.dat', 'bp')])
+def test_find_points_parallel(procedure_name, wave_file, wave_type):
+    procedure = analyzer.import_procedure(procedure_name)
+    wave = fm.import_wave('example_data/' + wave_file, wave_type)
+    waves = {wave_type:wave}
+    serial = analyzer.find_points(waves, [], 0, wave.complete_length,
+                                  procedure, procedure.default_arguments)
+    parallel = analyzer.find_points_parallel(
+        waves, [], 0, wave.complete_length, procedure,
+        procedure.default_arguments, chunk_length=30, max_workers=2)
+    assert len(parallel) == len(serial)
+    assert np.allclose(parallel.data_x, serial.data_x, rtol=0, atol=1e-9)
+    assert np.array_equal(parallel.data_y, serial.data_y)
+
+def test_generate_windows():
+    windows = analyzer.generate_windows(0, 10, 4)
+    assert windows.tolist() == [[0, 4], [4, 8]]
+    windows = analyzer.generate_windows(1, 10, 4, step=2.5)
+    assert windows.tolist() == [[1, 5], [3.5, 7.5], [6, 10]]
+    assert len(analyzer.generate_windows(0, 3, 4)) == 0
+
+def test_calculate_parameter_windows(monkeypatch):
+    procedure = analyzer.import_procedure('parameter_heart_rate')
+    points = {'r':fm.import_points('example_data/ECG_R_simple.dat', 'r')}
+    windows = analyzer.generate_windows(0, 400, 10, step=0.5)
+    expected = [procedure.execute(None, points, begin_time, end_time, {})
+                for begin_time, end_time in windows]
+    vectorized = analyzer.calculate_parameter(None, points, windows,
+                                              procedure, {})
+    assert np.allclose(vectorized.values, expected, rtol=1e-12)
+    assert np.array_equal(vectorized.begin_times, windows[:, 0])
+    # Without `procedure_vectorized` windows are calculated in batches
+    # by worker processes
+    monkeypatch.delattr(procedure, 'procedure_vectorized')
+    parallel = analyzer.calculate_parameter(None, points, windows,
+                                            procedure, {}, max_workers=2,
+                                            batch_size=100)
+    assert np.array_equal(parallel.values, expected)
+    assert np.array_equal(parallel.end_times, windows[:, 1])
+
+def test_modify_wave_in_place(messy_ecg_wave):
+    calibration = analyzer.import_procedure('modify_signal_calibration')
+    arguments = {'a':'2.5', 'b':'-1'}
+    data = messy_ecg_wave.data.copy()
+    begin_i = messy_ecg_wave.sample_at(10)
+    end_i = messy_ecg_wave.sample_at(20)
+    calibrated_wave = analyzer.modify_wave(messy_ecg_wave, None, 10, 20,
+                                           calibration, arguments)
+    assert np.array_equal(messy_ecg_wave.data, data)
+    expected = data.copy()
+    expected[begin_i:end_i] = 2.5*data[begin_i:end_i] - 1
+    assert np.allclose(calibrated_wave.data, expected[begin_i:end_i])
+    analyzer.modify_wave_in_place(messy_ecg_wave, None, 10, 20,
+                                  calibration, arguments)
+    assert np.allclose(messy_ecg_wave.data, expected)
+    # Procedures without `elementwise` replace the slice with a copy
+    mean_filter = analyzer.import_procedure('modify_mean_filter')
+    filtered_wave = analyzer.modify_wave(messy_ecg_wave, None, 10, 20,
+                                         mean_filter,
+                                         mean_filter.default_arguments)
+    analyzer.modify_wave_in_place(messy_ecg_wave, None, 10, 20,
+                                  mean_filter,
+                                  mean_filter.default_arguments)
+    assert np.array_equal(messy_ecg_wave.data[begin_i:end_i],
+                          filtered_wave.data[:end_i-begin_i])
+
+def test_modify_wave_in_place_integer():
+    # Integer values, e.g. raw samples, can't be calibrated in place
+    calibration = analyzer.import_procedure('modify_signal_calibration')
+    wave = sm.Wave(np.arange(1000, dtype=np.int16), 100, 'ecg')
+    analyzer.modify_wave_in_place(wave, None, 2, 5, calibration,
+                                  {'a':'2', 'b':'-1'})
+    expected = np.arange(1000)
+    expected[200:500] = 2*expected[200:500] - 1
+    assert wave.data.dtype == np.int16
+    assert np.array_equal(wave.data, expected)
+
+@pytest.mark.parametrize('statistic, function', [
+    ('mean', lambda data, dt: np.mean(data)),
+    ('min', lambda data, dt: np.min(data)),
+    ('max', lambda data, dt: np.max(data)),
+    ('area', lambda data, dt: (np.sum(data) - (data[0]+data[-1])/2)*dt)])
+def test_mean_value_in_cardiac_cycle(statistic, function):
+    wave = fm.import_wave('example_data/BP.dat', 'bp')
+    r = fm.import_points('example_data/R.dat', 'r')
+    procedure = analyzer.import_procedure(
+        'points_mean_value_in_cardiac_cycle')
+    points = analyzer.find_points({'Signal':wave}, {'R':r}, 0, 60,
+                                  procedure, {'Statistic':statistic})
+    expected_x = [x for x, next_x in zip(r.data_x[:-1], r.data_x[1:])
+                  if x > 0 and next_x < 60]
+    expected_y = [function(wave.data_slice(x, next_x), wave.sample_length)
+                  for x, next_x in zip(r.data_x[:-1], r.data_x[1:])
+                  if x > 0 and next_x < 60]
+    assert np.array_equal(points.data_x, expected_x)
+    assert np.allclose(points.data_y, expected_y)
+
+def test_evaluate_points_expression():
+    a = sm.Points([1, 2, 3, 4], [1, 4, 9, 0], 'a')
+    # The point at 2.5 is missing, so points must be paired by time
+    b = sm.Points([1.1, 3.05, 4.1], [2, 3, 0], 'b')
+    x, y = analyzer.evaluate_points_expression(
+        'a / b + sqrt(a)', {'a':a, 'b':b}, tolerance=0.2)
+    assert list(x) == [1, 3, 4]
+    assert np.allclose(y, [1.5, 6, 0])
+    x, y = analyzer.evaluate_points_expression(
+        'b.x - a.x', {'a':a, 'b':b}, direction='backward', reference='b')
+    assert list(x) == [1.1, 3.05, 4.1]
+    assert np.allclose(y, [0.1, 0.05, 0.1])
+    for expression in ['a.z', 'a % b', '__import__("os")', 'a(b)', '"a"']:
+        with pytest.raises(ValueError):
+            analyzer.evaluate_points_expression(expression, {'a':a, 'b':b})
+
+def test_points_arithmetic_procedures():
+    a = sm.Points([1, 2, 3], [2, 4, 6], 'a')
+    b = sm.Points([1.05, 3.2, 4], [1, 2, 0], 'b')
+    aritmetic = analyzer.import_procedure('points_aritmetic')
+    points = analyzer.find_points(None, {'a':a, 'b':b}, 0, 5, aritmetic,
+                                  {'Operation':'/', 'Tolerance':'0.25'})
+    assert list(points.data_x) == [1, 3]
+    assert list(points.data_y) == [2, 3]
+    with pytest.raises(analyzer.InvalidArgumentError):
+        aritmetic.interpret_arguments(None, None, {'Operation':'a + c'})
+    pwv = analyzer.import_procedure('points_estimate_PWV')
+    points = analyzer.find_points(None, {'a':a, 'b':b}, 0, 5, pwv,
+                                  pwv.default_arguments)
+    assert list(points.data_x) == [1, 3]
+    assert np.allclose(points.data_y, [0.15/0.05, 0.15/0.2])
+
+def _synthetic_icg(cycle_count, noise, seed=0):
+    """Returns a periodic ICG-like Wave with noise and its R points."""
+    sample_rate = 200
+    cycle = np.concatenate((np.sin(np.linspace(0, np.pi, 60))**2,
+                            -0.2*np.sin(np.linspace(0, np.pi, 100))))
+    clean = np.tile(cycle, cycle_count)
+    noisy = clean + np.random.RandomState(seed).normal(scale=noise,
+                                                       size=len(clean))
+    r_x = np.arange(cycle_count) * len(cycle) / sample_rate
+    return (sm.Wave(noisy, sample_rate, 'icg'), clean,
+            sm.Points(r_x, np.zeros(cycle_count), 'r'))
+
+def test_adaptive_filter():
+    adaptive_filter = analyzer.import_procedure('modify_adaptive_filter')
+    table = adaptive_filter.referenceTable(160)
+    assert table.shape == (160, 2*79)
+    assert table[4, 2] == (1/np.sqrt(79))*np.sin(2*3.14*(3*5/160))
+    assert table[4, 3] == (1/np.sqrt(79))*np.cos(2*3.14*(3*5/160))
+    wave, clean, r = _synthetic_icg(60, 0.2)
+    filtered = analyzer.modify_wave(wave, {'R':r}, 0, wave.complete_length,
+                                    adaptive_filter, {'u':'0.05'})
+    # After adapting for a number of cycles noise is mostly removed
+    last_cycles = slice(len(clean)-800, len(clean)-1)
+    noise = np.std(wave.data[last_cycles] - clean[last_cycles])
+    remaining_noise = np.std(filtered.data[last_cycles] - clean[last_cycles])
+    assert remaining_noise < noise/2
+
+@pytest.mark.parametrize('batch_size', [4096, 7])
+def test_dn_net_reference(batch_size):
+    # The reference file holds notches found by the original
+    # implementation, which passed tested points to the net one by one
+    waves = {'bp':fm.import_wave('example_data/BP.dat', 'bp'),
+             'ecg':fm.import_wave('example_data/ECG.dat', 'ecg')}
+    reference = fm.import_points('example_data/BP_DN_net.dat', 'dn')
+    end_time = waves['bp'].complete_length
+    find_sbp = analyzer.import_procedure('points_sbp_simple')
+    sbp = analyzer.find_points(waves, [], 0, end_time, find_sbp,
+                               find_sbp.default_arguments)
+    find_dn = analyzer.import_procedure('points_dn_net')
+    arguments = dict(find_dn.default_arguments)
+    arguments['net'] = '../' + arguments['net']
+    arguments['batch_size'] = batch_size
+    points = analyzer.find_points(waves, {'sbp':sbp}, 0, end_time,
+                                  find_dn, arguments)
+    assert np.array_equal(points.data_x, reference.data_x)
+    assert np.array_equal(points.data_y, reference.data_y)
+
+def test_dn_net_cache(tmpdir):
+    find_dn = analyzer.import_procedure('points_dn_net')
+    find_dn.clear_network_cache()
+    net = find_dn.load_network('../procedures/default_dn_net.pickle')
+    assert find_dn.load_network('../procedures/default_dn_net.pickle') is net
+    file_name = str(tmpdir.join('net.npz'))
+    find_dn.save_network(net, file_name)
+    npz_net = find_dn.load_network(file_name)
+    input_data = np.random.RandomState(0).uniform(-1, 1, size=(5, 70))
+    assert np.array_equal(net.forward(input_data),
+                          npz_net.forward(input_data))
+    # Modified files are loaded again
+    os.utime(file_name, ns=(0, 0))
+    assert find_dn.load_network(file_name) is not npz_net
+    find_dn.clear_network_cache(file_name)
+    assert find_dn.load_network(file_name) is not npz_net
+    # Paths relative to SIGMAN_ROOT are cleared like they are loaded
+    default_file = find_dn.default_arguments['net']
+    default_net = find_dn.load_network(default_file)
+    find_dn.clear_network_cache(default_file)
+    assert find_dn.load_network(default_file) is not default_net
+
+@pytest.mark.parametrize('recursive', [False, True])
+def test_moving_median(recursive):
+    data = np.random.RandomState(0).normal(size=500)
+    expected = data.copy()
+    source = expected if recursive else data
+    for i in range(3, len(data)-3):
+        expected[i] = np.median(source[i-3:i+4])
+    output = analyzer.moving_median(data, 3, recursive=recursive)
+    assert np.array_equal(output, expected)
+    assert not np.array_equal(output, data)
+
+@pytest.mark.parametrize('edges', analyzer.EDGE_MODES)
+@pytest.mark.parametrize('width', [1, 4, 7])
+def test_moving_statistics(edges, width):
+    data = np.random.RandomState(0).normal(size=50)
+    before = width // 2
+    after = width - 1 - before
+    if edges in ['nearest', 'reflect']:
+        padded = np.pad(data, (before, after),
+                        mode='edge' if edges == 'nearest' else 'symmetric')
+        windows = [padded[i:i+width] for i in range(len(data))]
+    else:
+        windows = [data[max(i-before, 0):i+after+1]
+                   for i in range(len(data))]
+        if edges == 'nan':
+            windows = [window if len(window) == width else None
+                       for window in windows]
+    for function, statistic in [
+            (analyzer.moving_sum, np.sum),
+            (analyzer.moving_mean, np.mean),
+            (analyzer.moving_var, np.var),
+            (analyzer.moving_rms, lambda x: np.sqrt(np.mean(x**2))),
+            (analyzer.moving_min, np.min),
+            (analyzer.moving_max, np.max)]:
+        expected = [np.nan if window is None else statistic(window)
+                    for window in windows]
+        assert np.allclose(function(data, width, edges=edges), expected,
+                           equal_nan=True)
+
+_PIPELINE = {
+    'steps': [
+        {'name':'filter_ecg', 'procedure':'modify_filter_butterworth',
+         'wave':'ecg', 'arguments':{'N':3, 'Wn':30}},
+        {'procedure':'points_r_simple'},
+        {'procedure':'parameter_heart_rate',
+         'windows':{'length':60, 'step':30}},
+        {'procedure':'points_sbp_simple'},
+        {'procedure':'points_dbp_simple', 'output':'diastolic'}]}
+
+def test_pipeline(monkeypatch):
+    ecg = fm.import_wave('example_data/ECG.dat', 'ecg')
+    bp = fm.import_wave('example_data/BP.dat', 'bp')
+    pipeline_ = pipeline.Pipeline(_PIPELINE)
+    assert pipeline_.dependencies == {
+        'filter_ecg':[], 'points_r_simple':['filter_ecg'],
+        'parameter_heart_rate':['points_r_simple'],
+        'points_sbp_simple':[], 'points_dbp_simple':[]}
+
+    composite_data = sm.Composite_data(waves={'ecg':ecg, 'bp':bp})
+    fingerprints = pipeline_.run(composite_data)
+    assert composite_data.waves['bp'] is bp
+    filtered = composite_data.waves['ecg']
+    butterworth = analyzer.import_procedure('modify_filter_butterworth')
+    expected = analyzer.modify_wave(
+        ecg, None, 0, ecg.complete_length, butterworth,
+        dict(butterworth.default_arguments, N=3, Wn=30))
+    # Time ranges end before the last sample
+    assert np.array_equal(filtered.data[:-1], expected.data)
+    r_simple = analyzer.import_procedure('points_r_simple')
+    r = analyzer.find_points({'ecg':filtered}, {}, 0,
+                             filtered.complete_length, r_simple,
+                             r_simple.default_arguments)
+    assert np.array_equal(composite_data.points['r'].data_x, r.data_x)
+    assert len(composite_data.parameters['hr']) == 12
+    assert 'diastolic' in composite_data.points
+
+    # Only steps whose inputs changed are run again
+    executed = []
+    execute = pipeline.Step.execute
+    def recording_execute(step, data, cache=None):
+        executed.append(step.name)
+        return execute(step, data, cache)
+    monkeypatch.setattr(pipeline.Step, 'execute', recording_execute)
+    rerun_data = sm.Composite_data(waves={'ecg':ecg, 'bp':bp})
+    assert pipeline_.run(rerun_data, composite_data,
+                         fingerprints) == fingerprints
+    assert executed == []
+    assert rerun_data.points['r'] is composite_data.points['r']
+
+    changed = dict(_PIPELINE)
+    changed['steps'] = [dict(step) for step in _PIPELINE['steps']]
+    changed['steps'][1]['arguments'] = {'safe_period':0.3}
+    rerun_data = sm.Composite_data(waves={'ecg':ecg, 'bp':bp})
+    pipeline.Pipeline(changed).run(rerun_data, composite_data,
+                                   fingerprints)
+    assert sorted(executed) == ['parameter_heart_rate', 'points_r_simple']
+
+def test_result_cache(tmp_path):
+    cache = analyzer.Result_cache(str(tmp_path), memory_size=1000)
+    cache.put('a', {'x':np.arange(100.)})
+    cache.put('b', {'x':np.arange(100.)})
+    # Only the last 800 bytes fit in memory, but all are on the disk
+    assert list(cache._memory) == ['b']
+    assert np.array_equal(cache.get('a')['x'], np.arange(100.))
+    assert cache.get('c') is None
+    # Least recently used files are removed to keep within disk_size
+    file_size = os.path.getsize(str(tmp_path / 'a.npz'))
+    cache.disk_size = 3*file_size
+    cache.put('c', {'x':np.arange(100.)})
+    cache.get('a')
+    cache.put('d', {'x':np.arange(100.)})
+    reloaded = analyzer.Result_cache(str(tmp_path))
+    assert reloaded.get('b') is None
+    for key in 'acd':
+        assert np.array_equal(reloaded.get(key)['x'], np.arange(100.))
+
+def test_find_points_cache(monkeypatch):
+    procedure = analyzer.import_procedure('points_r_simple')
+    wave = fm.import_wave('example_data/ECG.dat', 'ecg')
+    cache = analyzer.Result_cache()
+    arguments = dict(procedure.default_arguments)
+    points = analyzer.find_points({'ecg':wave}, {}, 0, 100, procedure,
+                                  arguments, cache=cache)
+    calls = []
+    execute = procedure.execute
+    def recording_execute(*args):
+        calls.append(args)
+        return execute(*args)
+    monkeypatch.setattr(procedure, 'execute', recording_execute)
+    # Arguments are compared as strings
+    arguments['safe_period'] = str(arguments['safe_period'])
+    cached = analyzer.find_points({'ecg':wave.copy()}, {}, 0, 100,
+                                  procedure, arguments, cache=cache)
+    assert calls == []
+    assert np.array_equal(cached.data_x, points.data_x)
+    assert np.array_equal(cached.data_y, points.data_y)
+    # Changed values of the wave give a different key
+    wave.data[10] += 1
+    analyzer.find_points({'ecg':wave}, {}, 0, 100, procedure, arguments,
+                         cache=cache)
+    assert len(calls) == 1
+    # Outputs of other versions of sigman are not used
+    monkeypatch.setattr(analyzer, 'library_fingerprint', lambda: 'other')
+    analyzer.find_points({'ecg':wave}, {}, 0, 100, procedure, arguments,
+                         cache=cache)
+    assert len(calls) == 2
+
+def test_lozano_b_within_beats():
+    # Late dZ/dt maxima give B points past the end of short beats
+    procedure = analyzer.import_procedure('points_B_ICG_Lozaano_Equation')
+    wave = sm.Wave(np.arange(1000.), 1000, 'icg')
+    r = sm.Points([0.1, 0.15, 0.5], [0, 0, 0], 'r')
+    dzdtmax = sm.Points([0.2, 0.3], [0, 0], 'dzdtmax')
+    points = analyzer.find_points({'Signal':wave},
+                                  {'R':r, 'dzdtmax':dzdtmax}, 0, 1,
+                                  procedure, {})
+    assert list(points.data_y) == [149, 231]
+
+def test_result_key_argument_files(tmp_path, monkeypatch):
+    waves = {'bp':fm.import_wave('example_data/BP.dat', 'bp'),
+             'ecg':fm.import_wave('example_data/ECG.dat', 'ecg')}
+    find_sbp = analyzer.import_procedure('points_sbp_simple')
+    sbp = analyzer.find_points(waves, [], 0, 60, find_sbp,
+                               find_sbp.default_arguments)
+    find_dn = analyzer.import_procedure('points_dn_net')
+    net = find_dn.load_network(find_dn.default_arguments['net'])
+    file_name = str(tmp_path / 'net.npz')
+    find_dn.save_network(net, file_name)
+    arguments = dict(find_dn.default_arguments, net=file_name)
+    cache = analyzer.Result_cache()
+    calls = []
+    execute = find_dn.execute
+    def recording_execute(*args):
+        calls.append(args)
+        return execute(*args)
+    monkeypatch.setattr(find_dn, 'execute', recording_execute)
+    for _ in range(2):
+        analyzer.find_points(waves, {'sbp':sbp}, 0, 60, find_dn,
+                             arguments, cache=cache)
+    assert len(calls) == 1
+    # A network saved under the same name gives a different key
+    biases = net.b[:-1] + [net.b[-1] + 1]
+    find_dn.save_network(find_dn.Temp_Network.fromArrays(
+        net.w, biases, net.sample_length, net.detection_point_offset),
+        file_name)
+    os.utime(file_name, ns=(0, 0))
+    analyzer.find_points(waves, {'sbp':sbp}, 0, 60, find_dn, arguments,
+                         cache=cache)
+    assert len(calls) == 2
@@ -25,3 +25,47 @@ def test_procedure_imports(procedure_item):
     proc_from_name = analyzer.import_procedure(module_name)
     proc_from_path = analyzer.import_procedure(module_path)
     assert proc_from_name.description == proc_from_path.description
+
+_TEST_PROCEDURE = """
+procedure_type = 'modify'
+description = "Test procedure"
+author = 'test'
+arguments = {{}}
+default_arguments = {{}}
+output_type = '{}'
+
+def procedure(wave, begin_time, end_time, arguments):
+    return wave.data_slice(begin_time, end_time)
+
+def execute(wave, points, begin_time, end_time, arguments):
+    return procedure(wave, begin_time, end_time, arguments)
+"""
+
+def test_procedure_cache(tmp_path):
+    module_name = 'procedures.modify_cached'
+    path = tmp_path / 'modify_cached.py'
+    path.write_text(_TEST_PROCEDURE.format('first'))
+    procedures = analyzer.import_procedures(
+        procedure_directory=str(tmp_path)+'/', safe=True)
+    assert len(procedures) == 1
+    lazy = procedures[0]
+    assert lazy.__name__ == module_name
+    assert lazy.procedure_type == 'modify'
+    assert not hasattr(lazy, 'elementwise')
+    # Metadata is read without executing the module
+    assert module_name not in sys.modules
+
+    module = analyzer.import_procedure(str(path))
+    assert sys.modules[module_name] is module
+    assert analyzer.import_procedure(
+        'modify_cached', procedure_directory=str(tmp_path)+'/') is module
+    assert lazy.execute is module.execute
+
+    # Modified files are executed again
+    path.write_text(_TEST_PROCEDURE.format('second'))
+    os.utime(path, ns=(0, 0))
+    assert analyzer.import_procedure(str(path)).output_type == 'second'
+    assert lazy.module is not module
+
+    analyzer.clear_procedure_cache()
+    del sys.modules[module_name]
@@ -72,6 +72,29 @@ def test_value_at(bp_wave, sine_wave):
     assert bp_wave.value_at(bp_wave.sample_length*200) == bp_wave[200]
     assert isclose(sine_wave.value_at(1), 0, abs_tol=0.001)
 
+def test_values_at(bp_wave, simple_wave):
+    bp_wave.offset = 3
+    times = np.linspace(3, 3+bp_wave.complete_length, 1001)[:-1]
+    values = bp_wave.values_at(times)
+    assert np.allclose(values, [bp_wave.value_at(time) for time in times])
+    with pytest.raises(ValueError):
+        bp_wave.values_at([2, 5])
+    assert list(simple_wave.values_at([-1, 0.25, 2], 'clip')) == [0, 0.5, -1]
+    values = simple_wave.values_at([-1, 1.25, 2.1], 'nan')
+    assert np.isnan(values[0]) and np.isnan(values[2])
+    assert values[1] == -0.5
+    # NaN times are outside of any waveform
+    with pytest.raises(ValueError):
+        bp_wave.values_at([5, np.nan])
+    for out_of_range in ['nan', 'clip']:
+        values = simple_wave.values_at([np.nan, 0.25], out_of_range)
+        assert np.isnan(values[0]) and values[1] == 0.5
+
+def test_points_align_to_line(simple_wave):
+    points = sm.Points([0.25, 1.25], [5, 5], 'example')
+    points.align_to_line(simple_wave)
+    assert list(points.data_y) == [0.5, -0.5]
+
 def test_import_points_dat():
     r_points = fm.import_points('example_data/R.dat', 'r')
     assert r_points[2][0] == 2.4950000000000001
@@ -80,6 +103,68 @@ def test_points_offset(r_points):
     r_points.offset(-2)
     assert r_points[2][0] == 0.4950000000000001
 
+def test_points_add_points():
+    points = sm.Points([1, 3, 5], [1, 3, 5], 'example')
+    points.add_points(sm.Points([4, 0, 2], [4, 0, 2], 'example'),
+                      begin_time=0.5)
+    assert list(points.data_x) == [0.5, 1, 2.5, 3, 4.5, 5]
+    assert list(points.data_y) == [0, 1, 2, 3, 4, 5]
+
+def test_points_batch():
+    points = sm.Points([1, 3], [1, 3], 'example')
+    with points.batch():
+        points.add_point(2, 2)
+        with points.batch():
+            points.add_points(sm.Points([4], [4], 'example'))
+        assert len(points) == 2
+        points.delete_point(4)
+        points.add_point(0, 0)
+    assert list(points.data_x) == [0, 1, 2, 3]
+    assert list(points.data_y) == [0, 1, 2, 3]
+
+def test_points_replace_slice():
+    points = sm.Points([0, 1, 2, 3], [0, 1, 2, 3], 'example')
+    points.replace_slice(1, 3, sm.Points([0.5, 1, 2.5], [5, 6, 7],
+                                         'example'))
+    assert list(points.data_x) == [0, 1.5, 2, 3]
+    assert list(points.data_y) == [0, 5, 6, 3]
+
+def test_points_editing_chunks(monkeypatch):
+    monkeypatch.setattr(sm.Points, 'chunk_size', 2)
+    points = sm.Points(np.arange(10.), np.arange(10.), 'example')
+    points.add_point(4.5, 4.5)
+    points.move_point(2, 2, 8.5, 8.5)
+    points.delete_point(np.array([7.]), y=np.array([7.]))
+    assert points[-1] == (9, 9)
+    assert points.closest_point_id(4.4, 4.6) == 4
+    assert list(points.data_slice(4, 6)[0]) == [4, 4.5, 5]
+    assert list(points.data_x) == [0, 1, 3, 4, 4.5, 5, 6, 8, 8.5, 9]
+    assert list(points.data_x) == list(points.data_y)
+    points.add_point(-1, -1)
+    assert points[0] == (-1, -1)
+
+def test_points_old_pickle_state():
+    points = sm.Points.__new__(sm.Points)
+    points.__setstate__({'data_x':np.array([1., 2.]),
+                         'data_y':np.array([3., 4.]), 'type':'r'})
+    points.add_point(1.5, 0)
+    assert list(points.data_y) == [3, 0, 4]
+    state = points.__getstate__()
+    assert sorted(state) == ['data_x', 'data_y', 'type']
+    assert list(state['data_x']) == [1, 1.5, 2]
+
+def test_points_match_points():
+    points = sm.Points([1, 2, 3, 4], [0, 0, 0, 0], 'example')
+    other = sm.Points([0.9, 2.2, 2.7, 5], [0, 0, 0, 0], 'example')
+    indices, other_indices = points.match_points(other, tolerance=0.35)
+    assert list(indices) == [0, 1, 2] and list(other_indices) == [0, 1, 2]
+    indices, other_indices = points.match_points(other, direction='forward')
+    assert list(indices) == [0, 1, 2, 3]
+    assert list(other_indices) == [1, 1, 3, 3]
+    indices, other_indices = points.match_points(other, tolerance=0.5,
+                                                 direction='backward')
+    assert list(indices) == [0, 2] and list(other_indices) == [0, 2]
+
 def test_composite_data_management(bp_wave, r_points):
     composite_data = sm.Composite_data(
         waves={
@@ -133,3 +218,174 @@ def test_wave_value_exactness(simple_values, simple_wave):
         assert true == assumed
     assert 0.5 == simple_wave.value_at(0.25)
     assert -0.5 == simple_wave.value_at(1.25)
+
+def test_generate_coordinate_tables(bp_wave):
+    x, y = bp_wave.generate_coordinate_tables(begin_time=10, end_time=20,
+                                              begin_x=10)
+    assert len(x) == len(y) == len(bp_wave.data_slice(10, 20))
+    assert x[0] == 10
+    assert isclose(x[1] - x[0], bp_wave.sample_length)
+    assert np.all(y == bp_wave.data_slice(10, 20))
+
+def test_data_slice_interpolation(bp_wave):
+    x, y = bp_wave.generate_coordinate_tables(begin_time=10, end_time=20,
+                                              begin_x=10)
+    interpolated = bp_wave.data_slice(10, 20, value_every=0.013)
+    expected = np.interp(np.arange(10, 20, 0.013), x, y)
+    assert np.allclose(interpolated, expected)
+
+def test_wave_open_mmap(bp_wave, tmp_path):
+    path = str(tmp_path / 'bp.raw')
+    bp_wave.data.astype('<f8').tofile(path)
+    mmap_wave = sm.Wave.open_mmap(path, '<f8', bp_wave.sample_rate, 'bp')
+    assert isinstance(mmap_wave.data, np.memmap)
+    assert len(mmap_wave) == len(bp_wave)
+    assert mmap_wave.value_at(65) == bp_wave.value_at(65)
+    assert mmap_wave.sample_at(200) == bp_wave.sample_at(200)
+    assert np.all(mmap_wave.data_slice(60, 70) == bp_wave.data_slice(60, 70))
+    unmodified_copy = mmap_wave.copy()
+    assert not isinstance(unmodified_copy.data, np.memmap)
+    # Waves made from mapped values copy them unless told otherwise
+    assert not np.shares_memory(
+        sm.Wave(mmap_wave.data, bp_wave.sample_rate, 'bp').data,
+        mmap_wave.data)
+    assert isinstance(sm.Wave(mmap_wave.data, bp_wave.sample_rate, 'bp',
+                              copy=False).data, np.memmap)
+    zeros = sm.Wave(np.zeros(1000), bp_wave.sample_rate, 'bp')
+    mmap_wave.replace_slice(60, 61, zeros)
+    assert mmap_wave.value_at(60.5) == 0
+    # Writes are copy-on-write and never reach the file
+    assert np.fromfile(path, '<f8')[mmap_wave.sample_at(60.5)] != 0
+    assert unmodified_copy.value_at(60.5) != 0
+    modified_copy = mmap_wave.copy()
+    assert modified_copy.value_at(60.5) == 0
+    # Values changed directly are copied as well
+    mmap_wave.data[:10] = -1
+    assert np.all(mmap_wave.copy().data[:10] == -1)
+
+def test_parameter_value_at():
+    parameter = sm.Parameter.fromArrays(
+        'hr', [10, 0, 5, 30], [20, 10, 25, 40], [70, 60, 90, 80])
+    assert list(parameter.begin_times) == [0, 5, 10, 30]
+    assert parameter.contained_in(15) == [1, 2]
+    assert parameter.value_at(15) == 80
+    assert parameter.value_at(27) is None
+    assert list(parameter.indices_in_range(24, 30)) == [1, 3]
+    times = [-1, 0, 7, 10, 27, 35]
+    values = parameter.values_at(times)
+    assert np.isnan(values[0]) and np.isnan(values[4])
+    assert list(values[[1, 2, 3, 5]]) == [60, 75, 220/3, 80]
+    parameter.add_value(26, 28, 50)
+    assert parameter.value_at(27) == 50
+    # Much longer time ranges and missing values
+    parameter = sm.Parameter.fromArrays(
+        'hr', [0, 1, 2, 3, 3, 7], [100, 1.5, 2.5, 2, 3, np.inf],
+        [1, 2, None, 4, 8, 16])
+    assert np.isnan(parameter.values[2])
+    assert parameter.contained_in(3) == [0, 4]
+    assert list(parameter.indices_in_range(1.6, 2.2)) == [0, 2]
+    values = parameter.values_at([-1, 1.2, 3, 50, 150])
+    assert np.isnan(values[0])
+    assert list(values[1:]) == [1.5, 4.5, 8.5, 16]
+    times = np.random.RandomState(0).uniform(-1, 120, 100)
+    assert np.array_equal(
+        parameter.values_at(times),
+        [np.nan if value is None else value
+         for value in map(parameter.value_at, times)], equal_nan=True)
+
+def test_beat_index():
+    wave = sm.Wave(np.random.RandomState(0).normal(size=1000), 100, 'ecg')
+    points = sm.Points([-1, 0.5, 2.25, 2.3, 6, 9.5, 12],
+                       [0, 0, 0, 0, 0, 0, 0], 'r')
+    beats = sm.BeatIndex(wave, points, begin_fraction=0.1)
+    assert list(beats.valid) == [False, True, True, True, True, False]
+    for i, (begin_time, end_time) in enumerate(
+            zip(beats.begin_times, beats.end_times)):
+        if beats.valid[i]:
+            assert np.array_equal(beats[i],
+                                  wave.data_slice(begin_time, end_time))
+        else:
+            assert len(beats[i]) == 0
+    assert np.array_equal(beats.values(), np.concatenate(list(beats)))
+    for method, function in [(beats.max, np.max), (beats.min, np.min),
+                             (beats.mean, np.mean), (beats.sum, np.sum),
+                             (beats.area, lambda beat: 0.01*(
+                                 np.sum(beat) - (beat[0]+beat[-1])/2)),
+                             (beats.argmax, np.argmax),
+                             (beats.argmin, np.argmin)]:
+        expected = [function(beat) for beat in beats if len(beat) > 0]
+        assert np.allclose(method()[beats.lengths > 0], expected)
+    assert beats.argmax()[0] == -1 and np.isnan(beats.max()[0])
+    thresholds = beats.mean()
+    crossings = beats.last_crossing(thresholds, beats.argmax(), empty=-2)
+    for i, beat in enumerate(beats):
+        below = np.flatnonzero(beat[:beats.argmax()[i]+1] <= thresholds[i])
+        assert crossings[i] == (below[-1] if len(below) > 0 else -2)
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_save_load_composite_data(bp_wave, r_points, tmp_path, compress):
+    parameter = sm.Parameter('hr')
+    parameter.add_value(0, 10, 60)
+    parameter.add_value(10, 20, 70)
+    composite_data = sm.Composite_data(
+        waves={'bp':bp_wave}, points={'r':r_points},
+        parameters={'hr':parameter})
+    path = str(tmp_path / 'project.sigman')
+    fm.save_composite_data(path, composite_data, compress=compress)
+    loaded_data = fm.load_composite_data(path)
+    loaded_wave = loaded_data.waves['bp']
+    assert isinstance(loaded_wave.data, np.memmap) != compress
+    assert loaded_wave.sample_rate == bp_wave.sample_rate
+    assert np.all(loaded_wave.data == bp_wave.data)
+    assert np.all(loaded_data.points['r'].data_x == r_points.data_x)
+    assert np.all(loaded_data.points['r'].data_y == r_points.data_y)
+    assert np.all(loaded_data.parameters['hr'].values == [60, 70])
+    read_wave = fm.load_composite_data(path, mmap=False).waves['bp']
+    assert not isinstance(read_wave.data, np.memmap)
+    assert np.all(read_wave.data == bp_wave.data)
+    # Saving over a project whose waves are mapped from it, with a
+    # longer header moving the arrays within the file
+    loaded_data.add_points(sm.Points([1, 2], [3, 4], 'sbp'),
+                           'a'*1000)
+    fm.save_composite_data(path, loaded_data)
+    assert np.all(fm.load_composite_data(path).waves['bp'].data
+                  == bp_wave.data)
+    assert isinstance(loaded_wave.data, np.memmap) != compress
+    assert np.all(loaded_wave.data == bp_wave.data)
+    assert np.all(loaded_wave.copy().data == bp_wave.data)
+    umask = os.umask(0)
+    os.umask(umask)
+    assert os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+
+def test_load_pickled_composite_data(bp_wave, tmp_path):
+    import pickle
+    path = str(tmp_path / 'project.pickle')
+    with open(path, 'wb') as pickle_file:
+        pickle.dump(sm.Composite_data(waves={'bp':bp_wave}), pickle_file)
+    loaded_data = fm.load_composite_data(path)
+    assert np.all(loaded_data.waves['bp'].data == bp_wave.data)
+
+def test_import_dat_double_spaces(tmp_path):
+    path = str(tmp_path / 'points.dat')
+    with open(path, 'w') as dat_file:
+        dat_file.write("0.5 1.5\n1.0  -2.0\n2.5 3.25\n")
+    x, y = fm._import_dat(path)
+    assert x.dtype == np.float64 and y.dtype == np.float64
+    assert list(x) == [0.5, 1.0, 2.5]
+    assert list(y) == [1.5, -2.0, 3.25]
+
+def test_import_wave_dat_chunks():
+    x, y = fm._import_dat('example_data/BP.dat')
+    bp_wave = fm._import_wave_dat('example_data/BP.dat', 'bp',
+                                  chunk_lines=1000)
+    assert np.all(bp_wave.data == y)
+    assert bp_wave.sample_rate == len(x)/(x[-1]-x[0])
+
+def test_import_wave_dat_jitter(tmp_path):
+    path = str(tmp_path / 'wave.dat')
+    with open(path, 'w') as dat_file:
+        dat_file.write("0 1\n1 2\n2 3\n5 4\n6 5\n")
+    with pytest.warns(UserWarning):
+        wave = fm._import_wave_dat(path, 'jitter', chunk_lines=2)
+    assert list(wave.data) == [1, 2, 3, 4, 5]
+    assert wave.sample_rate == 5/6